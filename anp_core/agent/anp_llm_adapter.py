@@ -6,17 +6,49 @@ import os
 import logging
 import httpx
 import asyncio
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, Tuple, Optional, Callable, List
+
+from anp_core.store.history_store import chat_history
 
 # 全局变量，用于存储最新的聊天消息
 anp_nlp_resp_messages = []
 # 事件，用于通知聊天线程有新消息
 anp_nlp_resp_new_message_event = asyncio.Event()
+# 消息监听器，例如子进程模式下把消息转发给父进程
+message_listeners: List[Callable[[Dict[str, Any], str], None]] = []
 
 # OpenRouter API配置
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")  # 用户需在环境变量中配置免费key
 
+
+def register_message_listener(callback: Callable[[Dict[str, Any], str], None]):
+    """
+    注册消息监听器，每条ANP-resp消息都会以 (message_data, did) 调用
+    
+    Args:
+        callback: 监听回调，需快速返回，不能阻塞请求
+    """
+    message_listeners.append(callback)
+
+
+def publish_resp_message(message_data: Dict[str, Any]):
+    """
+    将消息加入全局列表并通知聊天线程/MCP监听器
+    
+    Args:
+        message_data: 消息数据
+    """
+    # 添加消息到全局列表
+    anp_nlp_resp_messages.append(message_data)
+    
+    # 如果列表太长，保留最近的50条消息（原地裁剪，保持其他模块持有的引用有效）
+    if len(anp_nlp_resp_messages) > 50:
+        del anp_nlp_resp_messages[:-50]
+    
+    # 设置事件，通知聊天线程
+    anp_nlp_resp_new_message_event.set()
+
 async def request_openrouter(message: str, did: str, requestport: str = None) -> Tuple[int, Dict[str, Any]]:
     """
     向OpenRouter发送请求并处理响应
@@ -93,17 +125,24 @@ async def notify_chat_thread(message_data: Dict[str, Any], did: str):
         message_data: 消息数据
         did: 用户DID
     """
-    global anp_nlp_resp_messages, anp_nlp_resp_new_message_event
+    # 添加消息到全局列表并通知聊天线程
+    publish_resp_message(message_data)
     
-    # 添加消息到全局列表
-    anp_nlp_resp_messages.append(message_data)
-    
-    # 如果列表太长，保留最近的50条消息
-    if len(anp_nlp_resp_messages) > 50:
-        anp_nlp_resp_messages = anp_nlp_resp_messages[-50:]
+    # 通知注册的监听器
+    for listener in message_listeners:
+        try:
+            listener(message_data, did)
+        except Exception as e:
+            logging.error(f"消息监听器出错: {e}")
     
-    # 设置事件，通知聊天线程
-    anp_nlp_resp_new_message_event.set()
+    # 异步写入聊天历史（仅入队，不阻塞请求）
+    chat_history.record(
+        source="server",
+        did=did,
+        user_message=message_data.get("user_message"),
+        assistant_message=message_data.get("assistant_message"),
+        status=message_data.get("status", "success")
+    )
     
     # 在控制台显示通知
     logging.info(f"ANP-resp收到: {message_data['user_message']}")
@@ -6,16 +6,22 @@ from typing import List, Optional, Callable
 from fastapi import Request, HTTPException, Response
 from fastapi.responses import JSONResponse
 
+from core.config import get_settings
 from anp_core.auth.did_auth import handle_did_auth, get_and_validate_domain
 from anp_core.auth.token_auth import handle_bearer_auth
 
 
+# Paths exempt from authentication for reads only; writing DID documents still requires authentication
+READ_ONLY_EXEMPT_PATHS = [
+    "/wba/user/",  # Allow reading DID documents
+]
+READ_ONLY_METHODS = ("GET", "HEAD")
+
 # Define exempt paths that don't require authentication
 EXEMPT_PATHS = [
     "/docs",
     "/redoc", 
     "/openapi.json",
-    "/wba/user/",  # Allow access to DID documents
     "/",           # Allow access to root endpoint
     "/agents/example/ad.json"  # Allow access to agent description
 ]  # "/wba/test" path removed from exempt list, now requires authentication
@@ -43,7 +49,7 @@ async def verify_auth_header(request: Request) -> dict:
     # Handle DID WBA authentication
     if not auth_header.startswith("Bearer "):
         domain = get_and_validate_domain(request)
-        return await handle_did_auth(auth_header, domain)
+        return await handle_did_auth(auth_header, domain, get_settings(request))
     
     # Handle Bearer token authentication
     return await handle_bearer_auth(auth_header)
@@ -79,6 +85,12 @@ async def authenticate_request(request: Request) -> Optional[dict]:
             logging.info(f"Path {request.url.path} is exempt from authentication (matched {exempt_path})")
             return None
     
+    if request.method in READ_ONLY_METHODS:
+        for exempt_path in READ_ONLY_EXEMPT_PATHS:
+            if request.url.path.startswith(exempt_path):
+                logging.info(f"Path {request.url.path} is exempt from authentication for {request.method}")
+                return None
+    
     # 特别检查 /wba/test 路径，确保它不被视为免认证
     if request.url.path == "/wba/test":
         logging.info("Path /wba/test requires authentication (special check)")
@@ -102,8 +114,14 @@ async def auth_middleware(request: Request, call_next: Callable) -> Response:
     """
     try:
         # Add user data to request state if authenticated
-        request.state.user = await authenticate_request(request)
-        return await call_next(request)
+        user = await authenticate_request(request)
+        request.state.user = user
+        response = await call_next(request)
+        # A DID WBA request is answered directly; the issued token rides along in the
+        # Authorization response header so the client can skip a separate handshake.
+        if user and user.get("access_token"):
+            response.headers["Authorization"] = f"Bearer {user['access_token']}"
+        return response
     
     except HTTPException as exc:
         logging.error(f"Authentication error: {exc.detail}")
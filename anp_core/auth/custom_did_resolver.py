@@ -4,11 +4,15 @@
 import os
 import json
 import logging
-import aiohttp
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from urllib.parse import unquote, urlparse
 
+from core.config import settings, Settings
+from anp_core.auth.remote_resolver import remote_resolver
+from anp_core.store.did_index import get_did_index, is_local_did
+from anp_core.store.did_store import get_did_store
+
 async def resolve_local_did_document(did: str) -> Optional[Dict]:
     """
     解析本地DID文档
@@ -19,14 +23,36 @@ async def resolve_local_did_document(did: str) -> Optional[Dict]:
     Returns:
         Optional[Dict]: 解析出的DID文档，如果解析失败则返回None
     """
+    did_document, _, _ = await resolve_did_document_entry(did)
+    return did_document
+
+
+async def resolve_did_document_entry(did: str, etag: Optional[str] = None,
+                                     app_settings: Optional[Settings] = None) -> Tuple[Optional[Dict], Optional[str], bool]:
+    """
+    解析DID文档；带上已缓存文档的ETag时，对端文档未变化只返回304，不重新传输和解析文档
+    
+    Args:
+        did: DID标识符
+        etag: 已缓存文档的ETag
+        app_settings: 请求所属实例的settings，决定查找哪个本地DID存储，默认使用全局settings
+    
+    Returns:
+        Tuple[Optional[Dict], Optional[str], bool]: (DID文档, ETag, 是否未变化)；
+            未变化时文档为None，调用方继续使用缓存的文档
+    """
+    app_settings = app_settings or settings
     try:
         logging.info(f"解析本地DID文档: {did}")
         
         # 解析DID标识符
         parts = did.split(':')
-        if len(parts) < 5 or parts[0] != 'did' or parts[1] != 'wba':
+        if len(parts) < 3 or parts[0] != 'did' or parts[1] != 'wba':
             logging.error(f"无效的DID格式: {did}")
-            return None
+            return None, None, False
+        if len(parts) < 5:
+            # 没有用户路径的DID（如 did:wba:example.com）不是本地文档
+            return await remote_resolver.resolve(did, etag)
         
         # 提取主机名、端口和用户ID
         hostname = parts[2]
@@ -39,31 +65,25 @@ async def resolve_local_did_document(did: str) -> Optional[Dict]:
         
         logging.info(f"DID 解析结果 - 主机名: {hostname}, 用户ID: {user_id}")
         
-        # 查找本地文件系统中的DID文档
-        current_dir = Path(__file__).parent.parent.absolute()
-        did_path = current_dir / 'did_keys' / f"user_{user_id}" / "did.json"
-        
-        if did_path.exists():
-            logging.info(f"找到本地DID文档: {did_path}")
-            with open(did_path, 'r', encoding='utf-8') as f:
-                did_document = json.load(f)
-            return did_document
-        
-        # 如果本地未找到，尝试通过HTTP请求获取
-        http_url = f"http://{hostname}/wba/user/{user_id}/did.json"
-        logging.info(f"尝试通过HTTP获取DID文档: {http_url}")
+        # 查找本地DID文档，优先使用内存索引
+        store = get_did_store(app_settings)
+        if app_settings.DID_INDEX_ENABLED:
+            index = get_did_index(store)
+            did_document = index.get(did)
+            if did_document is None and is_local_did(did, app_settings) and not index.might_exist(user_id, record=False):
+                # 本机的DID且布隆过滤器判定不存在，HTTP回退也只会请求到自己
+                logging.info(f"本地不存在的DID: {did}")
+                return None, None, False
+        else:
+            did_document = store.get_by_did(did)
+        if did_document is not None:
+            logging.info(f"找到本地DID文档: {did}")
+            return did_document, None, False
         
-        # 这里使用异步HTTP请求
-        async with aiohttp.ClientSession() as session:
-            async with session.get(http_url, ssl=False) as response:
-                if response.status == 200:
-                    did_document = await response.json()
-                    logging.info("成功通过HTTP获取DID文档")
-                    return did_document
-                else:
-                    logging.error(f"HTTP请求失败，状态码: {response.status}")
-                    return None
+        # 本地未找到时从DID所在主机获取（超时、熔断和对冲请求见 remote_resolver）
+        logging.info(f"尝试从远程获取DID文档: {did}")
+        return await remote_resolver.resolve(did, etag)
     
     except Exception as e:
         logging.error(f"解析DID文档时出错: {e}")
-        return None
+        return None, None, False
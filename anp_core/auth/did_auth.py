@@ -2,6 +2,7 @@
 DID WBA authentication module with both client and server capabilities.
 """
 import os
+import asyncio
 import json
 import logging
 import traceback
@@ -9,27 +10,29 @@ import secrets
 import string
 import random
 import aiohttp
-from typing import Dict, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
 from fastapi import Request, HTTPException
 from canonicaljson import encode_canonical_json
 from agent_connect.authentication import (
-    verify_auth_header_signature,
-    resolve_did_wba_document,
     extract_auth_header_parts,
     create_did_wba_document,
     DIDWbaAuthHeader
 )
 
-from anp_core.auth.custom_did_resolver import resolve_local_did_document
+from anp_core.auth.custom_did_resolver import resolve_did_document_entry
+from anp_core.auth.resolved_document import resolved_documents
 
-from core.config import settings
+from core.config import settings, Settings
 from anp_core.auth.token_auth import create_access_token
-
-# 存储服务端生成的nonce
-VALID_SERVER_NONCES: Dict[str, datetime] = {}
+# nonce和DID文档缓存保存在共享存储中，多worker模式下所有进程可见
+from anp_core.store.auth_state import auth_state
+from anp_core.store.did_store import atomic_write, get_did_store
+from anp_core.store.did_versions import get_did_versions
+from anp_core.client.runtime import client_session
+from anp_core.client.local_transport import local_transport
 
 
 def generate_nonce(length: int = 16) -> str:
@@ -44,7 +47,7 @@ def generate_nonce(length: int = 16) -> str:
     """
     characters = string.ascii_letters + string.digits
     nonce = ''.join(random.choice(characters) for _ in range(length))
-    VALID_SERVER_NONCES[nonce] = datetime.now(timezone.utc)
+    auth_state.add_server_nonce(nonce)
     return nonce
 
 
@@ -58,10 +61,11 @@ def is_valid_server_nonce(nonce: str) -> bool:
     Returns:
         bool: Whether the nonce is valid
     """
-    if nonce not in VALID_SERVER_NONCES:
+    nonce_ts = auth_state.get_server_nonce_time(nonce)
+    if nonce_ts is None:
         return True
     
-    nonce_time = VALID_SERVER_NONCES[nonce]
+    nonce_time = datetime.fromtimestamp(nonce_ts, timezone.utc)
     current_time = datetime.now(timezone.utc)
     
     return current_time - nonce_time <= timedelta(minutes=settings.NONCE_EXPIRATION_MINUTES)
@@ -118,92 +122,142 @@ def get_and_validate_domain(request: Request) -> str:
     return domain
 
 
-async def handle_did_auth(authorization: str, domain: str) -> Dict:
+def parse_did_auth_header(authorization: str) -> Tuple[str, str, str, str, str]:
     """
-    Handle DID WBA authentication and return token.
+    Split a DID WBA authorization header and check its timestamp.
     
     Args:
         authorization: DID WBA authorization header
-        domain: Domain for DID WBA verification
         
     Returns:
-        Dict: Authentication result with token
+        Tuple[str, str, str, str, str]: (did, nonce, timestamp, keyid, signature)
         
     Raises:
-        HTTPException: When authentication fails
+        HTTPException: When the header is malformed or its timestamp is invalid
     """
-    try:
-        logging.info(f"Processing DID WBA authentication - domain: {domain}, Authorization header: {authorization}")
+    # Extract header parts
+    header_parts = extract_auth_header_parts(authorization)
+    
+    if not header_parts:
+        raise HTTPException(status_code=401, detail="Invalid authorization header format")
+        
+    # 解包顺序：(did, nonce, timestamp, verification_method, signature)
+    did, nonce, timestamp, keyid, signature = header_parts
+    
+    logging.info(f"Processing DID WBA authentication - DID: {did}, Key ID: {keyid}")
+    
+    # 验证时间戳
+    if not verify_timestamp(timestamp):
+        raise HTTPException(status_code=401, detail="Timestamp expired or invalid")
+        
+    # 验证 nonce 有效性
+    # if not is_valid_server_nonce(nonce):
+    #     logging.error(f"Invalid or expired nonce: {nonce}")
+    #     raise HTTPException(status_code=401, detail="Invalid or expired nonce")
+    
+    return did, nonce, timestamp, keyid, signature
+
 
-        # Extract header parts
-        header_parts = extract_auth_header_parts(authorization)
+async def resolve_did_document(did: str, app_settings: Optional[Settings] = None) -> Optional[Dict]:
+    """
+    Resolve a DID document through the shared cache.
+    
+    Args:
+        did: DID identifier
+        app_settings: Settings of the responder instance, selects the local DID store
         
-        if not header_parts:
-            raise HTTPException(status_code=401, detail="Invalid authorization header format")
-            
-        # 解包顺序：(did, nonce, timestamp, verification_method, signature)
-        did, nonce, timestamp, keyid, signature = header_parts
+    Returns:
+        Optional[Dict]: DID document, or None when it cannot be resolved
+    """
+    # 先查共享DID文档缓存，其次使用自定义解析器；缓存过期时带ETag重新确认，未变化则继续使用
+    cached = auth_state.get_did_document_entry(did)
+    if cached is not None and cached[2]:
+        return cached[0]
+    did_document, etag, not_modified = await resolve_did_document_entry(
+        did, cached[1] if cached else None, app_settings
+    )
+    if not_modified:
+        auth_state.touch_did_document(did)
+        return cached[0]
+    if did_document:
+        logging.info(f"成功解析DID文档: {did}")
+        auth_state.put_did_document(did, did_document, etag)
+    return did_document
+
+
+def verify_and_issue_token(did_document: Optional[Dict], did: str, nonce: str, timestamp: str,
+                           keyid: str, signature: str, domain: str) -> Dict:
+    """
+    Verify a parsed DID WBA header against its DID document and issue an access token.
+    
+    Args:
+        did_document: Resolved DID document, None if resolution failed
+        did, nonce, timestamp, keyid, signature: Parts returned by parse_did_auth_header
+        domain: Domain for DID WBA verification
         
-        logging.info(f"Processing DID WBA authentication - DID: {did}, Key ID: {keyid}")
+    Returns:
+        Dict: Authentication result with token
         
-        # 验证时间戳
-        if not verify_timestamp(timestamp):
-            raise HTTPException(status_code=401, detail="Timestamp expired or invalid")
-            
-        # 验证 nonce 有效性
-        # if not is_valid_server_nonce(nonce):
-        #     logging.error(f"Invalid or expired nonce: {nonce}")
-        #     raise HTTPException(status_code=401, detail="Invalid or expired nonce")
+    Raises:
+        HTTPException: When authentication fails
+    """
+    if not did_document:
+        raise HTTPException(status_code=401, detail="Failed to resolve DID document")
+    
+    # 验证签名：验证方法的公钥在文档首次使用时解析一次，之后按keyid直接查找
+    try:
+        is_valid, message = resolved_documents.get(did, did_document).verify(
+            did, nonce, timestamp, keyid, signature, domain
+        )
         
-        # 尝试使用自定义解析器解析DID文档
-        did_document = await resolve_local_did_document(did)
+        logging.info(f"签名验证结果: {is_valid}, 消息: {message}")
         
-        # 如果自定义解析器失败，尝试使用标准解析器
-        if not did_document:
-            logging.info(f"本地DID解析失败，尝试使用标准解析器 for DID: {did}")
-            try:
-                did_document = await resolve_did_wba_document(did)
-            except Exception as e:
-                logging.error(f"标准DID解析器也失败: {e}")
-                did_document = None
+        if not is_valid:
+            raise HTTPException(status_code=401, detail=f"Invalid signature: {message}")
+    except Exception as e:
+        logging.error(f"验证签名时出错: {e}")
+        raise HTTPException(status_code=401, detail=f"Error verifying signature: {str(e)}")
         
-        if not did_document:
-            raise HTTPException(status_code=401, detail="Failed to resolve DID document")
-            
-        logging.info(f"成功解析DID文档: {did}")
+    # 防重放：签名有效的请求头在有效期内只能使用一次（跨worker生效）
+    if settings.NONCE_REPLAY_CHECK and not auth_state.consume_nonce(nonce):
+        logging.error(f"Nonce already used: {nonce}")
+        raise HTTPException(status_code=401, detail="Nonce already used")
         
-        # 验证签名
-        try:
-            # 重新构造完整的授权头
-            full_auth_header = authorization
-            
-            # 调用验证函数
-            is_valid, message = verify_auth_header_signature(
-                auth_header=full_auth_header,
-                did_document=did_document,
-                service_domain=domain
-            )
-            
-            logging.info(f"签名验证结果: {is_valid}, 消息: {message}")
-            
-            if not is_valid:
-                raise HTTPException(status_code=401, detail=f"Invalid signature: {message}")
-        except Exception as e:
-            logging.error(f"验证签名时出错: {e}")
-            raise HTTPException(status_code=401, detail=f"Error verifying signature: {str(e)}")
-            
-        # 生成访问令牌
-        access_token = create_access_token(
-            data={"sub": did, "keyid": keyid}
-        )
+    # 生成访问令牌
+    access_token = create_access_token(
+        data={"sub": did, "keyid": keyid}
+    )
+    
+    logging.info(f"认证成功，已生成访问令牌")
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "did": did
+    }
+
+
+async def handle_did_auth(authorization: str, domain: str, app_settings: Optional[Settings] = None) -> Dict:
+    """
+    Handle DID WBA authentication and return token.
+    
+    Args:
+        authorization: DID WBA authorization header
+        domain: Domain for DID WBA verification
+        app_settings: Settings of the responder instance, selects the local DID store
         
-        logging.info(f"认证成功，已生成访问令牌")
+    Returns:
+        Dict: Authentication result with token
         
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "did": did
-        }
+    Raises:
+        HTTPException: When authentication fails
+    """
+    try:
+        logging.info(f"Processing DID WBA authentication - domain: {domain}, Authorization header: {authorization}")
+
+        header_parts = parse_did_auth_header(authorization)
+        did_document = await resolve_did_document(header_parts[0], app_settings)
+        return verify_and_issue_token(did_document, *header_parts, domain)
         
     except HTTPException:
         raise
@@ -213,6 +267,87 @@ async def handle_did_auth(authorization: str, domain: str) -> Dict:
         raise HTTPException(status_code=500, detail="Authentication error")
 
 
+def _batch_error(e: Exception) -> Dict:
+    """Per-item result for a failed header or DID in a batch"""
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "detail": e.detail}
+    logging.error(f"Error during batch DID authentication: {e}")
+    return {"status": 500, "detail": "Authentication error"}
+
+
+async def resolve_did_documents(dids: List[str], app_settings: Optional[Settings] = None) -> Dict[str, Optional[Dict]]:
+    """
+    Resolve several DID documents concurrently, each distinct DID once.
+    
+    At most DID_BATCH_CONCURRENCY resolutions run at a time, so a batch of distinct remote DIDs
+    costs roughly its slowest resolution rather than the sum.
+    
+    Args:
+        dids: DID identifiers, duplicates allowed
+        app_settings: Settings of the responder instance, selects the local DID store
+        
+    Returns:
+        Dict[str, Optional[Dict]]: DID document (None if unresolved) for each distinct DID
+    """
+    unique = list(dict.fromkeys(dids))
+    semaphore = asyncio.Semaphore(max(settings.DID_BATCH_CONCURRENCY, 1))
+
+    async def resolve(did: str) -> Optional[Dict]:
+        async with semaphore:
+            try:
+                return await resolve_did_document(did, app_settings)
+            except Exception as e:
+                logging.error(f"解析DID文档时出错 ({did}): {e}")
+                return None
+
+    documents = await asyncio.gather(*(resolve(did) for did in unique))
+    return dict(zip(unique, documents))
+
+
+async def handle_did_auth_batch(authorizations: List[str], domain: str,
+                                app_settings: Optional[Settings] = None) -> List[Dict]:
+    """
+    Authenticate several DID WBA authorization headers in one call.
+    
+    Headers are parsed first, the distinct DIDs they name are resolved concurrently, and the
+    signatures are then verified and tokens issued in a worker thread. A failing header does not
+    fail the batch: each result carries its own status (200 with the token, or the error status
+    and detail handle_did_auth would have raised).
+    
+    Args:
+        authorizations: DID WBA authorization headers
+        domain: Domain for DID WBA verification
+        app_settings: Settings of the responder instance, selects the local DID store
+        
+    Returns:
+        List[Dict]: Per-header results in request order
+    """
+    parsed = []
+    for authorization in authorizations:
+        try:
+            parsed.append(parse_did_auth_header(authorization))
+        except Exception as e:
+            parsed.append(e)
+    documents = await resolve_did_documents(
+        [parts[0] for parts in parsed if isinstance(parts, tuple)], app_settings
+    )
+
+    def verify_all() -> List[Dict]:
+        results = []
+        for parts in parsed:
+            if not isinstance(parts, tuple):
+                results.append(_batch_error(parts))
+                continue
+            try:
+                results.append({"status": 200, **verify_and_issue_token(documents[parts[0]], *parts, domain)})
+            except Exception as e:
+                results.append(_batch_error(e))
+        return results
+
+    # 签名验证和签发令牌都是CPU密集操作，放到线程池中执行，不阻塞事件循环
+    return await asyncio.to_thread(verify_all)
+
+
 # 客户端相关功能
 async def generate_or_load_did(unique_id: str = None) -> Tuple[Dict, Dict, str]:
     """
@@ -226,18 +361,33 @@ async def generate_or_load_did(unique_id: str = None) -> Tuple[Dict, Dict, str]:
     """
     if not unique_id:
         unique_id = secrets.token_hex(8)
+    # 读写文件和生成密钥都是阻塞操作，放到线程池中执行，不阻塞事件循环
+    return await asyncio.to_thread(load_or_create_did, unique_id)
+
+
+def load_or_create_did(unique_id: str) -> Tuple[Dict, Dict, str]:
+    """
+    generate_or_load_did 的同步实现，供身份注册表在线程池中调用
     
+    Args:
+        unique_id: 用户唯一标识符
+    
+    Returns:
+        Tuple[Dict, Dict, str]: 包含DID文档、密钥和DID路径
+    """
+    store = get_did_store()
+    # 同一用户的并发首次创建只生成一套密钥
+    with store.user_lock(unique_id):
+        return _load_or_create_locked(store, unique_id)
+
+
+def _load_or_create_locked(store, unique_id: str) -> Tuple[Dict, Dict, str]:
     # 检查是否已经有DID文档
-    current_dir = Path(__file__).parent.parent.absolute()
-    user_dir = current_dir / settings.DID_DOCUMENTS_PATH / f"user_{unique_id}"
-    did_path = user_dir / settings.DID_DOCUMENT_FILENAME
+    user_dir = store.user_dir(unique_id)
+    did_document = store.get(unique_id)
     
-    if did_path.exists():
-        logging.info(f"Loading existing DID document from {did_path}")
-        
-        # 加载DID文档
-        with open(did_path, 'r', encoding='utf-8') as f:
-            did_document = json.load(f)
+    if did_document is not None:
+        logging.info(f"Loaded existing DID document from {store.location(unique_id)}")
         
         # 创建空的keys字典，因为我们已经有了私钥文件
         keys = {}
@@ -260,20 +410,19 @@ async def generate_or_load_did(unique_id: str = None) -> Tuple[Dict, Dict, str]:
     # 保存私钥
     for method_fragment, (private_key_bytes, _) in keys.items():
         private_key_path = user_dir / f"{method_fragment}_private.pem"
-        with open(private_key_path, 'wb') as f:
-            f.write(private_key_bytes)
+        atomic_write(private_key_path, private_key_bytes, store.fsync, mode=0o600)
         logging.info(f"Saved private key '{method_fragment}' to {private_key_path}")
     
-    # 保存DID文档
-    with open(did_path, 'w', encoding='utf-8') as f:
-        json.dump(did_document, f, indent=2)
-    logging.info(f"Saved DID document to {did_path}")
+    # 保存DID文档，记为版本1
+    get_did_versions(store).put(unique_id, did_document)
+    logging.info(f"Saved DID document to {store.location(unique_id)}")
     
     return did_document, keys, str(user_dir)
 
 
 async def send_authenticated_request(target_url: str, auth_client: DIDWbaAuthHeader, method: str = "GET", 
-                                     json_data: Optional[Dict] = None) -> Tuple[int, Dict[str, Any], Optional[str]]:
+                                     json_data: Optional[Dict] = None,
+                                     force_new: bool = False) -> Tuple[int, Dict[str, Any], Optional[str]]:
     """
     发送带有DID WBA认证的请求
     
@@ -282,17 +431,28 @@ async def send_authenticated_request(target_url: str, auth_client: DIDWbaAuthHea
         auth_client: DID WBA认证客户端
         method: HTTP方法
         json_data: 可选的JSON数据
+        force_new: 是否忽略auth_client中缓存的令牌和请求头，重新签名DID请求头
         
     Returns:
         Tuple[int, Dict[str, Any], Optional[str]]: 状态码、响应和令牌
     """
     try:
         # 获取认证头
-        auth_headers = auth_client.get_auth_header(target_url)
+        auth_headers = auth_client.get_auth_header(target_url, force_new=force_new)
 
         logging.info(f"Sending authenticated request to {target_url} with headers: {auth_headers}")
+
+        if method.upper() in ("GET", "POST") and local_transport.is_local(target_url):
+            # 目标是本进程的响应端，跳过TCP直接分派给应用
+            status, response_data, response_headers = await local_transport.request(
+                method, target_url, auth_headers, json_data
+            )
+            token = auth_client.update_token(target_url, response_headers)
+            if not token and method.upper() == "GET":
+                token = auth_client.update_token(target_url, response_data)
+            return status, response_data, token
         
-        async with aiohttp.ClientSession() as session:
+        async with client_session(target_url) as session:
             if method.upper() == "GET":
                 async with session.get(
                     target_url,
@@ -300,9 +460,9 @@ async def send_authenticated_request(target_url: str, auth_client: DIDWbaAuthHea
                 ) as response:
                     status = response.status
                     response_data = await response.json() if status == 200 else {}
-                    # x = dict(response.headers)
-                    # token = auth_client.update_token(target_url, dict(response.headers))
-                    token = auth_client.update_token(target_url, response_data )
+                    # 令牌优先从Authorization响应头读取，旧版服务端只在/wba/test的响应体中返回
+                    token = auth_client.update_token(target_url, response.headers) or \
+                        auth_client.update_token(target_url, response_data)
                     return status, response_data, token
             elif method.upper() == "POST":
                 async with session.post(
@@ -312,7 +472,7 @@ async def send_authenticated_request(target_url: str, auth_client: DIDWbaAuthHea
                 ) as response:
                     status = response.status
                     response_data = await response.json() if status == 200 else {}
-                    token = auth_client.update_token(target_url, dict(response.headers))
+                    token = auth_client.update_token(target_url, response.headers)
                     return status, response_data, token
             else:
                 logging.error(f"Unsupported HTTP method: {method}")
@@ -323,7 +483,7 @@ async def send_authenticated_request(target_url: str, auth_client: DIDWbaAuthHea
 
 
 async def send_request_with_token(target_url: str, token: str, method: str = "GET",
-                                  json_data: Optional[Dict] = None) -> Tuple[int, Dict[str, Any]]:
+                                  json_data: Optional[Dict] = None, did: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
     """
     使用已获取的令牌发送请求
     
@@ -332,18 +492,22 @@ async def send_request_with_token(target_url: str, token: str, method: str = "GE
         token: 访问令牌
         method: HTTP方法
         json_data: 可选的JSON数据
+        did: 发送方DID，放入DID请求头
         
     Returns:
         Tuple[int, Dict[str, Any]]: 状态码和响应
     """
     try:
-        did = os.environ.get("did-id")
         headers = {
             "Authorization": f"Bearer {token}",
             "DID": f"{did}"
         }
 
-        async with aiohttp.ClientSession() as session:
+        if method.upper() in ("GET", "POST") and local_transport.is_local(target_url):
+            status, response_data, _ = await local_transport.request(method, target_url, headers, json_data)
+            return status, response_data
+
+        async with client_session(target_url) as session:
             if method.upper() == "GET":
                 async with session.get(
                     target_url,
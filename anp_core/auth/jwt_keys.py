@@ -4,7 +4,11 @@ JWT configuration module providing functions to get JWT public and private keys.
 
 import os
 import logging
+from functools import lru_cache
 from typing import Optional
+
+from cryptography.hazmat.primitives import serialization
+
 from core.config import settings
 
 # Ensure key files exist
@@ -60,3 +64,47 @@ def get_jwt_public_key(key_path: str = settings.JWT_PUBLIC_KEY_PATH) -> Optional
     except Exception as e:
         logging.error(f"Error reading public key file: {e}")
         return None
+
+
+@lru_cache(maxsize=4)
+def _load_key_object(key_path: str, mtime: float, private: bool):
+    """Parse a PEM key once per file version; PyJWT would otherwise re-parse it on every call."""
+    with open(key_path, "rb") as f:
+        pem = f.read()
+    if private:
+        return serialization.load_pem_private_key(pem, password=None)
+    return serialization.load_pem_public_key(pem)
+
+
+def get_jwt_signing_key(key_path: str = settings.JWT_PRIVATE_KEY_PATH):
+    """
+    Get the parsed JWT private key object, cached until the key file changes.
+
+    Args:
+        key_path: Path to the private key PEM file (default: from config)
+
+    Returns:
+        The private key object, or None if the file cannot be read
+    """
+    try:
+        return _load_key_object(key_path, os.path.getmtime(key_path), True)
+    except Exception as e:
+        logging.error(f"Error loading private key file: {e}")
+        return None
+
+
+def get_jwt_verification_key(key_path: str = settings.JWT_PUBLIC_KEY_PATH):
+    """
+    Get the parsed JWT public key object, cached until the key file changes.
+
+    Args:
+        key_path: Path to the public key PEM file (default: from config)
+
+    Returns:
+        The public key object, or None if the file cannot be read
+    """
+    try:
+        return _load_key_object(key_path, os.path.getmtime(key_path), False)
+    except Exception as e:
+        logging.error(f"Error loading public key file: {e}")
+        return None
@@ -0,0 +1,253 @@
+"""
+远程DID文档解析：按 did:wba 规则获取文档，带超时、重试、按主机熔断、对冲请求和ETag条件请求
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+import aiohttp
+from loguru import logger
+
+from core.config import settings
+from anp_core.client.runtime import client_runtime, client_session
+
+# 一次尝试需要重试（超时、连接错误、5xx）
+_RETRY = object()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def did_document_url(did: str, http_hosts: Optional[set] = None) -> str:
+    """
+    按 did:wba 规则返回DID文档的URL
+
+    Args:
+        did: 如 did:wba:example.com%3A8443:user:alice
+        http_hosts: 使用HTTP而不是HTTPS的主机名
+
+    Returns:
+        str: 如 https://example.com:8443/user/alice/did.json
+
+    Raises:
+        ValueError: DID格式无效
+    """
+    parts = did.split(":")
+    if len(parts) < 3 or parts[0] != "did" or parts[1] != "wba" or not parts[2]:
+        raise ValueError(f"无效的DID格式: {did}")
+    authority = unquote(parts[2])
+    hostname = urlsplit(f"//{authority}").hostname or ""
+    scheme = "http" if hostname in (http_hosts or set()) else "https"
+    path = "/" + "/".join(parts[3:]) + "/did.json" if len(parts) > 3 else "/.well-known/did.json"
+    return f"{scheme}://{authority}{path}"
+
+
+class HostState:
+    """一个DID主机的熔断器状态和统计"""
+
+    __slots__ = ("state", "failures", "opened_at", "probing", "latencies", "stats")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.latencies: deque = deque(maxlen=200)
+        self.stats = {
+            "requests": 0, "successes": 0, "not_modified": 0, "not_found": 0, "failures": 0,
+            "timeouts": 0, "hedges": 0, "hedge_wins": 0, "short_circuited": 0, "opened": 0
+        }
+
+    def allow(self, reset_after: float) -> bool:
+        """熔断器是否放行一次解析"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= reset_after:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.failures = 0
+        self.state = CLOSED
+        self.probing = False
+
+    def record_failure(self, threshold: int):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= threshold:
+            if self.state != OPEN:
+                self.stats["opened"] += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def percentile(self, p: float) -> Optional[float]:
+        """最近成功请求延迟的p分位数（秒），样本不足20个时返回None"""
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            **self.stats
+        }
+
+
+class RemoteDIDResolver:
+    """带超时、熔断和对冲请求的远程DID文档解析器"""
+
+    def __init__(self):
+        self.attempt_timeout = settings.DID_RESOLVER_ATTEMPT_TIMEOUT
+        self.deadline = settings.DID_RESOLVER_DEADLINE
+        self.attempts = max(settings.DID_RESOLVER_ATTEMPTS, 1)
+        self.breaker_failures = max(settings.DID_RESOLVER_BREAKER_FAILURES, 1)
+        self.breaker_reset = settings.DID_RESOLVER_BREAKER_RESET
+        self.hedge = settings.DID_RESOLVER_HEDGE
+        self.hedge_percentile = settings.DID_RESOLVER_HEDGE_PERCENTILE
+        self.hedge_delay = settings.DID_RESOLVER_HEDGE_DELAY
+        self.verify_tls = settings.DID_RESOLVER_VERIFY_TLS
+        self.http_hosts = {host.strip() for host in settings.DID_RESOLVER_HTTP_HOSTS.split(",") if host.strip()}
+        self._hosts: Dict[str, HostState] = {}
+
+    def _host(self, netloc: str) -> HostState:
+        state = self._hosts.get(netloc)
+        if state is None:
+            state = self._hosts[netloc] = HostState()
+        return state
+
+    async def resolve(self, did: str, etag: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str], bool]:
+        """
+        解析远程DID文档
+
+        Args:
+            did: DID标识符
+            etag: 已缓存文档的ETag，带上后对端可以返回304
+
+        Returns:
+            Tuple[Optional[Dict], Optional[str], bool]: (DID文档, ETag, 是否未变化)；
+                失败、不存在或熔断时为 (None, None, False)
+        """
+        if not client_runtime.in_runtime():
+            return await client_runtime.wrap(self.resolve(did, etag))
+        try:
+            url = did_document_url(did, self.http_hosts)
+        except ValueError as e:
+            logger.error(str(e))
+            return None, None, False
+        host = self._host(urlsplit(url).netloc)
+        if not host.allow(self.breaker_reset):
+            host.stats["short_circuited"] += 1
+            logger.warning(f"DID主机熔断中，跳过解析: {did}")
+            return None, None, False
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        for _ in range(self.attempts):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            result = await self._attempt(url, did, etag, host, min(self.attempt_timeout, remaining))
+            if result is not _RETRY:
+                return result
+            if host.state == OPEN:
+                break
+        # 半开状态的探测请求没有得到结果时，释放探测名额
+        host.probing = False
+        return None, None, False
+
+    async def _attempt(self, url: str, did: str, etag: Optional[str], host: HostState, timeout: float):
+        """一次尝试，超过该主机延迟分位数仍未返回时并行发出对冲请求"""
+        primary = asyncio.create_task(self._fetch(url, did, etag, host, timeout))
+        hedged = None
+        pending = {primary}
+        try:
+            delay = host.percentile(self.hedge_percentile) or self.hedge_delay
+            if self.hedge and delay < timeout:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if done:
+                    return primary.result()
+                host.stats["hedges"] += 1
+                hedged = asyncio.create_task(self._fetch(url, did, etag, host, timeout - delay))
+                pending = {primary, hedged}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not _RETRY:
+                        if task is hedged:
+                            host.stats["hedge_wins"] += 1
+                        return result
+            return _RETRY
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fetch(self, url: str, did: str, etag: Optional[str], host: HostState, timeout: float):
+        headers = {"Accept": "application/json"}
+        if etag:
+            headers["If-None-Match"] = etag
+        host.stats["requests"] += 1
+        began = time.perf_counter()
+        try:
+            async with client_session(url) as session:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout),
+                                       ssl=None if self.verify_tls else False) as response:
+                    if response.status >= 500:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    if response.status == 304:
+                        host.record_success(time.perf_counter() - began)
+                        host.stats["not_modified"] += 1
+                        return None, etag, True
+                    if response.status != 200:
+                        # 主机正常响应，文档不存在或拒绝访问，不重试
+                        host.record_success(time.perf_counter() - began)
+                        host.stats["not_found"] += 1
+                        logger.warning(f"获取DID文档失败，状态码 {response.status}: {url}")
+                        return None, None, False
+                    did_document = await response.json(content_type=None)
+                    response_etag = response.headers.get("ETag")
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            host.stats["timeouts"] += 1
+            host.stats["failures"] += 1
+            host.record_failure(self.breaker_failures)
+            logger.warning(f"获取DID文档超时 ({timeout:.2f}s): {url}")
+            return _RETRY
+        except (aiohttp.ClientError, OSError, ValueError) as e:
+            host.stats["failures"] += 1
+            host.record_failure(self.breaker_failures)
+            logger.warning(f"获取DID文档出错: {url}: {e}")
+            return _RETRY
+
+        host.record_success(time.perf_counter() - began)
+        actual = did_document.get("id") if isinstance(did_document, dict) else None
+        if actual != did:
+            host.stats["not_found"] += 1
+            logger.error(f"DID文档id不匹配: 期望 {did}，实际 {actual}")
+            return None, None, False
+        host.stats["successes"] += 1
+        return did_document, response_etag, False
+
+    def stats(self) -> Dict[str, Any]:
+        """按主机返回解析统计"""
+        return {netloc: state.to_dict() for netloc, state in self._hosts.items()}
+
+
+# 全局单例
+remote_resolver = RemoteDIDResolver()
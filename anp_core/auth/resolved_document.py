@@ -0,0 +1,171 @@
+"""
+已解析的DID文档：验证方法的公钥只解析一次并按DID缓存，用于验证DID WBA请求头签名
+"""
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+import jcs
+from agent_connect.authentication.verification_methods import (
+    EcdsaSecp256k1VerificationKey2019,
+    VerificationMethod,
+    create_verification_method
+)
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, utils
+
+from core.config import settings
+
+
+class ResolvedDIDDocument:
+    """一个DID文档及其已解析的验证方法"""
+
+    __slots__ = ("did", "document", "keys", "errors", "authentication")
+
+    def __init__(self, document: Dict[str, Any]):
+        self.did: str = document.get("id") or ""
+        self.document = document
+        self.keys: Dict[str, VerificationMethod] = {}
+        # 无法解析的验证方法及原因，验证时原样报告
+        self.errors: Dict[str, str] = {}
+        methods = [method for method in document.get("verificationMethod", []) if isinstance(method, dict)]
+        authentication = set()
+        for entry in document.get("authentication", []):
+            if isinstance(entry, str):
+                authentication.add(entry)
+            elif isinstance(entry, dict) and entry.get("id"):
+                authentication.add(entry["id"])
+                methods.append(entry)
+        self.authentication: FrozenSet[str] = frozenset(authentication)
+        for method in methods:
+            method_id = method.get("id")
+            if not method_id or method_id in self.keys or method_id in self.errors:
+                continue
+            try:
+                self.keys[method_id] = create_verification_method(method)
+            except Exception as e:
+                self.errors[method_id] = f"Invalid or unsupported verification method: {e}"
+
+    def verify(self, did: str, nonce: str, timestamp: str, keyid: str, signature: str,
+               service_domain: str) -> Tuple[bool, str]:
+        """
+        验证DID WBA认证头的签名，结果与 verify_auth_header_signature 一致，
+        但接受 agent_connect 0.3.7 生成的不足64字节的secp256k1签名（见 verify_unpadded_secp256k1）
+
+        Args:
+            did: 认证头中的DID
+            nonce: 认证头中的nonce
+            timestamp: 认证头中的时间戳
+            keyid: 认证头中的验证方法片段（如 key-1）
+            signature: 认证头中的签名
+            service_domain: 服务域名
+
+        Returns:
+            Tuple[bool, str]: 是否通过及说明
+        """
+        if self.did.lower() != did.lower():
+            return False, "DID mismatch"
+        method_id = f"{did}#{keyid}"
+        verifier = self.keys.get(method_id)
+        if verifier is None:
+            return False, self.errors.get(method_id, "Verification method not found")
+        if settings.DID_AUTH_REQUIRE_AUTHENTICATION and method_id not in self.authentication:
+            return False, "Verification method is not authorized for authentication"
+        content_hash = hashlib.sha256(jcs.canonicalize({
+            "nonce": nonce,
+            "timestamp": timestamp,
+            "service": service_domain,
+            "did": did
+        })).digest()
+        try:
+            if isinstance(verifier, EcdsaSecp256k1VerificationKey2019):
+                signature_bytes = base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))
+                if len(signature_bytes) < 64:
+                    if verify_unpadded_secp256k1(verifier.public_key, content_hash, signature_bytes):
+                        return True, "Verification successful"
+                    return False, "Signature verification failed"
+            if verifier.verify_signature(content_hash, signature):
+                return True, "Verification successful"
+            return False, "Signature verification failed"
+        except Exception as e:
+            return False, f"Verification error: {e}"
+
+
+def verify_unpadded_secp256k1(public_key: ec.EllipticCurvePublicKey, content: bytes, signature_bytes: bytes) -> bool:
+    """
+    验证去掉了前导零字节的 R|S 签名
+
+    agent_connect 0.3.7 的 encode_signature 按最小长度编码 r 和 s，r 或 s 小于 2^248 时
+    （约0.8%的签名）签名不足64字节，而 verify_signature 按长度对半拆分，这些签名总是验证失败。
+    这里依次尝试每种 r、s 各不超过32字节的拆分。
+
+    Args:
+        public_key: secp256k1公钥
+        content: 被签名的内容
+        signature_bytes: 不足64字节的 R|S 签名
+
+    Returns:
+        bool: 是否有一种拆分通过验证
+    """
+    for r_length in range(max(len(signature_bytes) - 32, 1), min(len(signature_bytes), 33)):
+        r = int.from_bytes(signature_bytes[:r_length], 'big')
+        s = int.from_bytes(signature_bytes[r_length:], 'big')
+        try:
+            public_key.verify(utils.encode_dss_signature(r, s), content, ec.ECDSA(hashes.SHA256()))
+            return True
+        except InvalidSignature:
+            continue
+    return False
+
+
+class ResolvedDocumentCache:
+    """按DID缓存 ResolvedDIDDocument，文档内容变化时重新转换"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max(max_entries or settings.DID_RESOLVED_CACHE_SIZE, 1)
+        self._entries: "OrderedDict[str, ResolvedDIDDocument]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "builds": 0}
+
+    def get(self, did: str, document: Dict[str, Any]) -> ResolvedDIDDocument:
+        """
+        返回DID文档的已解析表示
+
+        Args:
+            did: DID标识符
+            document: 当前的DID文档（来自共享缓存、本地索引或远程解析）
+
+        Returns:
+            ResolvedDIDDocument: 与该文档内容一致的已解析表示
+        """
+        resolved = self._entries.get(did)
+        # 本地索引返回同一个对象；共享缓存每次反序列化出新字典，内容相同即可复用
+        if resolved is not None and (resolved.document is document or resolved.document == document):
+            with self._lock:
+                if did in self._entries:
+                    self._entries.move_to_end(did)
+            self._stats["hits"] += 1
+            return resolved
+        resolved = ResolvedDIDDocument(document)
+        self._stats["builds"] += 1
+        with self._lock:
+            self._entries[did] = resolved
+            self._entries.move_to_end(did)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return resolved
+
+    def invalidate(self, did: str):
+        """丢弃DID的缓存条目"""
+        with self._lock:
+            self._entries.pop(did, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, **self._stats}
+
+
+# 全局单例
+resolved_documents = ResolvedDocumentCache()
@@ -8,7 +8,7 @@ import jwt
 from fastapi import HTTPException
 
 from core.config import settings
-from anp_core.auth.jwt_keys import get_jwt_public_key, get_jwt_private_key
+from anp_core.auth.jwt_keys import get_jwt_signing_key, get_jwt_verification_key
 
 
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -27,7 +27,7 @@ def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expires})
     
     # Get private key for signing
-    private_key = get_jwt_private_key()
+    private_key = get_jwt_signing_key()
     if not private_key:
         logging.error("Failed to load JWT private key")
         raise HTTPException(status_code=500, detail="Internal server error during token generation")
@@ -60,7 +60,7 @@ async def handle_bearer_auth(token: str) -> Dict:
             token = token[7:]
         
         # Get public key for verification
-        public_key = get_jwt_public_key()
+        public_key = get_jwt_verification_key()
         if not public_key:
             logging.error("Failed to load JWT public key")
             raise HTTPException(status_code=500, detail="Internal server error during token verification")
@@ -6,12 +6,14 @@ import os
 import logging
 import asyncio
 import secrets
+import itertools
+import json
 import httpx
-import time
-import threading
+import aiohttp
 
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from urllib.parse import quote
+from typing import Dict, Any, AsyncIterator, Optional, Tuple, List, Callable
 
 from loguru import logger
 
@@ -22,6 +24,12 @@ from anp_core.auth.did_auth import (
     send_request_with_token,
     DIDWbaAuthHeader
 )
+from anp_core.store.history_store import chat_history
+from anp_core.store.state_store import shared_state
+from anp_core.client.identity_registry import identity_registry
+from anp_core.client.runtime import client_runtime, client_session
+from anp_core.client.token_manager import token_manager, origin_of
+from anp_core.client.unix_sockets import uds_resolver
 
 # 全局变量，用于存储最新的聊天消息
 client_chat_messages = []
@@ -30,7 +38,9 @@ client_new_message_event = asyncio.Event()
 
 # 客户端状态全局变量
 connector_running = False
-connector_thread = None
+connector_future = None
+# 最近一次认证成功的本地身份，ANP_req_chat 未指定身份时使用
+current_identity = None
 
 # 初始化日志
 logger.add("logs/did_client.log", rotation="1000 MB", retention="7 days", encoding="utf-8")
@@ -53,28 +63,416 @@ async def ANP_req_notify_chat_thread(message_data):
     client_new_message_event.set()
 
 
-async def ANP_req_chat(base_url: str, token: str, msg: str, from_chat: bool = False, silent: bool = False):
+class ChatMicroBatcher:
+    """把短时间内发往同一目标的聊天消息合并为一次 /wba/anp-nlp/batch 请求
+
+    消息按 (本地身份, 目标origin) 分组，窗口（CHAT_BATCH_WINDOW_MS）到期或攒满
+    CHAT_BATCH_MAX_SIZE 条时发送，结果按顺序分发给每个调用方的future。
+    窗口内只有一条消息时仍走 /wba/anp-nlp；目标不支持批量接口（404/405）时退化为逐条并发发送。
+    """
+
+    def __init__(self, window_ms: Optional[float] = None, max_size: Optional[int] = None):
+        self.window_ms = settings.CHAT_BATCH_WINDOW_MS if window_ms is None else window_ms
+        self.max_size = max(settings.CHAT_BATCH_MAX_SIZE if max_size is None else max_size, 1)
+        self._pending: Dict[Tuple[str, str], list] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._unsupported = set()
+        self._stats = {"messages": 0, "batches": 0, "single": 0, "largest": 0, "fallbacks": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    async def send(self, identity: str, base_url: str, msg: str) -> Tuple[int, Dict[str, Any]]:
+        """
+        把消息加入当前批次并等待它自己的应答
+
+        Args:
+            identity: 本地身份
+            base_url: 服务器基础URL
+            msg: 要发送的消息
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: 该消息的状态码和响应
+        """
+        if not client_runtime.in_runtime():
+            return await client_runtime.wrap(self.send(identity, base_url, msg))
+        loop = asyncio.get_running_loop()
+        key = (identity, origin_of(base_url))
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((msg, future))
+        self._stats["messages"] += 1
+        if len(batch) >= self.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window_ms / 1000, self._flush, key)
+        return await future
+
+    def _flush(self, key: Tuple[str, str]):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            asyncio.get_running_loop().create_task(self._dispatch(key, batch))
+
+    async def _send_each(self, identity: str, origin: str, messages: list) -> list:
+        return await asyncio.gather(*(
+            token_manager.request(identity, f"{origin}/wba/anp-nlp", "POST", {"message": msg}) for msg in messages
+        ))
+
+    async def _dispatch(self, key: Tuple[str, str], batch: list):
+        identity, origin = key
+        messages = [msg for msg, _ in batch]
+        try:
+            if len(batch) == 1 or origin in self._unsupported:
+                self._stats["single"] += len(batch)
+                results = await self._send_each(identity, origin, messages)
+            else:
+                self._stats["batches"] += 1
+                self._stats["largest"] = max(self._stats["largest"], len(batch))
+                status, response = await token_manager.request(
+                    identity, f"{origin}/wba/anp-nlp/batch", "POST", {"messages": messages}
+                )
+                if status == 200:
+                    results = [(item.pop("status", 200), item) for item in response.get("results", [])]
+                elif status in (404, 405):
+                    logger.warning(f"{origin} 不支持批量接口，改为逐条发送")
+                    self._unsupported.add(origin)
+                    self._stats["fallbacks"] += 1
+                    results = await self._send_each(identity, origin, messages)
+                else:
+                    results = [(status, response)] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            for _, future in batch[len(results):]:
+                if not future.done():
+                    future.set_result((500, {"error": "批量响应缺少结果"}))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回批处理统计信息"""
+        return {"enabled": self.enabled, "window_ms": self.window_ms, "max_size": self.max_size, **self._stats}
+
+
+# 全局单例
+chat_batcher = ChatMicroBatcher()
+
+
+class AgentChannel:
+    """到一个目标的WebSocket多路复用通道（/wba/ws）
+
+    连接时认证一次（有缓存令牌时用Bearer，否则用DID WBA签名头，服务端在welcome帧中返回令牌），
+    之后所有请求按关联id在同一连接上并发收发。在途请求数不超过服务端给出的 max_inflight；
+    超过心跳间隔3倍时间没有收到任何帧视为连接失效，所有等待中的请求以 ConnectionError 结束。
+    """
+
+    def __init__(self, identity: str, origin: str):
+        self.identity = identity
+        self.origin = origin
+        self.url = origin.replace("http", "ws", 1) + "/wba/ws"
+        self.push_handlers: List[Callable[[str, Dict[str, Any]], Any]] = []
+        self._ws = None
+        self._reader: Optional[asyncio.Task] = None
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._idle_timeout = 60.0
+        self._connect_lock = asyncio.Lock()
+        self._stats = {"connects": 0, "requests": 0, "pushes": 0, "pings": 0}
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    async def _open(self, authorization: str):
+        session = await client_runtime.get_session(uds_resolver.socket_for(self.url))
+        ws = await session.ws_connect(self.url, headers={"Authorization": authorization})
+        welcome = await ws.receive_json(timeout=10)
+        if welcome.get("type") != "welcome":
+            await ws.close()
+            return None, welcome
+        return ws, welcome
+
+    async def connect(self):
+        """建立连接并完成认证，已连接时直接返回"""
+        if self.connected:
+            return
+        async with self._connect_lock:
+            if self.connected:
+                return
+            ws, welcome = None, {}
+            token = token_manager.peek(self.identity, self.origin)
+            if token:
+                ws, welcome = await self._open(f"Bearer {token}")
+            if ws is None:
+                # 没有令牌或令牌已失效：用DID WBA签名头认证，令牌随welcome帧返回
+                identity = await identity_registry.get(self.identity)
+                authorization = identity.auth_header.get_auth_header(self.origin, force_new=True)["Authorization"]
+                ws, welcome = await self._open(authorization)
+            if ws is None:
+                raise ConnectionError(f"WebSocket通道认证失败: {welcome.get('detail')}")
+            if welcome.get("access_token"):
+                token_manager.store(self.identity, self.origin, welcome["access_token"], welcome.get("did"))
+            self._ws = ws
+            self._inflight = asyncio.Semaphore(max(int(welcome.get("max_inflight") or 1), 1))
+            self._idle_timeout = float(welcome.get("heartbeat_interval") or 20) * 3
+            self._reader = asyncio.get_running_loop().create_task(self._read_loop(ws))
+            self._stats["connects"] += 1
+            logger.info(f"WebSocket通道已连接: {self.identity} -> {self.url}")
+
+    async def _read_loop(self, ws):
+        try:
+            while True:
+                msg = await ws.receive(timeout=self._idle_timeout)
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                frame = json.loads(msg.data)
+                frame_type = frame.get("type")
+                if frame_type == "response":
+                    future = self._futures.pop(frame.get("id"), None)
+                    if future and not future.done():
+                        future.set_result((frame.get("status"), frame.get("result") or {}))
+                elif frame_type == "ping":
+                    self._stats["pings"] += 1
+                    await ws.send_json({"type": "pong", "ts": frame.get("ts")})
+                elif frame_type == "push":
+                    self._stats["pushes"] += 1
+                    for handler in self.push_handlers:
+                        try:
+                            result = handler(frame.get("event"), frame.get("data") or {})
+                            if asyncio.iscoroutine(result):
+                                await result
+                        except Exception as e:
+                            logger.error(f"推送处理出错: {e}")
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket通道 {self.url} 心跳超时")
+        except Exception as e:
+            logger.warning(f"WebSocket通道 {self.url} 读取出错: {e}")
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            await ws.close()
+            futures, self._futures = self._futures, {}
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("WebSocket通道已关闭"))
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        在通道上发送一个请求并等待对应的响应
+
+        Args:
+            method: 服务端方法名，如 chat、test
+            params: 请求参数
+            timeout: 超时时间（秒）
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: 状态码和结果
+        """
+        if not client_runtime.in_runtime():
+            return await client_runtime.wrap(self.request(method, params, timeout))
+        await self.connect()
+        async with self._inflight:
+            request_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self._futures[request_id] = future
+            self._stats["requests"] += 1
+            try:
+                await self._ws.send_json({"type": "request", "id": request_id, "method": method, "params": params or {}})
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                self._futures.pop(request_id, None)
+
+    async def close(self):
+        """关闭通道"""
+        ws = self._ws
+        self._ws = None
+        if ws is not None:
+            await ws.close()
+        if self._reader:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"connected": self.connected, "inflight": len(self._futures), **self._stats}
+
+
+# 按 (本地身份, 目标origin) 复用的WebSocket通道
+agent_channels: Dict[Tuple[str, str], AgentChannel] = {}
+
+
+async def get_agent_channel(identity: str, base_url: str) -> AgentChannel:
+    """
+    获取（必要时创建并连接）到目标的WebSocket通道
+
+    Args:
+        identity: 本地身份
+        base_url: 服务器基础URL
+
+    Returns:
+        AgentChannel: 已连接的通道
+    """
+    if not client_runtime.in_runtime():
+        return await client_runtime.wrap(get_agent_channel(identity, base_url))
+    key = (identity, origin_of(base_url))
+    channel = agent_channels.get(key)
+    if channel is None:
+        channel = agent_channels[key] = AgentChannel(*key)
+    await channel.connect()
+    return channel
+
+
+async def send_inbox_message(identity: str, base_url: str, did: str, data: Dict[str, Any],
+                             event: str = "message") -> Tuple[int, Dict[str, Any]]:
+    """
+    向目标服务器上另一个DID的收件箱投递消息
+
+    Args:
+        identity: 发送方本地身份
+        base_url: 服务器基础URL
+        did: 接收方DID
+        data: 消息内容
+        event: 事件名
+
+    Returns:
+        Tuple[int, Dict[str, Any]]: 状态码和响应（包含事件id）
+    """
+    # DID中的 %3A 需要再编码一次，否则路由参数解码后与接收方的DID不一致
+    url = f"{origin_of(base_url)}/wba/inbox/{quote(did, safe=':')}"
+    return await token_manager.request(identity, url, method="POST", json_data={"event": event, "data": data})
+
+
+async def inbox_stream(identity: str, base_url: str, last_event_id: Optional[int] = None,
+                       retry_delay: float = 3.0) -> AsyncIterator[Dict[str, Any]]:
+    """
+    以SSE订阅自己在目标服务器上的收件箱，断线后用 Last-Event-ID 自动续读
+
+    Args:
+        identity: 本地身份
+        base_url: 服务器基础URL
+        last_event_id: 从该事件之后开始读取，默认从收件箱中最早的事件开始
+        retry_delay: 断线后的重连间隔（秒），服务端的 retry 字段优先
+
+    Yields:
+        Dict[str, Any]: 事件，包含 id、event 和 data
+    """
+    origin = origin_of(base_url)
+    while True:
+        token = await token_manager.get_token(identity, origin)
+        if not token:
+            raise ConnectionError("收件箱订阅认证失败")
+        headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream"}
+        if last_event_id:
+            headers["Last-Event-ID"] = str(last_event_id)
+        try:
+            async with client_session(origin) as session:
+                async with session.get(f"{origin}/wba/inbox", headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=None, sock_read=None)) as response:
+                    if response.status == 401:
+                        token_manager.invalidate(identity, origin)
+                        continue
+                    if response.status != 200:
+                        raise ConnectionError(f"收件箱订阅失败: {response.status}")
+                    event = {}
+                    async for raw_line in response.content:
+                        line = raw_line.decode("utf-8").rstrip("\r\n")
+                        if not line:
+                            if "data" in event:
+                                if event.get("id"):
+                                    last_event_id = int(event["id"])
+                                payload = json.loads(event["data"])
+                                yield {"id": last_event_id, "event": event.get("event", "message"),
+                                       "data": payload.get("data", payload)}
+                            event = {}
+                        elif line.startswith(":"):
+                            continue
+                        else:
+                            field, _, value = line.partition(":")
+                            value = value[1:] if value.startswith(" ") else value
+                            if field == "retry" and value.isdigit():
+                                retry_delay = int(value) / 1000
+                            elif field in ("id", "event", "data"):
+                                event[field] = value
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"收件箱连接断开，{retry_delay}秒后续读: {e}")
+        await asyncio.sleep(retry_delay)
+
+
+async def poll_inbox(identity: str, base_url: str, last_event_id: int = 0,
+                     timeout: float = 25.0) -> Tuple[int, Dict[str, Any]]:
+    """
+    长轮询收件箱（SSE不可用时的退路）
+
+    Returns:
+        Tuple[int, Dict[str, Any]]: 状态码和响应，响应中的 last_event_id 用于下一次轮询
+    """
+    url = f"{origin_of(base_url)}/wba/inbox/poll?last_event_id={last_event_id}&timeout={timeout}"
+    return await token_manager.request(identity, url)
+
+
+def get_default_identity(unique_id: str = None) -> str:
+    """返回要使用的本地身份：指定的身份、最近一次认证的身份，都没有时创建新身份"""
+    global current_identity
+    if unique_id:
+        return unique_id
+    if not current_identity:
+        current_identity = secrets.token_hex(8)
+    return current_identity
+
+
+async def _send_chat(identity: Optional[str], base_url: str, token: Optional[str], msg: str) -> Tuple[int, Dict[str, Any]]:
+    """按配置的传输方式发送一条聊天消息，返回状态码和响应"""
+    anp_nlp_url = f"{base_url}/wba/anp-nlp"
+    if not identity:
+        return await send_request_with_token(anp_nlp_url, token, method="POST", json_data={"message": msg})
+    if settings.CHAT_TRANSPORT == "ws":
+        # 复用到目标的WebSocket通道，连接失败时退回HTTP
+        try:
+            channel = await get_agent_channel(identity, base_url)
+            return await channel.request("chat", {"message": msg})
+        except (ConnectionError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"WebSocket通道不可用，改用HTTP: {e}")
+    if chat_batcher.enabled:
+        # 与窗口内发往同一目标的其他消息合并为一次批量请求
+        return await chat_batcher.send(identity, base_url, msg)
+    # 令牌管理器负责过期前刷新，遇到401时重新认证并重试
+    return await token_manager.request(identity, anp_nlp_url, method="POST", json_data={"message": msg})
+
+
+async def ANP_req_chat(base_url: str, token: str, msg: str, from_chat: bool = False, silent: bool = False,
+                       unique_id: str = None):
     """向聊天接口发送消息并处理响应
     
     Args:
         base_url: 服务器基础URL
-        token: 认证令牌
+        token: 认证令牌，已知本地身份时由令牌管理器获取和刷新，可为None
         msg: 要发送的消息
         from_chat: 是否来自聊天线程调用
         silent: 是否抑制日志输出
+        unique_id: 本地身份，为空时使用最近一次认证的身份
         
     Returns:
         Tuple[bool, dict]: 发送状态和响应数据
     """
-    anp_nlp_url = f"{base_url}/wba/anp-nlp"
-    token = os.environ.get('did-token', token)
+    # 只有令牌、没有身份时直接使用令牌；既没有身份也没有令牌时创建新身份，首个请求携带DID签名完成认证
+    identity = unique_id or current_identity or (None if token else get_default_identity())
     logging.info("发送消息到聊天接口")
     try:
-        chat_status, chat_response = await send_request_with_token(
-            anp_nlp_url, 
-            token, 
-            method="POST", 
-            json_data={"message": msg}
+        chat_status, chat_response = await _send_chat(identity, base_url, token, msg)
+        # 异步写入聊天历史（仅入队，不阻塞请求）
+        chat_history.record(
+            source="client",
+            did=token_manager.get_did(identity) if identity else None,
+            peer=base_url,
+            user_message=msg,
+            assistant_message=chat_response.get('answer') if isinstance(chat_response, dict) else None,
+            status="success" if chat_status == 200 else "error"
         )
         if chat_status == 200:
             logging.info(f"消息发送成功! 回复: {chat_response}")
@@ -115,29 +513,25 @@ async def ANP_req_chat(base_url: str, token: str, msg: str, from_chat: bool = Fa
 
 
 async def ANP_req_auth(unique_id: str = None, silent: bool = False, from_chat: bool = False, msg: str = None):
-    """执行ANP DID-WBA认证 完成DID认证和Token获取验证 存储Token为环境变量
+    """执行ANP DID-WBA认证 完成DID认证和Token获取验证 令牌保存在令牌管理器中
     Args:
         unique_id: 可选的唯一标识符
         silent: 是否抑制日志输出
         from_chat: 是否来自聊天线程调用
         msg: 可选的初始消息
+
+    Returns:
+        Optional[str]: 访问令牌，认证失败时返回None
     """
+    global current_identity
     if msg is None:
         msg = "ANP connector认证测试"
     try:
-        # 1. 生成或加载DID文档
+        # 1. 确定本地身份
         if not unique_id:
             unique_id = secrets.token_hex(8)
        
         logging.info(f"使用唯一ID: {unique_id}")
-
-        did_document, keys, user_dir = await generate_or_load_did(unique_id)
-        os.environ['did-id'] = did_document.get('id')
-        did_document_path = Path(user_dir) / settings.DID_DOCUMENT_FILENAME
-        private_key_path = Path(user_dir) / settings.PRIVATE_KEY_FILENAME
-        
-        logging.info(f"DID文档路径: {did_document_path}")
-        logging.info(f"私钥路径: {private_key_path}")
         
         # 2. 目标服务器信息
         target_host = settings.TARGET_SERVER_HOST
@@ -145,78 +539,66 @@ async def ANP_req_auth(unique_id: str = None, silent: bool = False, from_chat: b
         base_url = f"http://{target_host}:{target_port}"
         test_url = f"{base_url}/wba/test"
         
-        # 3. 创建DIDWbaAuthHeader实例
-        auth_client = DIDWbaAuthHeader(
-            did_document_path=str(did_document_path),
-            private_key_path=str(private_key_path)
-        )
-        
-        # 4. 发送带DID WBA认证的请求
+        # 3. 通过令牌管理器完成DID WBA认证：首个请求携带DID签名，令牌随响应头返回（同一身份的并发认证只握手一次）
         logging.info(f"发送认证请求到 {test_url}")
-        status, response, token = await send_authenticated_request(test_url, auth_client)
-        
-        if status != 200:
-            logging.error(f"认证失败! 状态: {status}")
-            logging.error(f"响应: {response}")
-            return
-            
-        logging.info(f"认证成功! 响应: {response}")
+        status, response = await token_manager.request(unique_id, test_url)
+        token = await token_manager.get_token(unique_id, base_url) if status == 200 else None
         
-        # 5. 如果收到令牌，验证令牌并存储
         if token:
-            logging.info("收到访问令牌，尝试用于下一个请求")
-            status, response = await send_request_with_token(test_url, token)
-            
-            if status == 200:
-                logging.info(f"令牌认证成功! 保存当前令牌！响应: {response}")
-                os.environ['did-token'] = token
-                
-                """
-                # 发送消息到聊天接口
-                await ANP_connector_chat(base_url, token, msg, from_chat, silent)
-                if not from_chat and not silent:
-                    print("\n客户端示例完成。")
-                    """
-            else:
-                logging.error(f"令牌认证失败! 状态: {status}")
-                logging.error(f"响应: {response}")
-                if from_chat:
-                    await ANP_req_notify_chat_thread({
-                        "type": "anp_nlp",
-                        "status": "error",
-                        "message": "令牌认证失败"
-                    })
-                elif not silent:
-                    print("\n令牌认证失败，客户端示例完成。")
+            current_identity = unique_id
+            logging.info(f"认证成功，已缓存访问令牌! 响应: {response}")
+            return token
 
-        else:
-            logging.warning("未从服务器收到令牌")
+        logging.error(f"令牌认证失败! 状态: {status}")
+        logging.error(f"响应: {response}")
+        if from_chat:
+            await ANP_req_notify_chat_thread({
+                "type": "anp_nlp",
+                "status": "error",
+                "message": "令牌认证失败"
+            })
+        elif not silent:
+            print("\n令牌认证失败，客户端示例完成。")
+        return None
             
     except Exception as e:
         logging.error(f"客户端示例中出错: {e}")
+        return None
 
 
-def run_connector(unique_id=None, message=None):
-    """在子线程中运行客户端"""
+async def _run_connector_async(unique_id=None, message=None):
+    """在客户端运行时循环中执行认证"""
     global connector_running
     try:
-        # 创建事件循环
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # 运行客户端示例
-        connector_running = True
-        loop.run_until_complete(ANP_req_auth(unique_id=unique_id, from_chat=True, msg=message))
-        
-        # 关闭事件循环
-        loop.close()
+        await ANP_req_auth(unique_id=unique_id, from_chat=True, msg=message)
     except Exception as e:
         logger.error(f"客户端运行出错: {e}")
     finally:
         connector_running = False
+        shared_state.set_component("connector", False)
         logger.info("客户端已停止")
 
 
+def _mark_connector_running(unique_id=None):
+    global connector_running
+    connector_running = True
+    shared_state.set_component(
+        "connector", True,
+        port=settings.TARGET_SERVER_PORT,
+        host=settings.TARGET_SERVER_HOST,
+        unique_id=unique_id
+    )
+
+
+def run_connector(unique_id=None, message=None):
+    """运行客户端并等待认证结束（同步接口，实际在客户端运行时循环中执行）"""
+    _mark_connector_running(unique_id)
+    try:
+        client_runtime.run(_run_connector_async(unique_id, message))
+    except Exception as e:
+        logger.error(f"客户端运行出错: {e}")
+
+
 def ANP_connector_start(port=None, unique_id=None, message=None):
     """连接ANP DID-WBA服务器
 
@@ -227,7 +609,7 @@ def ANP_connector_start(port=None, unique_id=None, message=None):
     Returns:
         bool: 连接是否成功
     """
-    global connector_running, connector_thread, settings
+    global connector_running, connector_future, settings
     
     # 检查客户端是否已经在运行
     if connector_running:
@@ -239,21 +621,14 @@ def ANP_connector_start(port=None, unique_id=None, message=None):
         settings.TARGET_SERVER_PORT = port
     
     try:
-        # 创建并启动客户端线程
-        connector_thread = threading.Thread(target=run_connector, args=(unique_id, message))
-        connector_thread.daemon = True
-        connector_thread.start()
-        
-        # 等待客户端启动
-        for _ in range(10):
-            if connector_running:
-                logger.info(f"客户端已启动，目标端口: {settings.TARGET_SERVER_PORT}")
-                return True
-            time.sleep(0.5)
-        
-        logger.error("客户端启动超时")
-        return False
+        # 提交到常驻的客户端运行时，不再为每次连接新建线程和事件循环
+        _mark_connector_running(unique_id)
+        connector_future = client_runtime.submit(_run_connector_async(unique_id, message))
+        logger.info(f"客户端已启动，目标端口: {settings.TARGET_SERVER_PORT}")
+        return True
     except Exception as e:
+        connector_running = False
+        shared_state.set_component("connector", False)
         logger.error(f"启动客户端时出错: {e}")
         return False
 
@@ -264,7 +639,7 @@ def ANP_connector_stop():
     Returns:
         bool: 客户端是否成功停止
     """
-    global connector_running, connector_thread
+    global connector_running, connector_future
     
     if not connector_running:
         logger.warning("客户端未运行")
@@ -273,8 +648,9 @@ def ANP_connector_stop():
     try:
         # 等待客户端停止
         connector_running = False
-        if connector_thread and connector_thread.is_alive():
-            connector_thread.join(timeout=5)
+        shared_state.set_component("connector", False)
+        if connector_future and not connector_future.done():
+            connector_future.cancel()
         
         logger.info("客户端已停止")
         return True
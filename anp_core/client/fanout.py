@@ -0,0 +1,170 @@
+"""
+向多个agent并发广播消息，支持 all、first 和 quorum 三种完成模式
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+
+from core.config import settings
+from anp_core.client.token_manager import token_manager, origin_of
+from anp_core.store.history_store import chat_history
+
+FANOUT_MODES = ("all", "first", "quorum")
+
+
+def normalize_target(target: str) -> str:
+    """把 host:port、端口号或URL统一为目标origin"""
+    target = str(target).strip().rstrip("/")
+    if target.isdigit():
+        target = f"{settings.TARGET_SERVER_HOST}:{target}"
+    if "://" not in target:
+        target = f"http://{target}"
+    return origin_of(target)
+
+
+def unique_targets(targets: List[str]) -> List[str]:
+    """规范化目标并去重，保持原有顺序；广播实际发送的目标数以此为准"""
+    return list(dict.fromkeys(normalize_target(target) for target in targets))
+
+
+class FanoutResult:
+    """一个目标的发送结果"""
+
+    __slots__ = ("target", "status", "response", "elapsed", "error")
+
+    def __init__(self, target: str, status: Optional[int], response: Any, elapsed: float, error: Optional[str] = None):
+        self.target = target
+        self.status = status
+        self.response = response
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    def to_dict(self) -> Dict[str, Any]:
+        answer = self.response.get("answer") if isinstance(self.response, dict) else None
+        return {
+            "target": self.target,
+            "status": self.status,
+            "ok": self.ok,
+            "answer": answer,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "error": self.error
+        }
+
+
+def required_successes(mode: str, total: int, count: Optional[int] = None) -> int:
+    """
+    计算结束广播所需的成功应答数
+
+    Args:
+        mode: 完成模式 all / first / quorum
+        total: 目标数量
+        count: first模式的N，或quorum模式的法定数量；为空时first取1，quorum取多数
+
+    Returns:
+        int: 所需成功数，all模式返回total
+    """
+    if mode not in FANOUT_MODES:
+        raise ValueError(f"未知的完成模式: {mode}，可选 {', '.join(FANOUT_MODES)}")
+    if mode == "all":
+        return total
+    if mode == "first":
+        return min(max(count or 1, 1), total)
+    return min(max(count or total // 2 + 1, 1), total)
+
+
+async def _send_one(target: str, identity: str, message: str, timeout: float,
+                    semaphore: asyncio.Semaphore) -> FanoutResult:
+    async with semaphore:
+        began = time.perf_counter()
+        try:
+            status, response = await asyncio.wait_for(
+                token_manager.request(identity, f"{target}/wba/anp-nlp", "POST", {"message": message}),
+                timeout
+            )
+            error = None if status == 200 else (response or {}).get("error") or (response or {}).get("detail")
+            result = FanoutResult(target, status, response, time.perf_counter() - began, error)
+        except asyncio.TimeoutError:
+            result = FanoutResult(target, None, None, time.perf_counter() - began, f"超时（{timeout}秒）")
+        except Exception as e:
+            result = FanoutResult(target, None, None, time.perf_counter() - began, str(e))
+    chat_history.record(
+        source="client",
+        did=token_manager.get_did(identity),
+        peer=target,
+        user_message=message,
+        assistant_message=result.to_dict()["answer"],
+        status="success" if result.ok else "error"
+    )
+    return result
+
+
+async def fanout_stream(targets: List[str], message: str, unique_id: str, mode: str = "all",
+                        count: Optional[int] = None, concurrency: Optional[int] = None,
+                        timeout: Optional[float] = None) -> AsyncIterator[FanoutResult]:
+    """
+    并发发送消息并按完成顺序产出结果
+
+    Args:
+        targets: 目标列表，支持URL、host:port或端口号，重复目标只发送一次
+        message: 要发送的消息
+        unique_id: 发送方本地身份
+        mode: 完成模式 all / first / quorum
+        count: first模式的N或quorum模式的法定数量
+        concurrency: 最大并发数，默认 FANOUT_CONCURRENCY
+        timeout: 每个目标的超时时间（秒），默认 FANOUT_TIMEOUT
+
+    Yields:
+        FanoutResult: 每个目标的结果；满足完成条件后停止，其余请求被取消
+    """
+    origins = unique_targets(targets)
+    needed = required_successes(mode, len(origins), count)
+    timeout = timeout or settings.FANOUT_TIMEOUT
+    semaphore = asyncio.Semaphore(max(concurrency or settings.FANOUT_CONCURRENCY, 1))
+    tasks = [asyncio.create_task(_send_one(origin, unique_id, message, timeout, semaphore)) for origin in origins]
+    successes = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            successes += result.ok
+            yield result
+            if mode != "all" and successes >= needed:
+                break
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.info(f"广播已满足 {mode} 条件，取消了 {len(pending)} 个未完成的请求")
+
+
+async def broadcast(targets: List[str], message: str, unique_id: str, mode: str = "all",
+                    count: Optional[int] = None, concurrency: Optional[int] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    向多个目标广播消息并汇总结果，参数同 fanout_stream
+
+    Returns:
+        Dict[str, Any]: 是否满足完成条件、成功数、各目标结果和总耗时
+    """
+    began = time.perf_counter()
+    total = len(unique_targets(targets))
+    needed = required_successes(mode, total, count)
+    results = [result async for result in fanout_stream(targets, message, unique_id, mode, count, concurrency, timeout)]
+    successes = sum(result.ok for result in results)
+    return {
+        "mode": mode,
+        "targets": total,
+        "required": needed,
+        "succeeded": successes,
+        "satisfied": successes >= needed,
+        "cancelled": total - len(results),
+        "elapsed_ms": round((time.perf_counter() - began) * 1000, 1),
+        "results": [result.to_dict() for result in results]
+    }
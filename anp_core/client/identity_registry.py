@@ -0,0 +1,175 @@
+"""
+客户端身份注册表：按 unique_id 懒加载DID文档、私钥和认证头助手并常驻内存
+"""
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from agent_connect.authentication import generate_auth_header
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from loguru import logger
+
+from core.config import settings
+from anp_core.auth.did_auth import load_or_create_did, DIDWbaAuthHeader
+
+
+class CachedDIDWbaAuthHeader(DIDWbaAuthHeader):
+    """
+    使用内存中的DID文档和私钥对象的认证头助手，签名时不再读取文件
+
+    只覆盖公开的 get_auth_header，请求头由 agent_connect 公开的 generate_auth_header 以 sign 回调生成，
+    不依赖 DIDWbaAuthHeader 的私有方法；令牌的保存和清除仍由父类完成
+    """
+
+    def __init__(self, did_document: Dict, private_key: ec.EllipticCurvePrivateKey,
+                 did_document_path: str, private_key_path: str, metrics: Dict[str, float]):
+        super().__init__(did_document_path=did_document_path, private_key_path=private_key_path)
+        self.did_document = did_document
+        self.private_key = private_key
+        self._metrics = metrics
+
+    def sign(self, content: bytes, method_fragment: str) -> bytes:
+        """generate_auth_header 的签名回调，返回DER格式的ECDSA签名"""
+        began = time.perf_counter()
+        try:
+            return self.private_key.sign(content, ec.ECDSA(hashes.SHA256()))
+        finally:
+            elapsed = time.perf_counter() - began
+            self._metrics["signs"] += 1
+            self._metrics["sign_time"] += elapsed
+            self._metrics["sign_time_max"] = max(self._metrics["sign_time_max"], elapsed)
+
+    def get_auth_header(self, server_url: str, force_new: bool = False) -> Dict[str, str]:
+        # 与父类 update_token 相同的域名规则（不含端口），令牌和请求头按域名缓存
+        domain = urlparse(server_url).netloc.split(":")[0]
+        if domain in self.tokens and not force_new:
+            return {"Authorization": f"Bearer {self.tokens[domain]}"}
+        if domain not in self.auth_headers or force_new:
+            self.auth_headers[domain] = generate_auth_header(self.did_document, domain, self.sign)
+        return {"Authorization": self.auth_headers[domain]}
+
+
+class Identity:
+    """一个已加载的本地身份"""
+
+    __slots__ = ("unique_id", "did", "did_document", "user_dir", "auth_header", "load_time")
+
+    def __init__(self, unique_id: str, did_document: Dict, user_dir: str,
+                 auth_header: CachedDIDWbaAuthHeader, load_time: float):
+        self.unique_id = unique_id
+        self.did = did_document.get("id")
+        self.did_document = did_document
+        self.user_dir = user_dir
+        self.auth_header = auth_header
+        self.load_time = load_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"unique_id": self.unique_id, "did": self.did, "load_ms": round(self.load_time * 1000, 2)}
+
+
+class IdentityRegistry:
+    """按 unique_id 懒加载并缓存本地身份"""
+
+    def __init__(self):
+        self._identities: Dict[str, Identity] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._metrics = {
+            "hits": 0, "loads": 0, "created": 0, "load_time": 0.0, "load_time_max": 0.0,
+            "signs": 0, "sign_time": 0.0, "sign_time_max": 0.0
+        }
+
+    def _lock_for(self, unique_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(unique_id)
+            if lock is None:
+                lock = self._locks[unique_id] = threading.Lock()
+            return lock
+
+    def _load(self, unique_id: str) -> Identity:
+        """加载或创建身份，同一身份同时只有一个线程执行"""
+        with self._lock_for(unique_id):
+            identity = self._identities.get(unique_id)
+            if identity:
+                return identity
+            began = time.perf_counter()
+            did_document, keys, user_dir = load_or_create_did(unique_id)
+            private_key_path = Path(user_dir) / settings.PRIVATE_KEY_FILENAME
+            fragment = settings.PRIVATE_KEY_FILENAME.replace("_private.pem", "")
+            if fragment in keys:
+                # 刚生成的身份直接使用内存中的密钥，不再读回文件
+                private_key_bytes = keys[fragment][0]
+                self._metrics["created"] += 1
+            else:
+                private_key_bytes = private_key_path.read_bytes()
+            private_key = serialization.load_pem_private_key(private_key_bytes, password=None)
+            auth_header = CachedDIDWbaAuthHeader(
+                did_document, private_key,
+                did_document_path=str(Path(user_dir) / settings.DID_DOCUMENT_FILENAME),
+                private_key_path=str(private_key_path),
+                metrics=self._metrics
+            )
+            elapsed = time.perf_counter() - began
+            identity = Identity(unique_id, did_document, user_dir, auth_header, elapsed)
+            self._identities[unique_id] = identity
+            self._metrics["loads"] += 1
+            self._metrics["load_time"] += elapsed
+            self._metrics["load_time_max"] = max(self._metrics["load_time_max"], elapsed)
+            logger.info(f"身份 {unique_id} 已加载: {identity.did} ({elapsed * 1000:.1f} ms)")
+            return identity
+
+    async def get(self, unique_id: str) -> Identity:
+        """
+        获取身份，首次调用时在线程池中加载（不存在则生成）
+
+        Args:
+            unique_id: 用户唯一标识符
+
+        Returns:
+            Identity: 已加载的身份
+        """
+        identity = self._identities.get(unique_id)
+        if identity:
+            self._metrics["hits"] += 1
+            return identity
+        return await asyncio.to_thread(self._load, unique_id)
+
+    def get_sync(self, unique_id: str) -> Identity:
+        """get的同步版本，供线程或脚本中直接调用"""
+        identity = self._identities.get(unique_id)
+        if identity:
+            self._metrics["hits"] += 1
+            return identity
+        return self._load(unique_id)
+
+    def peek(self, unique_id: str) -> Optional[Identity]:
+        """返回已加载的身份，未加载时返回None，不触发加载"""
+        return self._identities.get(unique_id)
+
+    def forget(self, unique_id: str) -> bool:
+        """从内存中移除身份，下次使用时重新加载"""
+        with self._lock_for(unique_id):
+            return self._identities.pop(unique_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回加载和签名耗时统计"""
+        metrics = self._metrics
+        return {
+            "identities": len(self._identities),
+            "hits": metrics["hits"],
+            "loads": metrics["loads"],
+            "created": metrics["created"],
+            "load_avg_ms": round(metrics["load_time"] / metrics["loads"] * 1000, 3) if metrics["loads"] else 0.0,
+            "load_max_ms": round(metrics["load_time_max"] * 1000, 3),
+            "signs": metrics["signs"],
+            "sign_avg_ms": round(metrics["sign_time"] / metrics["signs"] * 1000, 3) if metrics["signs"] else 0.0,
+            "sign_max_ms": round(metrics["sign_time_max"] * 1000, 3)
+        }
+
+
+# 全局单例
+identity_registry = IdentityRegistry()
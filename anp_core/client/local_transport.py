@@ -0,0 +1,141 @@
+"""
+进程内ASGI传输：目标是本进程线程模式的响应端时，直接把请求交给FastAPI应用，不经过TCP
+"""
+import asyncio
+import json
+import sys
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from starlette.datastructures import Headers
+
+from core.config import settings
+
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+class LocalTransport:
+    """把发往本进程响应端的请求直接分派给FastAPI应用"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = settings.LOCAL_ASGI_TRANSPORT if enabled is None else enabled
+        self._stats = {"local": 0, "errors": 0}
+
+    def _responder(self) -> Tuple[Any, Optional[asyncio.AbstractEventLoop]]:
+        # 响应端模块未导入说明本进程没有运行响应端，不在这里导入以免创建应用
+        server = sys.modules.get("anp_core.server.server")
+        if server is None:
+            return None, None
+        status = server.server_status
+        if not status.ready.is_set() or status.loop is None or not status.loop.is_running():
+            return None, None
+        return server, status.loop
+
+    def is_local(self, url: str) -> bool:
+        """
+        判断URL是否指向本进程以线程模式运行的响应端
+
+        Args:
+            url: 请求URL
+
+        Returns:
+            bool: 是否可以走进程内传输
+        """
+        if not self.enabled:
+            return False
+        server, _ = self._responder()
+        if server is None:
+            return False
+        parts = urlsplit(url)
+        hosts = LOOPBACK_HOSTS | {settings.HOST}
+        return parts.scheme == "http" and parts.hostname in hosts and parts.port == server.server_status.port
+
+    @staticmethod
+    def _scope(method: str, url: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        parts = urlsplit(url)
+        raw_headers = [(b"host", parts.netloc.encode("latin-1"))]
+        raw_headers += [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in headers.items()]
+        if body:
+            raw_headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": parts.scheme,
+            "path": unquote(parts.path) or "/",
+            "raw_path": (parts.path or "/").encode("latin-1"),
+            "query_string": parts.query.encode("latin-1"),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 0),
+            "server": (parts.hostname, parts.port),
+        }
+
+    async def _dispatch(self, app, method: str, url: str, headers: Dict[str, str],
+                        json_data: Optional[Dict]) -> Tuple[int, Dict[str, Any], Headers]:
+        body = json.dumps(json_data).encode("utf-8") if json_data is not None else b""
+        request_sent = False
+        response_done = asyncio.Event()
+        response: Dict[str, Any] = {"status": 500, "headers": [], "body": []}
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # 请求体已读完，之后的receive只在响应结束（相当于连接关闭）时返回断开
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        try:
+            await app(self._scope(method, url, headers, body), receive, send)
+        finally:
+            response_done.set()
+        status = response["status"]
+        data = json.loads(b"".join(response["body"])) if status == 200 else {}
+        return status, data, Headers(raw=response["headers"])
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      json_data: Optional[Dict] = None) -> Tuple[int, Dict[str, Any], Headers]:
+        """
+        在响应端事件循环中执行一次ASGI请求，调用前需用 is_local() 判断
+
+        Args:
+            method: HTTP方法
+            url: 请求URL
+            headers: 请求头
+            json_data: 可选的JSON数据
+
+        Returns:
+            Tuple[int, Dict[str, Any], Headers]: 状态码、响应（非200时为空字典）和响应头
+        """
+        server, loop = self._responder()
+        if server is None:
+            raise ConnectionError("本进程的响应端未运行")
+        self._stats["local"] += 1
+        coro = self._dispatch(server.app, method.upper(), url, headers, json_data)
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coro
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """返回进程内传输统计信息"""
+        return {"enabled": self.enabled, **self._stats}
+
+
+# 全局单例
+local_transport = LocalTransport()
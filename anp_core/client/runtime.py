@@ -0,0 +1,180 @@
+"""
+客户端常驻运行时：一个后台事件循环线程和在其中复用的 aiohttp 连接池
+"""
+import asyncio
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, Coroutine, Dict, Optional
+
+import aiohttp
+from loguru import logger
+
+from anp_core.client.unix_sockets import uds_resolver
+
+
+class ClientRuntime:
+    """常驻的客户端事件循环线程及其共享资源"""
+
+    def __init__(self, connection_limit: int = 100, keepalive_timeout: float = 30.0):
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._uds_sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """运行时事件循环，首次访问时启动后台线程"""
+        return self._ensure_loop()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        loop = self._loop
+        if loop is not None and self._thread.is_alive():
+            return loop
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="anp-client-runtime", daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+                self._session = None
+                self._uds_sessions = {}
+            return self._loop
+
+    def in_runtime(self) -> bool:
+        """当前是否运行在运行时事件循环中"""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        提交协程到运行时事件循环，可从任意线程调用
+
+        Args:
+            coro: 要执行的协程
+
+        Returns:
+            Future: 协程结果，异常会记录日志并保存在Future中
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        self._stats["submitted"] += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        if future.cancelled():
+            self._stats["failed"] += 1
+        elif future.exception() is not None:
+            self._stats["failed"] += 1
+            logger.error(f"客户端任务出错: {future.exception()}")
+        else:
+            self._stats["completed"] += 1
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        提交协程并同步等待结果，不能在运行时事件循环内调用
+
+        Args:
+            coro: 要执行的协程
+            timeout: 超时时间（秒）
+
+        Returns:
+            Any: 协程返回值
+        """
+        if self.in_runtime():
+            coro.close()
+            raise RuntimeError("不能在客户端运行时循环内同步等待")
+        return self.submit(coro).result(timeout)
+
+    async def wrap(self, coro: Coroutine) -> Any:
+        """在调用方事件循环中await运行时执行的协程"""
+        if self.in_runtime():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def get_session(self, uds: Optional[str] = None) -> aiohttp.ClientSession:
+        """
+        返回运行时共享的aiohttp会话，只能在运行时事件循环中调用
+
+        Args:
+            uds: Unix域套接字路径，为空时返回TCP会话；每个套接字各有一个会话和连接池
+        """
+        if uds:
+            session = self._uds_sessions.get(uds)
+            if session is None or session.closed:
+                connector = aiohttp.UnixConnector(path=uds, limit=self.connection_limit,
+                                                  keepalive_timeout=self.keepalive_timeout)
+                session = self._uds_sessions[uds] = aiohttp.ClientSession(connector=connector)
+            return session
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def stats(self) -> Dict[str, Any]:
+        """返回运行时统计信息"""
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "session_open": bool(self._session and not self._session.closed),
+            **self._stats
+        }
+
+    def stop(self, timeout: float = 5.0):
+        """关闭共享会话并停止事件循环"""
+        loop = self._loop
+        if loop is None or not self._thread.is_alive():
+            return
+
+        async def close_session():
+            for session in [self._session, *self._uds_sessions.values()]:
+                if session and not session.closed:
+                    await session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"关闭客户端会话出错: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+
+
+# 全局单例
+client_runtime = ClientRuntime()
+atexit.register(client_runtime.stop, 2.0)
+
+
+@asynccontextmanager
+async def client_session(url: Optional[str] = None):
+    """
+    获取aiohttp会话：在运行时循环中复用共享连接池，否则创建临时会话
+
+    Args:
+        url: 可选的请求URL，目标映射到Unix域套接字时返回经该套接字连接的会话
+
+    Yields:
+        aiohttp.ClientSession: 可用的会话
+    """
+    uds = uds_resolver.socket_for(url) if url else None
+    if client_runtime.in_runtime():
+        yield await client_runtime.get_session(uds)
+        return
+    connector = aiohttp.UnixConnector(path=uds) if uds else None
+    async with aiohttp.ClientSession(connector=connector) as session:
+        yield session
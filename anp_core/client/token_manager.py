@@ -0,0 +1,249 @@
+"""
+客户端访问令牌管理：按 (本地身份, 目标origin) 缓存令牌，到期前刷新，并发握手合并为一次
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import jwt
+from loguru import logger
+
+from core.config import settings
+from anp_core.auth.did_auth import send_authenticated_request, send_request_with_token
+from anp_core.client.identity_registry import identity_registry
+from anp_core.client.runtime import client_runtime
+
+
+def origin_of(url: str) -> str:
+    """返回URL的origin（scheme://host:port）"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class TokenEntry:
+    """一个 (身份, origin) 的令牌及其过期信息"""
+
+    __slots__ = ("token", "did", "obtained_at", "expires_at", "last_used", "refresh_handle")
+
+    def __init__(self, token: str, did: Optional[str], expires_at: float):
+        self.token = token
+        self.did = did
+        self.obtained_at = time.time()
+        self.expires_at = expires_at
+        self.last_used = 0.0
+        self.refresh_handle: Optional[asyncio.TimerHandle] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "did": self.did,
+            "expires_in": round(self.expires_at - time.time(), 1),
+            "obtained_at": self.obtained_at
+        }
+
+
+class TokenManager:
+    """按 (本地身份, 目标origin) 缓存访问令牌，主动刷新并合并并发认证"""
+
+    def __init__(self, refresh_margin: Optional[float] = None, one_round_trip: Optional[bool] = None):
+        self.refresh_margin = settings.TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self.one_round_trip = settings.CLIENT_ONE_ROUND_TRIP_AUTH if one_round_trip is None else one_round_trip
+        self._entries: Dict[Tuple[str, str], TokenEntry] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._dids: Dict[str, str] = {}
+        self._stats = {
+            "handshakes": 0, "handshake_failures": 0, "one_round_trip": 0,
+            "joined": 0, "refreshes": 0, "retries_401": 0
+        }
+
+    # ------------------------------------------------------------------ #
+    # 认证
+    # ------------------------------------------------------------------ #
+    async def _handshake(self, identity: str, origin: str, signed_request: Optional[tuple] = None) -> Optional[str]:
+        """
+        执行一次DID WBA握手，成功后保存令牌
+
+        Args:
+            identity: 本地身份
+            origin: 目标服务器origin
+            signed_request: 可选的 (url, method, json_data, result)，直接把带DID签名的业务请求作为握手，
+                响应状态和内容写入result字典；为空时请求 /wba/test
+        """
+        loaded = await identity_registry.get(identity)
+        self._dids[identity] = loaded.did
+        self._stats["handshakes"] += 1
+        url, method, json_data, result = signed_request or (f"{origin}/wba/test", "GET", None, {})
+        if signed_request:
+            self._stats["one_round_trip"] += 1
+        # 注册表中的认证头助手是共享的，握手时必须重新签名，不能复用其缓存的请求头或令牌
+        status, response, token = await send_authenticated_request(
+            url, loaded.auth_header, method, json_data, force_new=True
+        )
+        result["status"], result["response"] = status, response
+        if not token:
+            self._stats["handshake_failures"] += 1
+            logger.error(f"身份 {identity} 向 {origin} 认证失败! 状态: {status} 响应: {response}")
+            return None
+        self._store(identity, origin, token, loaded.did)
+        logger.info(f"身份 {identity} 已获取 {origin} 的访问令牌")
+        return token
+
+    async def _authenticate(self, identity: str, origin: str, signed_request: Optional[tuple] = None) -> Optional[str]:
+        """single-flight认证：同一key已有握手进行中时等待其结果（此时signed_request不会发送）"""
+        key = (identity, origin)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._handshake(identity, origin, signed_request))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._stats["joined"] += 1
+        return await asyncio.shield(task)
+
+    def _store(self, identity: str, origin: str, token: str, did: Optional[str]) -> TokenEntry:
+        key = (identity, origin)
+        old = self._entries.get(key)
+        if old and old.refresh_handle:
+            old.refresh_handle.cancel()
+        try:
+            expires_at = float(jwt.decode(token, options={"verify_signature": False})["exp"])
+        except Exception:
+            expires_at = time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        entry = TokenEntry(token, did, expires_at)
+        if old:
+            entry.last_used = old.last_used
+        self._entries[key] = entry
+        self._schedule_refresh(key, entry)
+        return entry
+
+    def _schedule_refresh(self, key: Tuple[str, str], entry: TokenEntry):
+        # 在 exp - refresh_margin 时刷新，令牌有效期很短时至少保留一半有效期
+        lifetime = entry.expires_at - entry.obtained_at
+        refresh_at = max(entry.obtained_at + lifetime / 2, entry.expires_at - self.refresh_margin)
+        delay = max(refresh_at - time.time(), 0)
+        entry.refresh_handle = asyncio.get_running_loop().call_later(delay, self._refresh, key, entry)
+
+    def _refresh(self, key: Tuple[str, str], entry: TokenEntry):
+        if self._entries.get(key) is not entry:
+            return
+        entry.refresh_handle = None
+        # 上次获取令牌后没有再使用过的身份不主动刷新，下次使用时再认证
+        if entry.last_used <= entry.obtained_at:
+            return
+        self._stats["refreshes"] += 1
+        task = asyncio.get_running_loop().create_task(self._authenticate(*key))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    # ------------------------------------------------------------------ #
+    # 公共接口
+    # ------------------------------------------------------------------ #
+    async def get_token(self, identity: str, origin: str, force: bool = False) -> Optional[str]:
+        """
+        获取身份访问某个origin的令牌，没有或即将过期时执行认证
+
+        Args:
+            identity: 本地身份（unique_id）
+            origin: 目标服务器origin，如 http://localhost:8000
+            force: 是否忽略缓存重新认证
+
+        Returns:
+            Optional[str]: 访问令牌，认证失败时返回None
+        """
+        if not client_runtime.in_runtime():
+            return await client_runtime.wrap(self.get_token(identity, origin, force))
+        origin = origin_of(origin)
+        token = None if force else self._cached_token(identity, origin)
+        if token:
+            return token
+        token = await self._authenticate(identity, origin)
+        entry = self._entries.get((identity, origin))
+        if entry:
+            entry.last_used = time.time()
+        return token
+
+    def _cached_token(self, identity: str, origin: str) -> Optional[str]:
+        entry = self._entries.get((identity, origin))
+        if entry and entry.expires_at - time.time() > 1:
+            entry.last_used = time.time()
+            return entry.token
+        return None
+
+    async def request(self, identity: str, url: str, method: str = "GET",
+                      json_data: Optional[Dict] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        以某个身份发送带令牌的请求，401时重新认证并重试一次
+
+        单次往返模式下没有可用令牌时，请求本身携带DID签名发出，并从响应头中取得令牌
+
+        Args:
+            identity: 本地身份（unique_id）
+            url: 完整的请求URL
+            method: HTTP方法
+            json_data: 可选的JSON数据
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: 状态码和响应
+        """
+        if not client_runtime.in_runtime():
+            return await client_runtime.wrap(self.request(identity, url, method, json_data))
+        origin = origin_of(url)
+        token = self._cached_token(identity, origin)
+        if not token and self.one_round_trip:
+            result = {}
+            token = await self._authenticate(identity, origin, (url, method, json_data, result))
+            if result:
+                entry = self._entries.get((identity, origin))
+                if entry:
+                    entry.last_used = time.time()
+                return result["status"], result["response"]
+        if not token:
+            token = await self.get_token(identity, origin)
+        if not token:
+            return 401, {"error": "认证失败"}
+        status, response = await send_request_with_token(url, token, method, json_data, did=self._dids.get(identity))
+        if status != 401:
+            return status, response
+
+        self._stats["retries_401"] += 1
+        entry = self._entries.get((identity, origin))
+        if entry and entry.token == token:
+            # 失败的仍是当前令牌，丢弃后重新认证；并发的401请求会合并到同一次握手
+            self.invalidate(identity, origin)
+        token = await self.get_token(identity, origin)
+        if not token:
+            return 401, {"error": "认证失败"}
+        return await send_request_with_token(url, token, method, json_data, did=self._dids.get(identity))
+
+    def peek(self, identity: str, origin: str) -> Optional[str]:
+        """返回未过期的缓存令牌，不触发认证，只能在客户端运行时事件循环中调用"""
+        return self._cached_token(identity, origin_of(origin))
+
+    def store(self, identity: str, origin: str, token: str, did: Optional[str] = None):
+        """登记外部获取的令牌，只能在客户端运行时事件循环中调用"""
+        if did:
+            self._dids[identity] = did
+        self._store(identity, origin_of(origin), token, did or self._dids.get(identity))
+
+    def invalidate(self, identity: str, origin: Optional[str] = None):
+        """丢弃身份的令牌，origin为空时丢弃该身份的全部令牌"""
+        for key in list(self._entries):
+            if key[0] == identity and (origin is None or key[1] == origin_of(origin)):
+                entry = self._entries.pop(key)
+                if entry.refresh_handle:
+                    entry.refresh_handle.cancel()
+
+    def get_did(self, identity: str) -> Optional[str]:
+        """返回已加载身份的DID"""
+        return self._dids.get(identity)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回令牌管理统计信息"""
+        return {
+            "tokens": {f"{identity}@{origin}": entry.to_dict() for (identity, origin), entry in self._entries.items()},
+            "inflight": len(self._inflight),
+            **self._stats
+        }
+
+
+# 全局单例
+token_manager = TokenManager()
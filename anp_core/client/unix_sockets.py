@@ -0,0 +1,76 @@
+"""
+Unix域套接字路由：决定一个HTTP URL是否改经响应端的Unix域套接字连接
+"""
+import os
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from core.config import settings
+from anp_core.store.state_store import shared_state
+
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def parse_uds_map(value: Optional[str]) -> Dict[str, str]:
+    """
+    解析 "host:port=/path/to.sock,..." 形式的映射
+
+    Args:
+        value: 映射字符串
+
+    Returns:
+        Dict[str, str]: 小写的 host:port 到套接字路径
+    """
+    mapping = {}
+    for item in (value or "").split(","):
+        authority, sep, path = item.strip().partition("=")
+        if sep and authority.strip() and path.strip():
+            mapping[authority.strip().lower()] = path.strip()
+    return mapping
+
+
+class UnixSocketResolver:
+    """把 host:port 映射到本机响应端的Unix域套接字"""
+
+    def __init__(self, mapping: Optional[Dict[str, str]] = None, discovery_ttl: float = 2.0):
+        self.enabled = settings.CLIENT_USE_UDS
+        self.mapping = parse_uds_map(settings.UDS_HOST_MAP) if mapping is None else mapping
+        self.discovery_ttl = discovery_ttl
+        self._discovered: Tuple[float, Optional[int], Optional[str]] = (float("-inf"), None, None)
+
+    def _discover(self) -> Tuple[Optional[int], Optional[str]]:
+        # 共享状态读一次SQLite，短时间内复用结果
+        checked_at, port, path = self._discovered
+        if time.monotonic() - checked_at < self.discovery_ttl:
+            return port, path
+        component = shared_state.get_component("server")
+        path = (component.get("info") or {}).get("uds") if component["running"] else None
+        port = component["port"] if path else None
+        self._discovered = (time.monotonic(), port, path)
+        return port, path
+
+    def socket_for(self, url: str) -> Optional[str]:
+        """
+        返回URL应使用的Unix域套接字路径
+
+        Args:
+            url: 请求URL（http或ws）
+
+        Returns:
+            Optional[str]: 套接字路径，应走TCP时返回None
+        """
+        if not self.enabled:
+            return None
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "ws") or not parts.hostname:
+            return None
+        path = self.mapping.get(parts.netloc.lower())
+        if path is None and parts.hostname in LOOPBACK_HOSTS | {settings.HOST}:
+            port, discovered = self._discover()
+            path = discovered if port == parts.port else None
+        return path if path and os.path.exists(path) else None
+
+
+# 全局单例
+uds_resolver = UnixSocketResolver()
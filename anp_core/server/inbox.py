@@ -0,0 +1,186 @@
+"""
+按DID划分的有界消息收件箱，供 /wba/inbox 的SSE和长轮询接口读取
+所有方法只能在响应端事件循环中调用。
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import settings
+
+
+class InboxFull(Exception):
+    """收件箱数量已达上限，且每个收件箱都有等待者或未读事件"""
+
+    def __init__(self, max_inboxes: int):
+        super().__init__(f"收件箱数量已达上限 {max_inboxes}")
+        self.max_inboxes = max_inboxes
+
+
+class InboxQuotaExceeded(Exception):
+    """发送方为其他DID新建的收件箱数量已达上限"""
+
+    def __init__(self, sender: str, limit: int):
+        super().__init__(f"{sender} 新建的收件箱数量已达上限 {limit}")
+        self.sender = sender
+        self.limit = limit
+
+
+class AgentInbox:
+    """一个DID的有界事件队列，事件id从创建时的毫秒时间戳×1000开始递增，重启或重建后的id仍大于之前的id"""
+
+    def __init__(self, max_messages: int, first_id: int = 0, creator: Optional[str] = None):
+        self.events: deque = deque(maxlen=max(max_messages, 1))
+        self.last_id = first_id
+        # 已读给收件人的最大事件id
+        self.delivered = first_id
+        self.dropped = 0
+        self.waiters = 0
+        # 收件人打开之前，为其新建收件箱的发送方
+        self.creator = creator
+        self._changed = asyncio.Event()
+
+    def post(self, event: str, data: Dict[str, Any]) -> int:
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.last_id += 1
+        self.events.append({"id": self.last_id, "event": event, "data": data, "ts": time.time()})
+        # 唤醒所有等待者后换一个新的Event，后续等待者等待下一条事件
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return self.last_id
+
+    @property
+    def unread(self) -> bool:
+        return self.last_id > self.delivered
+
+    def read_since(self, last_event_id: int, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """返回id大于last_event_id的事件，以及续读位置之后是否有事件已被丢弃"""
+        if last_event_id > self.last_id:
+            # 续读位置来自重启前的进程或已移除的收件箱：从最旧的事件开始返回
+            events, gap = list(self.events)[:limit], True
+        elif not self.events or last_event_id == self.last_id:
+            return [], False
+        else:
+            oldest = self.events[0]["id"]
+            gap = last_event_id + 1 < oldest
+            start = max(last_event_id + 1 - oldest, 0)
+            events = [self.events[i] for i in range(start, min(start + limit, len(self.events)))]
+        if events:
+            self.delivered = max(self.delivered, events[-1]["id"])
+        return events, gap
+
+    async def wait(self, last_event_id: int, timeout: float) -> bool:
+        """等待id大于last_event_id的事件出现，超时返回False"""
+        if self.last_id > last_event_id:
+            return True
+        self.waiters += 1
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiters -= 1
+
+
+class InboxHub:
+    """所有DID的收件箱"""
+
+    def __init__(self, max_messages: Optional[int] = None, max_inboxes: Optional[int] = None,
+                 max_per_sender: Optional[int] = None):
+        self.max_messages = max_messages or settings.INBOX_MAX_MESSAGES
+        self.max_inboxes = max(max_inboxes or settings.INBOX_MAX_INBOXES, 1)
+        self.max_per_sender = max(max_per_sender or settings.INBOX_MAX_PER_SENDER, 1)
+        # 按最近使用排序，超出数量时从最旧的一端移除
+        self.inboxes: "OrderedDict[str, AgentInbox]" = OrderedDict()
+        # 发送方 -> 其新建、收件人尚未打开的收件箱数量
+        self.created_by: Dict[str, int] = {}
+        self.listeners = 0
+        self.evicted = 0
+
+    def inbox(self, did: str, sender: Optional[str] = None) -> AgentInbox:
+        """
+        返回DID的收件箱，不存在时新建
+
+        Args:
+            did: 收件人DID
+            sender: 投递消息的发送方；为空表示收件人本人打开
+        """
+        inbox = self.inboxes.get(did)
+        if inbox is not None:
+            self.inboxes.move_to_end(did)
+            if sender is None and inbox.creator:
+                # 收件人已打开，不再计入发送方的配额
+                self._release(inbox)
+            return inbox
+        creator = sender if sender and sender != did else None
+        if creator and self.created_by.get(creator, 0) >= self.max_per_sender:
+            raise InboxQuotaExceeded(creator, self.max_per_sender)
+        if len(self.inboxes) >= self.max_inboxes:
+            self._evict()
+        inbox = self.inboxes[did] = AgentInbox(self.max_messages, int(time.time() * 1000) * 1000, creator)
+        if creator:
+            self.created_by[creator] = self.created_by.get(creator, 0) + 1
+        return inbox
+
+    def _release(self, inbox: AgentInbox):
+        remaining = self.created_by.get(inbox.creator, 0) - 1
+        if remaining > 0:
+            self.created_by[inbox.creator] = remaining
+        else:
+            self.created_by.pop(inbox.creator, None)
+        inbox.creator = None
+
+    def _evict(self):
+        """移除最久未使用、没有等待者且没有未读事件的收件箱；都不能移除时抛出 InboxFull"""
+        for did, inbox in self.inboxes.items():
+            if not inbox.waiters and not inbox.unread:
+                del self.inboxes[did]
+                if inbox.creator:
+                    self._release(inbox)
+                self.evicted += 1
+                return
+        raise InboxFull(self.max_inboxes)
+
+    def post(self, did: str, event: str, data: Dict[str, Any], sender: Optional[str] = None) -> int:
+        """
+        向DID的收件箱投递一条事件
+
+        Args:
+            did: 接收方DID
+            event: 事件名，如 message
+            data: 事件内容
+            sender: 发送方DID，为他人新建收件箱时计入其配额
+
+        Returns:
+            int: 事件id
+        """
+        return self.inbox(did, sender).post(event, data)
+
+    def read(self, did: str, last_event_id: int = 0, limit: int = 100) -> Tuple[List[Dict[str, Any]], bool]:
+        """读取last_event_id之后的事件，返回 (事件列表, 是否有事件已被丢弃)"""
+        return self.inbox(did).read_since(last_event_id, limit)
+
+    def resume_id(self, did: str, last_event_id: int) -> int:
+        """没有新事件时客户端下次续读的位置：大于最新id的续读位置（重启前的id）改为最新id"""
+        return min(last_event_id, self.inbox(did).last_id)
+
+    async def wait(self, did: str, last_event_id: int, timeout: float) -> bool:
+        """等待DID收到last_event_id之后的新事件"""
+        return await self.inbox(did).wait(last_event_id, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inboxes": len(self.inboxes),
+            "queued": sum(len(inbox.events) for inbox in self.inboxes.values()),
+            "dropped": sum(inbox.dropped for inbox in self.inboxes.values()),
+            "unread_inboxes": sum(inbox.unread for inbox in self.inboxes.values()),
+            "evicted": self.evicted,
+            "listeners": self.listeners
+        }
+
+
+# 全局单例
+inbox_hub = InboxHub()
@@ -0,0 +1,274 @@
+"""
+多实例响应端宿主：在一个后台事件循环中承载多个响应端实例，同一端口按Host头分发
+"""
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from loguru import logger
+
+from core.config import settings, Settings
+from anp_core.server.server import ReadinessServer, bind_socket, app as default_app
+from anp_core.store.state_store import shared_state
+
+
+# 实例可以覆盖的settings字段：只有这些字段在请求路径上经 core.config.get_settings(request) 读取。
+# 其他字段（JWT密钥、共享鉴权状态、nonce和时间戳有效期、远程DID解析、聊天历史等）由进程内的全局单例读取，
+# 按实例覆盖不会生效，add_instance 直接拒绝
+INSTANCE_SETTINGS = frozenset({
+    "DID_DOCUMENTS_PATH", "DID_STORE_BACKEND", "DID_STORE_SHARD_DEPTH", "DID_DOCUMENT_FILENAME",
+    "DID_STORE_DB_PATH", "DID_INDEX_ENABLED", "DID_DOCUMENT_MAX_AGE", "DID_BATCH_MAX_ITEMS",
+    "NLP_BATCH_MAX_MESSAGES", "NLP_BATCH_CONCURRENCY",
+    "INBOX_KEEPALIVE", "INBOX_POLL_TIMEOUT", "INBOX_RETRY_MS",
+    "WS_HEARTBEAT_INTERVAL", "WS_HEARTBEAT_TIMEOUT", "WS_MAX_INFLIGHT", "WS_SEND_QUEUE",
+    "HISTORY_ADMIN_DIDS",
+})
+
+
+class ResponderInstance:
+    """一个响应端实例：名称、端口、虚拟主机名和独立的settings"""
+
+    __slots__ = ("name", "port", "server_name", "settings", "app")
+
+    def __init__(self, name: str, port: int, server_name: Optional[str], instance_settings: Settings, app=None):
+        self.name = name
+        self.port = port
+        self.server_name = server_name.lower() if server_name else None
+        self.settings = instance_settings
+        self.app = app
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "port": self.port, "server_name": self.server_name}
+
+
+class VirtualHostApp:
+    """按Host头把请求分发给同一端口上的实例，并把实例settings写入请求state"""
+
+    def __init__(self, shared_app):
+        self.shared_app = shared_app
+        self.by_server_name: Dict[str, ResponderInstance] = {}
+        self.default: Optional[ResponderInstance] = None
+
+    def add(self, instance: ResponderInstance):
+        if instance.server_name:
+            self.by_server_name[instance.server_name] = instance
+        else:
+            self.default = instance
+
+    def remove(self, instance: ResponderInstance):
+        if instance.server_name:
+            self.by_server_name.pop(instance.server_name, None)
+        elif self.default is instance:
+            self.default = None
+
+    def __len__(self):
+        return len(self.by_server_name) + (1 if self.default else 0)
+
+    def _match(self, scope) -> Optional[ResponderInstance]:
+        if self.by_server_name:
+            for key, value in scope.get("headers", ()):
+                if key == b"host":
+                    hostname = value.decode("latin-1").rsplit(":", 1)[0].lower()
+                    instance = self.by_server_name.get(hostname)
+                    if instance:
+                        return instance
+                    break
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.shared_app(scope, receive, send)
+        instance = self._match(scope)
+        if instance is None:
+            if scope["type"] == "http":
+                await send({"type": "http.response.start", "status": 404,
+                            "headers": [(b"content-type", b"application/json")]})
+                await send({"type": "http.response.body", "body": b'{"detail":"Unknown host"}'})
+            return
+        state = dict(scope.get("state") or {})
+        state["settings"] = instance.settings
+        state["instance"] = instance.name
+        scope = {**scope, "state": state}
+        await (instance.app or self.shared_app)(scope, receive, send)
+
+
+class ResponderHost:
+    """在单个事件循环中承载多个响应端实例"""
+
+    def __init__(self, host: Optional[str] = None):
+        self.host = host or settings.HOST
+        self.instances: Dict[str, ResponderInstance] = {}
+        self._sites: Dict[int, Dict[str, Any]] = {}
+        self._shared_app = default_app
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ #
+    # 事件循环线程
+    # ------------------------------------------------------------------ #
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="anp-responder-host", daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+    def _call(self, coro, timeout: Optional[float]):
+        """在宿主事件循环中执行协程并同步等待结果"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def is_running(self) -> bool:
+        return bool(self.instances)
+
+    # ------------------------------------------------------------------ #
+    # 端口（uvicorn服务器）管理，仅在宿主事件循环中调用
+    # ------------------------------------------------------------------ #
+    async def _open_site(self, port: int) -> Dict[str, Any]:
+        router = VirtualHostApp(self._shared_app)
+        config = uvicorn.Config(router, host=self.host, port=port, lifespan="off", log_level="error")
+        # 先自行绑定，端口占用时抛出OSError，避免uvicorn在宿主循环中调用sys.exit
+        sock = bind_socket(self.host, port)
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        server = ReadinessServer(config, on_ready=lambda: ready.done() or ready.set_result(True))
+
+        async def serve():
+            try:
+                await server.serve(sockets=[sock])
+            except SystemExit:
+                logger.error(f"端口 {port} 启动失败")
+            finally:
+                sock.close()
+
+        task = loop.create_task(serve(), name=f"anp-responder-host-{port}")
+        await asyncio.wait([ready, task], return_when=asyncio.FIRST_COMPLETED)
+        if not ready.done():
+            raise RuntimeError(f"端口 {port} 启动失败")
+        site = {"server": server, "task": task, "router": router}
+        self._sites[port] = site
+        return site
+
+    async def _close_site(self, port: int):
+        site = self._sites.pop(port, None)
+        if site:
+            site["server"].should_exit = True
+            await site["task"]
+
+    async def _add(self, name: str, port: int, server_name: Optional[str], overrides: Dict[str, Any], app):
+        if name in self.instances:
+            raise ValueError(f"实例 {name} 已存在")
+        unsupported = sorted(set(overrides) - INSTANCE_SETTINGS)
+        if unsupported:
+            raise ValueError(f"以下settings不能按实例覆盖: {', '.join(unsupported)}")
+        instance_settings = settings.model_copy(update={"PORT": port, "HOST": self.host, **overrides})
+        instance = ResponderInstance(name, port, server_name, instance_settings, app)
+        site = self._sites.get(port) or await self._open_site(port)
+        router = site["router"]
+        if instance.server_name in router.by_server_name or (not instance.server_name and router.default):
+            raise ValueError(f"端口 {port} 上已有相同主机名的实例")
+        router.add(instance)
+        self.instances[name] = instance
+        self._publish()
+        logger.info(f"实例 {name} 已在端口 {port} 就绪" + (f" (Host: {server_name})" if server_name else ""))
+        return instance
+
+    async def _remove(self, name: str) -> bool:
+        instance = self.instances.pop(name, None)
+        if not instance:
+            return False
+        site = self._sites.get(instance.port)
+        if site:
+            site["router"].remove(instance)
+            if not len(site["router"]):
+                await self._close_site(instance.port)
+        self._publish()
+        return True
+
+    async def _shutdown(self):
+        self.instances.clear()
+        for port in list(self._sites):
+            await self._close_site(port)
+        self._publish()
+
+    def _publish(self):
+        shared_state.set_component(
+            "responder_host", bool(self.instances), host=self.host,
+            instances=len(self.instances), ports=sorted(self._sites)
+        )
+
+    # ------------------------------------------------------------------ #
+    # 公共接口
+    # ------------------------------------------------------------------ #
+    def add_instance(self, name: str, port: int, server_name: Optional[str] = None,
+                     app=None, timeout: float = 10.0, **overrides: Any) -> ResponderInstance:
+        """
+        添加一个响应端实例，端口可接受连接后返回
+
+        Args:
+            name: 实例名称
+            port: 监听端口，多个实例可以共用一个端口
+            server_name: 虚拟主机名，共用端口时按Host头区分；为空时作为该端口的默认实例
+            app: 可选的独立ASGI应用，默认共用同一个FastAPI应用
+            timeout: 等待就绪的超时时间（秒）
+            **overrides: 覆盖该实例settings的字段，如 DID_DOCUMENTS_PATH，只能是 INSTANCE_SETTINGS 中的字段
+
+        Returns:
+            ResponderInstance: 新增的实例
+        """
+        return self._call(self._add(name, port, server_name, overrides, app), timeout)
+
+    async def add_instance_async(self, name: str, port: int, server_name: Optional[str] = None,
+                                 app=None, **overrides: Any) -> ResponderInstance:
+        """add_instance的可等待版本，可在任意事件循环中调用"""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._add(name, port, server_name, overrides, app), loop)
+        return await asyncio.wrap_future(future)
+
+    def remove_instance(self, name: str, timeout: float = 10.0) -> bool:
+        """
+        移除实例，端口上最后一个实例移除后关闭该端口
+
+        Returns:
+            bool: 实例是否存在
+        """
+        if name not in self.instances:
+            return False
+        return self._call(self._remove(name), timeout)
+
+    async def remove_instance_async(self, name: str) -> bool:
+        """remove_instance的可等待版本"""
+        if name not in self.instances:
+            return False
+        future = asyncio.run_coroutine_threadsafe(self._remove(name), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    def stop(self, timeout: float = 10.0):
+        """关闭所有端口并停止宿主事件循环"""
+        if self._loop is None:
+            return
+        self._call(self._shutdown(), timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop.close()
+        self._loop = None
+
+    def list_instances(self) -> List[Dict[str, Any]]:
+        """返回所有实例信息"""
+        return [instance.to_dict() for instance in self.instances.values()]
+
+
+# 全局单例
+responder_host = ResponderHost()
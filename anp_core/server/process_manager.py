@@ -0,0 +1,388 @@
+"""
+ANP响应端子进程管理：在受监督的子进程（或多个SO_REUSEPORT worker）中运行响应端，退出后自动重启
+"""
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from core.config import settings
+
+
+def _responder_main(host: str, port: int, conn, reuse_port: bool = False, uds: str = "", tcp: bool = True):
+    """子进程入口：启动响应端并通过conn与父进程通信"""
+    from core.config import settings as child_settings
+    child_settings.HOST = host
+    child_settings.PORT = port
+    child_settings.RESPONDER_UDS = uds
+    child_settings.RESPONDER_TCP = tcp
+    # 子进程内以线程模式运行uvicorn，避免再次派生子进程
+    child_settings.RESPONDER_MODE = "thread"
+    child_settings.RESPONDER_WORKERS = 1
+    child_settings.RESPONDER_REUSE_PORT = reuse_port
+    os.environ["PORT"] = str(port)
+
+    from anp_core.agent.anp_llm_adapter import register_message_listener
+    from anp_core.server.server import ANP_resp_start, ANP_resp_stop, server_status
+
+    # Connection不是线程安全的，消息来自服务器线程，指令应答来自主线程
+    send_lock = threading.Lock()
+
+    def send(message: Dict[str, Any]):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+
+    register_message_listener(lambda data, did: send({"type": "message", "data": data, "did": did}))
+
+    if not ANP_resp_start(port=port):
+        send({"type": "failed", "error": server_status.error or "启动超时"})
+        return
+    send({"type": "ready", "pid": os.getpid(), **server_status.to_dict()})
+
+    parent_pid = os.getppid()
+    try:
+        while server_status.is_running():
+            if os.getppid() != parent_pid:
+                # 父进程已退出，不再继续服务
+                break
+            if not conn.poll(0.5):
+                continue
+            command = conn.recv()
+            if command.get("type") == "stop":
+                break
+            if command.get("type") == "status":
+                send({"type": "status", "pid": os.getpid(), **server_status.to_dict()})
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        ANP_resp_stop()
+        send({"type": "stopped", "error": server_status.error})
+
+
+class ResponderProcess:
+    """在子进程中运行的单个响应端worker，负责监督和自动重启"""
+
+    def __init__(self, worker_id: int, host: str, port: int, reuse_port: bool = False, uds: str = "",
+                 max_restarts: int = 5, restart_backoff: float = 1.0,
+                 on_status: Optional[Callable[[], None]] = None,
+                 message_handlers: Optional[List[Callable[[Dict[str, Any], str], None]]] = None):
+        self.worker_id = worker_id
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.uds = uds
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.on_status = on_status
+        self.message_handlers = message_handlers if message_handlers is not None else []
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.restarts = 0
+        self.child_status: Dict[str, Any] = {}
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._should_run = False
+        self._ready = threading.Event()
+        self._exited = threading.Event()
+        self._supervisor: Optional[threading.Thread] = None
+
+    def is_running(self) -> bool:
+        """子进程是否存活且已就绪"""
+        return bool(self.process and self.process.is_alive() and self._ready.is_set())
+
+    def is_alive(self) -> bool:
+        """子进程是否存活（可能尚未就绪）"""
+        return bool(self.process and self.process.is_alive())
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        self._ready.clear()
+        self._exited.clear()
+        self.conn = parent_conn
+        self.process = self._ctx.Process(
+            target=_responder_main,
+            args=(self.host, self.port, child_conn, self.reuse_port, self.uds, settings.RESPONDER_TCP or not self.uds),
+            name=f"anp-responder-{self.port}-{self.worker_id}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def launch(self):
+        """启动子进程和监督线程，不等待就绪"""
+        with self._lock:
+            self.restarts = 0
+            self._should_run = True
+            self._spawn()
+            if not self._supervisor or not self._supervisor.is_alive():
+                self._supervisor = threading.Thread(
+                    target=self._supervise, name=f"anp-responder-supervisor-{self.worker_id}", daemon=True
+                )
+                self._supervisor.start()
+
+    def wait_ready(self, timeout: float) -> bool:
+        """
+        等待子进程就绪，就绪或子进程退出任意一个先发生即返回
+
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            bool: 是否已就绪
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._ready.wait(0.05):
+                return True
+            if self._exited.is_set():
+                break
+        return self._ready.is_set()
+
+    def stop(self, timeout: float = 5.0) -> bool:
+        """
+        停止子进程
+
+        Args:
+            timeout: 等待子进程退出的超时时间（秒）
+
+        Returns:
+            bool: 是否已停止
+        """
+        with self._lock:
+            self._should_run = False
+            process, conn = self.process, self.conn
+            if not process:
+                return True
+            try:
+                if conn and process.is_alive():
+                    conn.send({"type": "stop"})
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"worker {self.worker_id} 未在超时内退出，强制终止")
+                process.terminate()
+                process.join(1.0)
+            self._ready.clear()
+            return not process.is_alive()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回worker状态信息"""
+        return {
+            "worker_id": self.worker_id,
+            "running": self.is_running(),
+            "pid": self.process.pid if self.process else None,
+            "restarts": self.restarts,
+            "startup_latency_ms": self.child_status.get("startup_latency_ms"),
+            "error": self.child_status.get("error")
+        }
+
+    def _notify_status(self):
+        if self.on_status:
+            try:
+                self.on_status()
+            except Exception as e:
+                logger.error(f"更新响应端状态出错: {e}")
+
+    def _handle(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        if kind == "message":
+            for handler in self.message_handlers:
+                try:
+                    handler(message.get("data", {}), message.get("did"))
+                except Exception as e:
+                    logger.error(f"处理子进程消息事件出错: {e}")
+        elif kind in ("ready", "status"):
+            self.child_status = message
+            if kind == "ready":
+                logger.info(f"子进程响应端 [{message.get('pid')}] 已在端口 {self.port} 就绪")
+                self._ready.set()
+                self._notify_status()
+        elif kind in ("failed", "stopped"):
+            self.child_status = {**self.child_status, "error": message.get("error")}
+
+    def _supervise(self):
+        """读取子进程事件，子进程意外退出时按退避策略重启"""
+        while True:
+            process, conn = self.process, self.conn
+            if process is None:
+                return
+            try:
+                if conn.poll(0.2):
+                    self._handle(conn.recv())
+                    continue
+            except (EOFError, OSError):
+                # 管道关闭，等待进程真正退出
+                process.join(0.5)
+
+            if process.is_alive():
+                continue
+
+            self._ready.clear()
+            self._exited.set()
+            with self._lock:
+                if not self._should_run:
+                    return
+                was_ready = bool(self.child_status.get("running"))
+                self._notify_status()
+                if not was_ready or self.restarts >= self.max_restarts:
+                    logger.error(f"子进程响应端退出 (exitcode={process.exitcode})，不再重启")
+                    self._should_run = False
+                    return
+                self.restarts += 1
+                delay = self.restart_backoff * (2 ** (self.restarts - 1))
+                logger.warning(f"子进程响应端退出 (exitcode={process.exitcode})，{delay:.1f}秒后第{self.restarts}次重启")
+            time.sleep(delay)
+            with self._lock:
+                if not self._should_run:
+                    return
+                self._spawn()
+
+
+class ResponderPool:
+    """管理一个或多个响应端worker进程，并把汇总状态写入server_status和共享状态"""
+
+    def __init__(self, max_restarts: int = 5, restart_backoff: float = 1.0):
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.host = settings.HOST
+        self.port = None
+        self.uds = ""
+        self.workers: List[ResponderProcess] = []
+        self.message_handlers: List[Callable[[Dict[str, Any], str], None]] = []
+        self._lock = threading.Lock()
+        self._status_lock = threading.Lock()
+
+    def add_message_handler(self, handler: Callable[[Dict[str, Any], str], None]):
+        """注册父进程侧的消息事件处理函数，参数为 (message_data, did)"""
+        self.message_handlers.append(handler)
+
+    def is_running(self) -> bool:
+        """是否有已就绪的worker"""
+        return any(worker.is_running() for worker in self.workers)
+
+    def is_alive(self) -> bool:
+        """是否有存活的worker进程"""
+        return any(worker.is_alive() for worker in self.workers)
+
+    def start(self, port: Optional[int] = None, timeout: float = 15.0, workers: Optional[int] = None) -> bool:
+        """
+        启动worker进程并等待全部就绪
+
+        Args:
+            port: 可选的服务器端口号
+            timeout: 等待就绪的超时时间（秒）
+            workers: worker数量，默认使用 settings.RESPONDER_WORKERS
+
+        Returns:
+            bool: 响应端是否成功启动
+        """
+        with self._lock:
+            if self.is_running():
+                return True
+            count = max(1, workers or settings.RESPONDER_WORKERS)
+            self.port = int(port) if port else settings.PORT
+            self.host = settings.HOST
+            reuse_port = count > 1 or settings.RESPONDER_REUSE_PORT
+            self.uds = settings.RESPONDER_UDS
+            if self.uds and count > 1:
+                # 同一个套接字路径只能由一个进程绑定
+                logger.warning(f"多worker模式不支持Unix域套接字，忽略 RESPONDER_UDS={self.uds}，只监听TCP端口")
+                self.uds = ""
+            self.workers = [
+                ResponderProcess(
+                    worker_id, self.host, self.port, reuse_port=reuse_port, uds=self.uds,
+                    max_restarts=self.max_restarts, restart_backoff=self.restart_backoff,
+                    on_status=self._publish_status, message_handlers=self.message_handlers
+                )
+                for worker_id in range(count)
+            ]
+            for worker in self.workers:
+                worker.launch()
+
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if not worker.wait_ready(max(0.0, deadline - time.monotonic())):
+                logger.error(f"子进程响应端启动失败: {worker.child_status.get('error') or '等待就绪超时'}")
+                self.stop()
+                return False
+        if count > 1:
+            logger.info(f"{count} 个worker已在端口 {self.port} 就绪 (SO_REUSEPORT)")
+        return True
+
+    def stop(self, timeout: float = 5.0) -> bool:
+        """
+        停止所有worker进程
+
+        Args:
+            timeout: 等待每个worker退出的超时时间（秒）
+
+        Returns:
+            bool: 是否全部停止
+        """
+        with self._lock:
+            if not self.workers:
+                return True
+            # 先通知全部worker退出，再逐个等待
+            stoppers = [threading.Thread(target=worker.stop, args=(timeout,)) for worker in self.workers]
+            for stopper in stoppers:
+                stopper.start()
+            for stopper in stoppers:
+                stopper.join()
+            stopped = not self.is_alive()
+            self._publish_status()
+            return stopped
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回进程模式的状态信息"""
+        workers = [worker.to_dict() for worker in self.workers]
+        latencies = [w["startup_latency_ms"] for w in workers if w["startup_latency_ms"]]
+        errors = [w["error"] for w in workers if w["error"]]
+        return {
+            "mode": "process",
+            "running": self.is_running(),
+            "port": self.port,
+            "workers": len(workers),
+            "workers_running": sum(1 for w in workers if w["running"]),
+            "pids": [w["pid"] for w in workers],
+            "restarts": sum(w["restarts"] for w in workers),
+            "startup_latency_ms": max(latencies) if latencies else None,
+            "error": errors[0] if errors else None
+        }
+
+    def _publish_status(self):
+        """把汇总状态同步到本进程的server_status和跨进程共享状态"""
+        from anp_core.server.server import server_status
+        from anp_core.store.state_store import shared_state
+        with self._status_lock:
+            status = self.to_dict()
+            server_status.running = status["running"]
+            server_status.port = self.port
+            server_status.uds = self.uds or None
+            latency = status["startup_latency_ms"]
+            server_status.startup_latency = latency / 1000 if latency else None
+            server_status.error = status["error"]
+            shared_state.set_component(
+                "server", status["running"], port=self.port, host=self.host,
+                mode="process", workers=status["workers"], workers_running=status["workers_running"],
+                child_pids=status["pids"], restarts=status["restarts"],
+                startup_latency=server_status.startup_latency, uds=self.uds or None
+            )
+
+
+def _forward_to_resp_messages(message_data: Dict[str, Any], did: str):
+    """把子进程的消息事件加入父进程的全局消息列表，供聊天线程和MCP监听器使用"""
+    from anp_core.agent.anp_llm_adapter import publish_resp_message
+    publish_resp_message(message_data)
+
+
+# 全局单例
+responder_pool = ResponderPool(max_restarts=settings.RESPONDER_MAX_RESTARTS)
+responder_pool.add_message_handler(_forward_to_resp_messages)
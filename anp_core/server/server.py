@@ -7,6 +7,8 @@ import logging
 import uvicorn
 import asyncio
 import signal
+import socket
+import sys
 import threading
 import time
 
@@ -15,6 +17,9 @@ from fastapi import FastAPI
 
 from core.config import settings
 from core.app import create_app
+from anp_core.store.state_store import shared_state
+from anp_core.store.did_index import get_did_index
+from anp_core.auth.remote_resolver import remote_resolver
 
 # 服务器状态管理类
 class ServerStatus:
@@ -24,6 +29,16 @@ class ServerStatus:
         self.port = None
         self.thread = None
         self.instance = None
+        # 额外监听的Unix域套接字路径
+        self.uds = None
+        # 线程模式下响应端的事件循环，供进程内ASGI传输把请求分派到该循环
+        self.loop = None
+        # 启动就绪信号：uvicorn完成socket绑定后设置ready，启动结束（成功或失败）后设置startup_done
+        self.ready = threading.Event()
+        self.startup_done = threading.Event()
+        self.startup_began = None
+        self.startup_latency = None
+        self.error = None
     
     def set_running(self, status, port=None):
         """设置服务器运行状态
@@ -35,6 +50,11 @@ class ServerStatus:
         self.running = status
         if port:
             self.port = port
+        # 同步到跨进程共享状态，供其他MCP进程读取
+        shared_state.set_component(
+            "server", status, port=self.port, host=settings.HOST,
+            startup_latency=self.startup_latency, uds=self.uds
+        )
     
     def is_running(self):
         """获取服务器运行状态
@@ -44,6 +64,64 @@ class ServerStatus:
         """
         return self.running
 
+    def begin_startup(self):
+        """重置就绪信号，开始一次新的启动"""
+        self.ready.clear()
+        self.startup_done.clear()
+        self.startup_began = time.perf_counter()
+        self.startup_latency = None
+        self.error = None
+
+    def mark_ready(self, port):
+        """uvicorn已绑定端口并完成lifespan启动"""
+        self.startup_latency = time.perf_counter() - self.startup_began
+        self.set_running(True, port)
+        self.ready.set()
+        self.startup_done.set()
+        logger.info(f"服务器已在端口 {port} 就绪，启动耗时 {self.startup_latency * 1000:.1f} ms")
+
+    def mark_stopped(self, error=None):
+        """服务器线程退出（正常停止或启动失败）"""
+        if error:
+            self.error = error
+        self.ready.clear()
+        self.set_running(False)
+        self.startup_done.set()
+
+    def wait_started(self, timeout=None):
+        """等待启动结束
+        
+        Args:
+            timeout: 超时时间（秒）
+            
+        Returns:
+            bool: 服务器是否已就绪
+        """
+        self.startup_done.wait(timeout)
+        return self.ready.is_set()
+
+    def to_dict(self):
+        """返回状态信息"""
+        return {
+            "running": self.running,
+            "port": self.port,
+            "uds": self.uds,
+            "startup_latency_ms": round(self.startup_latency * 1000, 1) if self.startup_latency else None,
+            "error": self.error
+        }
+
+
+class ReadinessServer(uvicorn.Server):
+    """在socket绑定完成后回调通知的uvicorn服务器"""
+    def __init__(self, config, on_ready):
+        super().__init__(config)
+        self.on_ready = on_ready
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started and not self.should_exit:
+            self.on_ready()
+
 # 创建全局单例
 server_status = ServerStatus()
 
@@ -67,109 +145,293 @@ async def root():
         "service": "DID WBA Example",
         "version": "0.1.0",
         "mode": "Server",
-        "documentation": "/docs"
+        "documentation": "/docs",
+        "did_index": get_did_index().stats(),
+        "did_resolver": remote_resolver.stats()
     }
 
 
-def ANP_resp_start(port=None):
-    """启动DID WBA服务器
+def bind_socket(host, port, reuse_port=False):
+    """创建已绑定的监听socket，绑定错误以OSError抛出而不是uvicorn的sys.exit
+    
+    reuse_port为True时设置SO_REUSEPORT，多个worker进程可绑定同一端口，由内核分发连接
     
     Args:
-        port: 可选的服务器端口号
+        host: 监听地址
+        port: 监听端口
+        reuse_port: 是否设置SO_REUSEPORT
         
     Returns:
-        bool: 服务器是否成功启动
+        socket.socket: 已绑定的socket
     """
-    global server_status
+    if reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("当前平台不支持SO_REUSEPORT")
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    # localhost同时解析出IPv4/IPv6时优先IPv4，与客户端默认连接地址一致
+    family, _, _, _, address = next((info for info in infos if info[0] == socket.AF_INET), infos[0])
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    # 由我们传入的监听socket接受的连接不会被设置TCP_NODELAY，小响应会遇到约40ms的延迟ACK；
+    # 在监听socket上设置，accept得到的连接会继承
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        sock.bind(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def bind_unix_socket(path):
+    """创建已绑定的Unix域监听socket
+    
+    路径上已有套接字文件时先探测：仍有进程在监听则报错，否则视为上次异常退出留下的文件并删除
+    
+    Args:
+        path: 套接字文件路径
+        
+    Returns:
+        socket.socket: 已绑定的socket
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("当前平台不支持Unix域套接字")
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            raise OSError(f"Unix域套接字 {path} 正在被其他进程使用")
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        # 只允许同一用户和用户组的本机agent连接
+        os.chmod(path, 0o660)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _bind_sockets(port):
+    """按配置创建监听socket，只用TCP且不需要SO_REUSEPORT时返回None，由uvicorn自行绑定"""
+    uds = settings.RESPONDER_UDS
+    if not uds and not settings.RESPONDER_TCP:
+        raise RuntimeError("RESPONDER_TCP=false 时必须设置 RESPONDER_UDS")
+    if not uds and not settings.RESPONDER_REUSE_PORT:
+        return None
+    sockets = []
+    try:
+        if settings.RESPONDER_TCP:
+            # 多worker模式下每个进程各自绑定同一端口
+            sockets.append(bind_socket(settings.HOST, port, reuse_port=settings.RESPONDER_REUSE_PORT))
+        if uds:
+            sockets.append(bind_unix_socket(uds))
+    except Exception:
+        for sock in sockets:
+            sock.close()
+        raise
+    return sockets
+
+
+def _launch_server(port=None):
+    """创建uvicorn服务器并在后台线程中启动，不等待就绪
     
+    Args:
+        port: 可选的服务器端口号
+    """
+    # 端口记录在 server_status 和应用自己的settings上，不修改全局settings
+    bind_port = port or settings.PORT
+    server_status.port = bind_port
+    app.state.settings = settings if bind_port == settings.PORT else settings.model_copy(update={"PORT": bind_port})
+
+    # 创建uvicorn配置
+    config = uvicorn.Config(
+        "anp_core.server.server:app",
+        host=settings.HOST,
+        port=bind_port,
+        use_colors=True,
+        log_level="error"
+    )
+    sockets = _bind_sockets(bind_port)
+    server_status.uds = settings.RESPONDER_UDS or None
+
+    # 创建服务器实例，绑定成功后才标记为运行中
+    server_status.begin_startup()
+    server_status.instance = ReadinessServer(config, on_ready=lambda: server_status.mark_ready(bind_port))
+
+    # 创建并启动服务器线程，使用自定义的非阻塞运行方法
+    def run_server_nonblocking():
+        # 使用底层的serve方法而不是run方法
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server_status.loop = loop
+        error = None
+        try:
+            loop.run_until_complete(server_status.instance.serve(sockets=sockets))
+            if not server_status.instance.started:
+                error = f"端口 {bind_port} 启动失败"
+        except SystemExit:
+            # 端口占用等绑定错误时uvicorn会调用sys.exit(1)
+            error = f"端口 {bind_port} 绑定失败"
+            logger.error(error)
+        except Exception as e:
+            error = f"服务器运行出错: {e}"
+            logger.error(error)
+        finally:
+            server_status.loop = None
+            if server_status.uds and sockets:
+                try:
+                    os.unlink(server_status.uds)
+                except OSError:
+                    pass
+            server_status.mark_stopped(error)
+            # 启动失败时lifespan任务可能仍挂起，关闭循环前先取消
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    server_status.thread = threading.Thread(target=run_server_nonblocking, name="anp-responder")
+    server_status.thread.daemon = True
+    server_status.thread.start()
+
+
+def _get_process_manager():
+    """延迟导入子进程管理器，线程模式下不加载multiprocessing相关代码"""
+    from anp_core.server.process_manager import responder_pool
+    return responder_pool
+
+
+def _process_mode_active(mode=None, workers=None):
+    """判断本次启动/停止是否使用进程模式，多worker总是以进程模式运行"""
+    if (mode or settings.RESPONDER_MODE) == "process" or (workers or settings.RESPONDER_WORKERS) > 1:
+        return True
+    # 以进程模式启动后切换了配置，停止时仍需交给子进程管理器
+    manager = sys.modules.get("anp_core.server.process_manager")
+    return bool(manager and manager.responder_pool.is_alive())
+
+
+def ANP_resp_start(port=None, timeout=10.0, mode=None, workers=None):
+    """启动DID WBA服务器，在端口可接受连接后返回
+
+    Args:
+        port: 可选的服务器端口号
+        timeout: 等待就绪的超时时间（秒）
+        mode: 运行模式 thread/process，默认使用 settings.RESPONDER_MODE
+        workers: worker进程数，默认使用 settings.RESPONDER_WORKERS
+
+    Returns:
+        bool: 服务器是否成功启动
+    """
     # 检查服务器是否已经在运行
     if server_status.is_running():
         logger.warning("服务器已经在运行中")
         return True
-    
-    # 如果指定了端口，更新设置
-    if port:
-        settings.PORT = port
-        server_status.port = port
-    
+
+    if _process_mode_active(mode, workers):
+        return _get_process_manager().start(port, timeout=timeout, workers=workers)
+
     try:
-        # 创建uvicorn配置
-        config = uvicorn.Config(
-            "anp_core.server.server:app",
-            host=settings.HOST,
-            port=settings.PORT,
-            reload=settings.DEBUG,
-            use_colors=True,
-            log_level="error"
-        )
-        
-        # 创建服务器实例
-        server_status.instance = uvicorn.Server(config)
-        server_status.instance.should_exit = False
-        
-        # 设置服务器状态
-        server_status.set_running(True, settings.PORT)
-        
-        # 创建并启动服务器线程，使用自定义的非阻塞运行方法
-        def run_server_nonblocking():
-            # 使用底层的serve方法而不是run方法
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(server_status.instance.serve())
-            except Exception as e:
-                logger.error(f"服务器运行出错: {e}")
-                server_status.set_running(False)
-            finally:
-                loop.close()
-        
-        server_status.thread = threading.Thread(target=run_server_nonblocking)
-        server_status.thread.daemon = True
-        server_status.thread.start()
-        
-        # 等待服务器启动
-        for _ in range(10):
-            if server_status.is_running():
-                logger.info(f"服务器已在端口 {settings.PORT} 启动")
-                return True
-            time.sleep(0.5)
-        
-        logger.error("服务器启动超时")
+        _launch_server(port)
+    except Exception as e:
+        logger.error(f"启动服务器时出错: {e}")
+        server_status.error = f"启动服务器时出错: {e}"
+        server_status.set_running(False)
         return False
+
+    if server_status.wait_started(timeout):
+        return True
+    logger.error(f"服务器启动失败: {server_status.error or '等待就绪超时'}")
+    return False
+
+
+async def ANP_resp_start_async(port=None, timeout=10.0, mode=None, workers=None):
+    """ANP_resp_start的可等待版本，不阻塞调用方事件循环
+
+    Args:
+        port: 可选的服务器端口号
+        timeout: 等待就绪的超时时间（秒）
+        mode: 运行模式 thread/process，默认使用 settings.RESPONDER_MODE
+        workers: worker进程数，默认使用 settings.RESPONDER_WORKERS
+
+    Returns:
+        bool: 服务器是否成功启动
+    """
+    if server_status.is_running():
+        logger.warning("服务器已经在运行中")
+        return True
+
+    if _process_mode_active(mode, workers):
+        return await asyncio.to_thread(_get_process_manager().start, port, timeout, workers)
+
+    try:
+        _launch_server(port)
     except Exception as e:
         logger.error(f"启动服务器时出错: {e}")
+        server_status.error = f"启动服务器时出错: {e}"
         server_status.set_running(False)
         return False
 
+    if await asyncio.to_thread(server_status.wait_started, timeout):
+        return True
+    logger.error(f"服务器启动失败: {server_status.error or '等待就绪超时'}")
+    return False
 
-def ANP_resp_stop():
+
+def ANP_resp_stop(timeout=5.0):
     """停止DID WBA服务器
     
+    Args:
+        timeout: 等待服务器线程退出的超时时间（秒）
+    
     Returns:
         bool: 服务器是否成功停止
     """
-    global server_status
-    
     if not server_status.is_running():
         logger.warning("服务器未运行")
         return True
-    
+
+    if _process_mode_active():
+        stopped = _get_process_manager().stop(timeout)
+        if stopped:
+            logger.info("服务器已停止")
+        return stopped
+
     try:
-        # 发送停止信号给服务器
+        # 发送停止信号给服务器，uvicorn主循环会在下一个tick退出
         if server_status.instance:
             server_status.instance.should_exit = True
-            # 确保信号被处理
-            time.sleep(0.5)
-        
-        # 标记服务器状态为已停止
-        server_status.set_running(False)
         
-        # 等待服务器线程结束
+        # 等待服务器线程结束，线程退出时会更新状态
         if server_status.thread and server_status.thread.is_alive():
-            server_status.thread.join(timeout=5.0)  # 设置超时时间，避免无限等待
-            
+            server_status.thread.join(timeout=timeout)
+        if server_status.thread and server_status.thread.is_alive():
+            logger.error("等待服务器线程退出超时")
+            return False
+        
+        server_status.set_running(False)
         logger.info("服务器已停止")
         return True
     except Exception as e:
         logger.error(f"停止服务器时出错: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+async def ANP_resp_stop_async(timeout=5.0):
+    """ANP_resp_stop的可等待版本，不阻塞调用方事件循环
+    
+    Args:
+        timeout: 等待服务器线程退出的超时时间（秒）
+    
+    Returns:
+        bool: 服务器是否成功停止
+    """
+    return await asyncio.to_thread(ANP_resp_stop, timeout)
@@ -0,0 +1,206 @@
+"""
+跨worker共享的鉴权状态（nonce和DID文档缓存），保存在本机SQLite WAL文件中
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+from anp_core.store.history_store import resolve_db_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nonces (
+    nonce TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    ts REAL NOT NULL,
+    PRIMARY KEY (kind, nonce)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_nonces_ts ON nonces(ts);
+CREATE TABLE IF NOT EXISTS did_documents (
+    did TEXT PRIMARY KEY,
+    document TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    etag TEXT
+);
+"""
+
+# nonce类型：服务端签发的nonce / 客户端请求中已使用过的nonce
+SERVER_NONCE = "server"
+SEEN_NONCE = "seen"
+
+
+class SharedAuthState:
+    """基于SQLite WAL的鉴权状态存储，每个线程持有一个长连接"""
+
+    def __init__(self, db_path: str, nonce_ttl: float, did_cache_ttl: float, prune_interval: float = 30.0,
+                 did_stale_ttl: float = 0.0):
+        self.db_path = resolve_db_path(db_path)
+        self.nonce_ttl = nonce_ttl
+        self.did_cache_ttl = did_cache_ttl
+        # 过期的DID文档再保留这么久，用ETag向对端确认是否变化，未变化时不必重新下载
+        self.did_stale_ttl = did_stale_ttl
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._last_prune = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with self._schema_lock:
+                    conn.executescript(_SCHEMA)
+                    columns = {row[1] for row in conn.execute("PRAGMA table_info(did_documents)")}
+                    if "etag" not in columns:
+                        # 早期版本创建的数据库没有etag列
+                        conn.execute("ALTER TABLE did_documents ADD COLUMN etag TEXT")
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        """定期删除过期nonce和DID文档，每个进程最多每 prune_interval 秒执行一次"""
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        conn.execute("DELETE FROM nonces WHERE ts < ?", (now - self.nonce_ttl,))
+        conn.execute("DELETE FROM did_documents WHERE fetched_at < ?", (now - self.did_cache_ttl - self.did_stale_ttl,))
+
+    # ------------------------------------------------------------------ #
+    # nonce
+    # ------------------------------------------------------------------ #
+    def add_server_nonce(self, nonce: str):
+        """登记服务端签发的nonce"""
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO nonces (nonce, kind, ts) VALUES (?, ?, ?)", (nonce, SERVER_NONCE, now))
+            self._prune(conn, now)
+        except Exception as e:
+            logging.error(f"写入nonce失败: {e}")
+
+    def get_server_nonce_time(self, nonce: str) -> Optional[float]:
+        """返回服务端nonce的签发时间（epoch秒），未登记时返回None"""
+        try:
+            row = self._conn().execute(
+                "SELECT ts FROM nonces WHERE kind = ? AND nonce = ?", (SERVER_NONCE, nonce)
+            ).fetchone()
+        except Exception as e:
+            logging.error(f"读取nonce失败: {e}")
+            return None
+        return row[0] if row else None
+
+    def consume_nonce(self, nonce: str) -> bool:
+        """
+        登记客户端请求中的nonce，用于防重放
+
+        Args:
+            nonce: 请求头中的nonce
+
+        Returns:
+            bool: 首次出现返回True，有效期内已被任一worker使用过返回False
+        """
+        now = time.time()
+        try:
+            conn = self._conn()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO nonces (nonce, kind, ts) VALUES (?, ?, ?)", (nonce, SEEN_NONCE, now)
+            )
+            if cursor.rowcount == 0:
+                # 过期记录尚未清理时允许复用
+                row = conn.execute(
+                    "SELECT ts FROM nonces WHERE kind = ? AND nonce = ?", (SEEN_NONCE, nonce)
+                ).fetchone()
+                if row and now - row[0] <= self.nonce_ttl:
+                    return False
+                conn.execute("UPDATE nonces SET ts = ? WHERE kind = ? AND nonce = ?", (now, SEEN_NONCE, nonce))
+            self._prune(conn, now)
+            return True
+        except Exception as e:
+            # 共享存储不可用时不阻断鉴权，时间戳校验仍然有效
+            logging.error(f"登记nonce失败: {e}")
+            return True
+
+    # ------------------------------------------------------------------ #
+    # DID文档缓存
+    # ------------------------------------------------------------------ #
+    def get_did_document(self, did: str) -> Optional[Dict[str, Any]]:
+        """读取未过期的DID文档缓存"""
+        if self.did_cache_ttl <= 0:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT document, fetched_at FROM did_documents WHERE did = ?", (did,)
+            ).fetchone()
+        except Exception as e:
+            logging.error(f"读取DID文档缓存失败: {e}")
+            return None
+        if not row or time.time() - row[1] > self.did_cache_ttl:
+            return None
+        return json.loads(row[0])
+
+    def get_did_document_entry(self, did: str) -> Optional[Tuple[Dict[str, Any], Optional[str], bool]]:
+        """
+        读取DID文档缓存，包括已过期但仍可用ETag重新确认的条目
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], Optional[str], bool]]: (DID文档, ETag, 是否未过期)，没有缓存时返回None
+        """
+        if self.did_cache_ttl <= 0:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT document, fetched_at, etag FROM did_documents WHERE did = ?", (did,)
+            ).fetchone()
+        except Exception as e:
+            logging.error(f"读取DID文档缓存失败: {e}")
+            return None
+        if not row:
+            return None
+        age = time.time() - row[1]
+        if age > self.did_cache_ttl and (not row[2] or age > self.did_cache_ttl + self.did_stale_ttl):
+            return None
+        return json.loads(row[0]), row[2], age <= self.did_cache_ttl
+
+    def put_did_document(self, did: str, document: Dict[str, Any], etag: Optional[str] = None):
+        """写入DID文档缓存，etag为对端返回的ETag（包含文档版本号），过期后用于条件请求"""
+        if self.did_cache_ttl <= 0:
+            return
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO did_documents (did, document, fetched_at, etag) VALUES (?, ?, ?, ?)",
+                (did, json.dumps(document, ensure_ascii=False), time.time(), etag)
+            )
+        except Exception as e:
+            logging.error(f"写入DID文档缓存失败: {e}")
+
+    def touch_did_document(self, did: str):
+        """对端确认DID文档未变化（304）后重新计算缓存有效期"""
+        try:
+            self._conn().execute("UPDATE did_documents SET fetched_at = ? WHERE did = ?", (time.time(), did))
+        except Exception as e:
+            logging.error(f"更新DID文档缓存失败: {e}")
+
+    def invalidate_did_document(self, did: str):
+        """删除DID文档缓存，DID文档更新后调用"""
+        try:
+            self._conn().execute("DELETE FROM did_documents WHERE did = ?", (did,))
+        except Exception as e:
+            logging.error(f"删除DID文档缓存失败: {e}")
+
+
+# 全局单例
+auth_state = SharedAuthState(
+    settings.AUTH_STATE_DB_PATH,
+    nonce_ttl=settings.NONCE_EXPIRATION_MINUTES * 60,
+    did_cache_ttl=settings.DID_CACHE_TTL,
+    did_stale_ttl=settings.DID_CACHE_STALE_TTL
+)
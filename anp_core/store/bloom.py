@@ -0,0 +1,62 @@
+"""布隆过滤器
+
+判断一个键是否"可能存在"：返回False时键一定不存在，返回True时有一定概率误判（假阳性）。
+位数组大小和哈希次数按预期容量和目标假阳性率计算，每个键取一次blake2b摘要，用双重哈希得到k个位置。
+"""
+import hashlib
+import math
+from typing import Any, Dict, Iterable
+
+
+class BloomFilter:
+    """固定大小的布隆过滤器，不支持删除"""
+
+    def __init__(self, capacity: int, fpr: float = 0.01):
+        """
+        Args:
+            capacity: 预期键数量，超出后假阳性率上升
+            fpr: 达到预期容量时的目标假阳性率
+        """
+        self.capacity = max(capacity, 1)
+        self.target_fpr = min(max(fpr, 1e-9), 0.5)
+        self.num_bits = max(int(-self.capacity * math.log(self.target_fpr) / math.log(2) ** 2), 8)
+        self.num_hashes = max(round(self.num_bits / self.capacity * math.log(2)), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        """加入一个键"""
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]):
+        """加入多个键"""
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_fpr(self) -> float:
+        """按当前键数量估算的假阳性率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": self.count,
+            "capacity": self.capacity,
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "bytes": len(self._bits),
+            "target_fpr": self.target_fpr,
+            "estimated_fpr": round(self.estimated_fpr(), 6),
+        }
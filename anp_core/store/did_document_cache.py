@@ -0,0 +1,180 @@
+"""
+对外提供的DID文档缓存：按用户缓存序列化好的 did.json 响应体及其ETag和修改时间
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from anp_core.store.did_store import DIDStore
+from anp_core.store.did_versions import get_did_versions
+
+
+class ServedDocument:
+    """一个已序列化的DID文档响应"""
+
+    __slots__ = ("body", "etag", "last_modified", "mtime", "version", "checked_at")
+
+    def __init__(self, body: bytes, mtime: float, version: int = 0):
+        self.body = body
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = f'"v{version}-{digest[:24]}"' if version else f'"{digest[:32]}"'
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.mtime = mtime
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def not_modified(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """
+        判断条件请求是否可以返回304
+
+        If-None-Match 存在时只按ETag比较（弱比较），否则按 If-Modified-Since 比较（秒级精度）
+        """
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+        if if_modified_since:
+            try:
+                return int(self.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def version_from_etag(etag: Optional[str]) -> Optional[int]:
+    """
+    从 "v<版本>-<哈希>" 形式的ETag（如If-Match请求头）中取出版本号
+
+    Returns:
+        Optional[int]: 版本号，不是版本ETag时返回None
+    """
+    tag = (etag or "").strip().removeprefix("W/").strip('"')
+    version, sep, _ = tag.partition("-")
+    if not sep or not version.startswith("v") or not version[1:].isdigit():
+        return None
+    return int(version[1:])
+
+
+def _compact(document: Dict[str, Any]) -> bytes:
+    # 与FastAPI的JSONResponse相同的紧凑格式
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class DIDDocumentCache:
+    """一个DID存储之上的响应缓存"""
+
+    def __init__(self, store: DIDStore, max_entries: Optional[int] = None,
+                 revalidate_after: Optional[float] = None):
+        self.store = store
+        self.max_entries = max(max_entries or settings.DID_DOCUMENT_CACHE_SIZE, 1)
+        self.revalidate_after = settings.DID_DOCUMENT_CACHE_REVALIDATE if revalidate_after is None else revalidate_after
+        # 键为用户ID（当前版本）或 (用户ID, 版本号)（历史版本）
+        self._entries: "OrderedDict[Any, ServedDocument]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "loads": 0, "revalidations": 0, "stale": 0, "not_found": 0}
+
+    def _load(self, user_id: str) -> Optional[ServedDocument]:
+        record = self.store.get_record(user_id)
+        if record is None:
+            self._stats["not_found"] += 1
+            return None
+        raw, mtime = record
+        # 文档可能由其他进程修改，重新加载时同时刷新版本号
+        version = get_did_versions(self.store).current_version(user_id, refresh=True)
+        self._stats["loads"] += 1
+        return ServedDocument(_compact(json.loads(raw)), mtime, version or 1)
+
+    def get(self, user_id: str) -> Optional[ServedDocument]:
+        """
+        返回用户的DID文档响应，文档不存在时返回None
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            Optional[ServedDocument]: 已序列化的文档及其ETag和Last-Modified
+        """
+        with self._lock:
+            served = self._entries.get(user_id)
+            if served is not None:
+                self._entries.move_to_end(user_id)
+        if served is not None:
+            now = time.monotonic()
+            if now - served.checked_at < self.revalidate_after:
+                self._stats["hits"] += 1
+                return served
+            self._stats["revalidations"] += 1
+            if self.store.modified_at(user_id) == served.mtime:
+                served.checked_at = now
+                self._stats["hits"] += 1
+                return served
+            self._stats["stale"] += 1
+
+        served = self._load(user_id)
+        with self._lock:
+            if served is None:
+                self._entries.pop(user_id, None)
+                return None
+            self._entries[user_id] = served
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return served
+
+    def get_version(self, user_id: str, version: int) -> Optional[ServedDocument]:
+        """
+        返回用户DID文档的历史版本响应，版本不存在时返回None
+
+        Args:
+            user_id: 用户ID
+            version: 版本号
+
+        Returns:
+            Optional[ServedDocument]: 已序列化的该版本文档
+        """
+        key = (user_id, version)
+        with self._lock:
+            served = self._entries.get(key)
+            if served is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return served
+        loaded = get_did_versions(self.store).get_version(user_id, version)
+        if loaded is None:
+            self._stats["not_found"] += 1
+            return None
+        document, created_at = loaded
+        served = ServedDocument(_compact(document), created_at, version)
+        self._stats["loads"] += 1
+        with self._lock:
+            self._entries[key] = served
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return served
+
+    def invalidate(self, user_id: str):
+        """丢弃用户的缓存条目，文档被修改后调用"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, **self._stats}
+
+
+_caches: Dict[int, DIDDocumentCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_document_cache(store: DIDStore) -> DIDDocumentCache:
+    """返回DID存储对应的响应缓存，每个存储一个"""
+    cache = _caches.get(id(store))
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(id(store))
+            if cache is None:
+                cache = _caches[id(store)] = DIDDocumentCache(store)
+    return cache
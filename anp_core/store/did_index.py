@@ -0,0 +1,297 @@
+"""
+本地DID文档的内存索引：按DID查找，按修改时间轮询刷新，并用布隆过滤器排除本地不存在的用户ID
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from core.config import settings, Settings
+from anp_core.store.bloom import BloomFilter
+from anp_core.store.did_store import DIDStore, get_did_store, user_id_from_did
+
+
+class DIDIndex:
+    """一个DID存储的内存索引，DID到DID文档"""
+
+    def __init__(self, store: DIDStore, poll_interval: Optional[float] = None, eager_limit: Optional[int] = None):
+        self.store = store
+        self.poll_interval = settings.DID_INDEX_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.eager_limit = settings.DID_INDEX_EAGER_LIMIT if eager_limit is None else eager_limit
+        self._by_did: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # 用户ID -> (修改时间, DID)，包括id不符、不能按DID查找的文档
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.loaded = threading.Event()
+        # 是否预加载了全部文档；否则只包含查找过的文档
+        self.complete = False
+        self.load_seconds: Optional[float] = None
+        self._stats = {"hits": 0, "misses": 0, "store_hits": 0, "reloads": 0, "removed": 0, "polls": 0}
+        # 过滤器未建好之前不拒绝任何ID
+        self.filter: Optional[BloomFilter] = None
+        self.filter_rebuilt_at = 0.0
+        self._rebuild_writes: Optional[List[str]] = None
+        # 存储新建记录的游标，之后其他进程新建的用户ID由 sync_filter 并入过滤器
+        self._created_cursor: Optional[int] = None
+        self._filter_stats = {"rejected": 0, "passed": 0, "false_positives": 0, "merged": 0, "rebuilds": 0}
+        store.add_write_listener(self._on_write)
+
+    def _add(self, user_id: str, raw: bytes, mtime: float) -> Optional[Dict[str, Any]]:
+        try:
+            document = json.loads(raw)
+        except ValueError as e:
+            logging.error(f"DID文档格式错误 ({user_id}): {e}")
+            self._remove(user_id)
+            return None
+        did = document.get("id")
+        # id与用户目录不符的文档不能按DID查到，仍记录修改时间以免每轮扫描都重新读取
+        if not did or user_id_from_did(did) != user_id:
+            did = None
+        with self._lock:
+            previous = self._entries.get(user_id)
+            if previous and previous[1] and previous[1] != did:
+                self._by_did.pop(previous[1], None)
+            if did:
+                self._by_did[did] = (user_id, document)
+            self._entries[user_id] = (mtime, did)
+        return document
+
+    def _remove(self, user_id: str):
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous and previous[1]:
+                self._by_did.pop(previous[1], None)
+                self._stats["removed"] += 1
+
+    def _on_write(self, user_id: str):
+        bloom = self.filter
+        if bloom is not None:
+            bloom.add(user_id)
+        if self._rebuild_writes is not None:
+            self._rebuild_writes.append(user_id)
+
+    def rebuild_filter(self, user_ids: Optional[List[str]] = None):
+        """
+        按存储中的全部用户ID重建布隆过滤器，容量留出 DID_BLOOM_HEADROOM 倍余量
+
+        Args:
+            user_ids: 已知的全部用户ID，省略时扫描存储
+        """
+        # 扫描开始后本进程写入的ID在替换后补入新过滤器，其他进程新建的ID由新建记录补入
+        self._rebuild_writes = []
+        cursor, _ = self.store.created_since(None)
+        if user_ids is None:
+            user_ids = [user_id for user_id, _ in self.store.iter_modified_times()]
+        capacity = max(int(len(user_ids) * settings.DID_BLOOM_HEADROOM), settings.DID_BLOOM_MIN_CAPACITY)
+        bloom = BloomFilter(capacity, settings.DID_BLOOM_FPR)
+        bloom.update(user_ids)
+        self.filter = bloom
+        written, self._rebuild_writes = self._rebuild_writes, None
+        bloom.update(written)
+        self._created_cursor = cursor
+        self.filter_rebuilt_at = time.monotonic()
+        self._filter_stats["rebuilds"] += 1
+
+    def sync_filter(self):
+        """把上次同步后（任一进程）新建的用户ID并入布隆过滤器，只读取存储的新建记录"""
+        bloom = self.filter
+        if bloom is None or self._created_cursor is None:
+            return
+        self._created_cursor, user_ids = self.store.created_since(self._created_cursor)
+        bloom.update(user_ids)
+        self._filter_stats["merged"] += len(user_ids)
+
+    def might_exist(self, user_id: str, record: bool = True) -> bool:
+        """
+        布隆过滤器判断本地是否可能有该用户的DID文档，返回False时一定没有，不访问存储
+
+        本进程写入的ID立即可见，其他进程新建的ID在下一次 sync_filter（DID_BLOOM_SYNC_INTERVAL）后可见。
+
+        Args:
+            user_id: 用户ID
+            record: 是否计入统计，同一次查找再次判断时传False
+        """
+        bloom = self.filter
+        exists = bloom is None or user_id in bloom
+        if record:
+            self._filter_stats["passed" if exists else "rejected"] += 1
+        return exists
+
+    def load(self):
+        """从存储加载全部DID文档，文档数超过 eager_limit 时只记录为按需加载"""
+        began = time.perf_counter()
+        total = self.store.count()
+        if total <= self.eager_limit:
+            for user_id, raw, mtime in self.store.iter_records():
+                self._add(user_id, raw, mtime)
+            self.complete = True
+        if settings.DID_BLOOM_ENABLED:
+            self.rebuild_filter(list(self._entries) if self.complete else None)
+        self.load_seconds = time.perf_counter() - began
+        self.loaded.set()
+        logging.info(
+            f"DID索引已{'加载' if self.complete else '按需模式启动'}: {len(self._by_did)}/{total} 个文档，"
+            f"耗时 {self.load_seconds * 1000:.1f} ms"
+        )
+
+    def refresh(self, user_id: str):
+        """重新读取一个用户的DID文档，本进程写入后调用"""
+        record = self.store.get_record(user_id)
+        if record is None:
+            self._remove(user_id)
+        elif self.complete or user_id in self._entries:
+            self._add(user_id, *record)
+        self._stats["reloads"] += 1
+
+    def poll(self):
+        """扫描一轮修改时间，重新加载变化的文档，移除已删除的文档"""
+        self._stats["polls"] += 1
+        if self.complete:
+            current = dict(self.store.iter_modified_times())
+        else:
+            # 按需模式只检查已索引的文档
+            current = {}
+            for user_id in list(self._entries):
+                mtime = self.store.modified_at(user_id)
+                if mtime is not None:
+                    current[user_id] = mtime
+        for user_id in [user_id for user_id in self._entries if user_id not in current]:
+            self._remove(user_id)
+        for user_id, mtime in current.items():
+            entry = self._entries.get(user_id)
+            if entry is None and not self.complete:
+                continue
+            if entry is None or entry[0] != mtime:
+                self.refresh(user_id)
+                if entry is None:
+                    # 其他进程新建的文档
+                    self._on_write(user_id)
+
+        self.sync_filter()
+        bloom = self.filter
+        # 超出容量后假阳性率上升；删除的ID只能靠重建移除
+        if bloom is not None and (
+            bloom.count > bloom.capacity
+            or time.monotonic() - self.filter_rebuilt_at >= settings.DID_BLOOM_REBUILD_INTERVAL
+        ):
+            self.rebuild_filter(list(current) if self.complete else None)
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception as e:
+            logging.error(f"加载DID索引失败: {e}")
+            self.loaded.set()
+        if self.poll_interval <= 0:
+            return
+        # 两次完整扫描之间按较短间隔同步过滤器
+        sync_interval = settings.DID_BLOOM_SYNC_INTERVAL
+        tick = min(self.poll_interval, sync_interval) if sync_interval > 0 else self.poll_interval
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.wait(tick):
+            try:
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.poll_interval
+                    self.poll()
+                else:
+                    self.sync_filter()
+            except Exception as e:
+                logging.error(f"扫描DID文档修改时间失败: {e}")
+
+    def start(self):
+        """在后台线程中加载索引并开始轮询，重复调用无副作用"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="did-index", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get(self, did: str) -> Optional[Dict[str, Any]]:
+        """
+        按DID查找本地DID文档，返回的文档由索引共享，调用方不应修改
+
+        Args:
+            did: DID标识符
+
+        Returns:
+            Optional[Dict[str, Any]]: DID文档，本地不存在时返回None
+        """
+        entry = self._by_did.get(did)
+        if entry is not None:
+            self._stats["hits"] += 1
+            return entry[1]
+        self._stats["misses"] += 1
+        user_id = user_id_from_did(did)
+        if not user_id or not self.might_exist(user_id):
+            return None
+        record = self.store.get_record(user_id)
+        if record is None:
+            self.record_false_positive()
+            return None
+        document = self._add(user_id, *record)
+        if not document or document.get("id") != did:
+            return None
+        self._stats["store_hits"] += 1
+        return document
+
+    def record_false_positive(self):
+        """通过过滤器的用户ID在存储中不存在时调用，计入观测假阳性率"""
+        if self.filter is not None:
+            self._filter_stats["false_positives"] += 1
+
+    def filter_stats(self) -> Dict[str, Any]:
+        """布隆过滤器统计：大小、估算假阳性率，以及通过过滤器后存储中不存在的比例（观测假阳性率）"""
+        bloom = self.filter
+        if bloom is None:
+            return {"enabled": False}
+        fp, rejected = self._filter_stats["false_positives"], self._filter_stats["rejected"]
+        return {
+            "enabled": True,
+            **bloom.stats(),
+            **self._filter_stats,
+            "observed_fpr": round(fp / (fp + rejected), 6) if fp + rejected else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._by_did),
+            "complete": self.complete,
+            "load_ms": round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+            "poll_interval": self.poll_interval,
+            **self._stats,
+            "filter": self.filter_stats()
+        }
+
+
+def is_local_did(did: str, app_settings: Optional[Settings] = None) -> bool:
+    """DID的主机是否为本机响应端（load_or_create_did 创建的DID形如 did:wba:localhost%3A<PORT>:...）"""
+    app_settings = app_settings or settings
+    parts = did.split(":")
+    if len(parts) < 3:
+        return False
+    authority = unquote(parts[2]).lower()
+    return authority in {f"{host}:{app_settings.PORT}" for host in ("localhost", "127.0.0.1", app_settings.HOST)}
+
+
+_indexes: Dict[int, DIDIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_did_index(store: Optional[DIDStore] = None) -> DIDIndex:
+    """返回DID存储对应的内存索引，每个存储一个，默认使用全局settings的存储"""
+    store = store or get_did_store()
+    index = _indexes.get(id(store))
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(id(store))
+            if index is None:
+                index = _indexes[id(store)] = DIDIndex(store)
+    return index
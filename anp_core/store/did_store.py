@@ -0,0 +1,717 @@
+"""
+DID文档存储：文件（按哈希分片）和SQLite两种后端，原子写入，支持后台批量写入
+在后端之间迁移：python -m anp_core.store.did_store migrate --to sqlite
+"""
+import abc
+import argparse
+import atexit
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.config import settings, Settings
+from anp_core.store.history_store import resolve_db_path
+
+# DID_DOCUMENTS_PATH 的相对路径基准，与客户端一直使用的 anp_core/did_keys 一致
+DID_ROOT_BASE = Path(__file__).parents[1]
+
+DID_STORE_BACKENDS = ("file", "sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS did_documents (
+    user_id TEXT PRIMARY KEY,
+    did TEXT NOT NULL,
+    document BLOB NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_did_documents_did ON did_documents(did);
+CREATE TABLE IF NOT EXISTS did_created (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS did_documents_created BEFORE INSERT ON did_documents
+WHEN NOT EXISTS (SELECT 1 FROM did_documents WHERE user_id = NEW.user_id)
+BEGIN
+    INSERT INTO did_created (user_id) VALUES (NEW.user_id);
+END;
+"""
+
+_UPSERT = "INSERT OR REPLACE INTO did_documents (user_id, did, document, updated_at) VALUES (?, ?, ?, ?)"
+
+# none: 只保证原子替换（进程崩溃不会留下半个文件）；file: 替换前fsync文件；full: 另外fsync所在目录
+FSYNC_POLICIES = ("none", "file", "full")
+
+# 文件后端的新建记录：每新建一个DID文档追加一行用户ID，供其他进程的索引增量更新布隆过滤器
+CREATED_LOG_FILENAME = ".created"
+
+
+def resolve_did_root(path: str) -> Path:
+    """将 DID_DOCUMENTS_PATH 转换为绝对路径（相对路径以 anp_core 目录为基准）"""
+    root = Path(path)
+    if not root.is_absolute():
+        root = DID_ROOT_BASE / root
+    return root
+
+
+def user_id_from_did(did: str) -> Optional[str]:
+    """从 did:wba:host:...:user_id 形式的DID中取出用户ID，格式不符时返回None"""
+    parts = did.split(":")
+    if len(parts) < 5 or parts[0] != "did" or parts[1] != "wba" or not parts[-1]:
+        return None
+    return parts[-1]
+
+
+def atomic_write(path: Path, data: bytes, fsync: str = "none", mode: int = 0o644):
+    """
+    先写入同目录下的临时文件再重命名替换，读取方只会看到旧文件或完整的新文件
+
+    Args:
+        path: 目标文件
+        data: 文件内容
+        fsync: fsync策略 none / file / full
+        mode: 新文件的权限
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if fsync == "full":
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def shard_dir(root: Path, user_id: str, depth: int) -> Path:
+    """
+    返回用户目录的分片路径，如 root/3f/a2/user_<id>
+
+    Args:
+        root: 存储根目录
+        user_id: 用户ID
+        depth: 分片层数，0表示平铺
+
+    Returns:
+        Path: 用户目录
+    """
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    return root.joinpath(*(digest[i * 2:i * 2 + 2] for i in range(depth)), f"user_{user_id}")
+
+
+class DIDStore(abc.ABC):
+    """DID文档存储的公共接口，私钥目录在所有后端中都按分片布局放在文件系统上"""
+
+    backend = ""
+
+    def __init__(self, root: Path, shard_depth: int, document_filename: str, fsync: Optional[str] = None):
+        self.root = root
+        self.shard_depth = max(shard_depth, 0)
+        self.document_filename = document_filename
+        self.fsync = fsync or settings.DID_STORE_FSYNC
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的fsync策略: {self.fsync}，可选 {', '.join(FSYNC_POLICIES)}")
+        self._stats = {"reads": 0, "misses": 0, "writes": 0, "deferred": 0, "batches": 0, "write_failures": 0}
+        # 同一用户的写入串行执行；按用户ID哈希到固定数量的锁，不为每个用户保留一个锁
+        self._user_locks = [threading.RLock() for _ in range(64)]
+        # 写后台批量写入：尚未落盘的文档对读取可见，同一用户只保留最新一份
+        self._pending: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._pending_cond = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        # 最近一次后台写入失败、仍在队列中等待重试的用户及错误
+        self._failed: Dict[str, str] = {}
+        self._last_write_error: Optional[str] = None
+        self._write_listeners: List[Callable[[str], None]] = []
+
+    def legacy_dir(self, user_id: str) -> Path:
+        """迁移前的平铺用户目录"""
+        return self.root / f"user_{user_id}"
+
+    def user_dir(self, user_id: str) -> Path:
+        """
+        返回保存用户私钥的目录，尚未迁移的用户返回其平铺目录
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            Path: 用户目录（可能尚不存在）
+        """
+        sharded = shard_dir(self.root, user_id, self.shard_depth)
+        if self.shard_depth and not sharded.exists() and self.legacy_dir(user_id).exists():
+            return self.legacy_dir(user_id)
+        return sharded
+
+    @abc.abstractmethod
+    def _read_record(self, user_id: str) -> Optional[Tuple[bytes, float]]:
+        """读取 (序列化的DID文档, 最后修改时间)，不存在时返回None"""
+
+    @abc.abstractmethod
+    def _read_modified_at(self, user_id: str) -> Optional[float]:
+        """读取最后修改时间，不存在时返回None"""
+
+    @abc.abstractmethod
+    def _write(self, user_id: str, document: Dict[str, Any]):
+        """同步写入用户的DID文档"""
+
+    def _write_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        for user_id, document in items:
+            with self.user_lock(user_id):
+                self._write(user_id, document)
+
+    def user_lock(self, user_id: str) -> threading.RLock:
+        """返回用户的写锁，需要先读后写（如首次创建密钥和文档）时持有，避免并发创建出两套密钥"""
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def get_record(self, user_id: str) -> Optional[Tuple[bytes, float]]:
+        """返回 (序列化的DID文档, 最后修改时间)，不存在时返回None"""
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            return json.dumps(pending[0], indent=2).encode("utf-8"), pending[1]
+        return self._read_record(user_id)
+
+    def modified_at(self, user_id: str) -> Optional[float]:
+        """返回DID文档的最后修改时间（epoch秒），不读取文档内容，不存在时返回None"""
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            return pending[1]
+        return self._read_modified_at(user_id)
+
+    def get_bytes(self, user_id: str) -> Optional[bytes]:
+        """返回序列化的DID文档，不存在时返回None"""
+        record = self.get_record(user_id)
+        return record[0] if record else None
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按用户ID读取DID文档
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            Optional[Dict[str, Any]]: DID文档，不存在时返回None
+        """
+        raw = self.get_bytes(user_id)
+        self._stats["reads"] += 1
+        if raw is None:
+            self._stats["misses"] += 1
+            return None
+        return json.loads(raw)
+
+    def get_by_did(self, did: str) -> Optional[Dict[str, Any]]:
+        """按DID读取本地保存的DID文档，文档id与DID不一致时视为不存在"""
+        user_id = user_id_from_did(did)
+        document = self.get(user_id) if user_id else None
+        return document if document and document.get("id") == did else None
+
+    def put(self, user_id: str, document: Dict[str, Any]):
+        """
+        保存（覆盖）用户的DID文档，同步写入，调用方在事件循环中应放到线程池执行
+
+        Args:
+            user_id: 用户ID
+            document: DID文档
+        """
+        with self.user_lock(user_id):
+            with self._pending_cond:
+                if user_id in self._pending:
+                    # 后台线程可能正在写入较早登记的文档：先替换登记项，读取立即看到新文档，
+                    # 旧文档即使在本次写入之后落盘，也会被下一批写入的新文档覆盖
+                    self._pending[user_id] = (document, time.time())
+                    self._pending_cond.notify_all()
+            self._write(user_id, document)
+        self._stats["writes"] += 1
+        self._notify_write(user_id)
+
+    def put_deferred(self, user_id: str, document: Dict[str, Any]):
+        """
+        登记DID文档并立即返回，由后台线程按批写入（批量开通用户时使用）
+
+        在写入前读取即可看到新文档；同一用户多次登记只写入最后一份。
+
+        Args:
+            user_id: 用户ID
+            document: DID文档
+        """
+        with self._pending_cond:
+            self._pending[user_id] = (document, time.time())
+            self._stats["deferred"] += 1
+            self._pending_cond.notify_all()
+        self._notify_write(user_id)
+        self._start_writer()
+
+    def add_write_listener(self, callback: Callable[[str], None]):
+        """登记写入回调，本进程每次写入（含登记后台写入）后以用户ID调用"""
+        self._write_listeners.append(callback)
+
+    def _notify_write(self, user_id: str):
+        for callback in self._write_listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logging.error(f"DID写入回调失败: {e}")
+
+    def _start_writer(self):
+        with self._pending_cond:
+            if self._writer and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._run_writer, name="did-store-writer", daemon=True)
+            self._writer.start()
+
+    def _run_writer(self):
+        interval = settings.DID_STORE_WRITE_BEHIND_MS / 1000
+        batch_size = max(settings.DID_STORE_WRITE_BEHIND_BATCH, 1)
+        retry_delay = interval
+        while True:
+            with self._pending_cond:
+                while not self._pending:
+                    self._pending_cond.wait()
+                # 攒一个时间窗口或一批之后再写
+                deadline = time.monotonic() + interval
+                while len(self._pending) < batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_cond.wait(remaining)
+                batch = list(self._pending.items())[:batch_size]
+            written = self._write_batch(batch)
+            with self._pending_cond:
+                # 写入期间又被登记的新版本保留，等待下一批；写入失败的文档也留在队列中重试
+                for user_id, entry in written:
+                    if self._pending.get(user_id) is entry:
+                        del self._pending[user_id]
+                self._pending_cond.notify_all()
+            if len(written) < len(batch):
+                # 失败后退避重试，间隔逐次加倍，最长 DID_STORE_WRITE_RETRY_MAX 秒
+                retry_delay = min(max(retry_delay * 2, 0.05), settings.DID_STORE_WRITE_RETRY_MAX)
+                time.sleep(retry_delay)
+            else:
+                retry_delay = interval
+
+    def _write_batch(self, batch: List[Tuple[str, Tuple[Dict[str, Any], float]]]) -> List:
+        """写入一批登记项，返回写入成功的登记项；整批失败时逐个重试，找出失败的文档"""
+        try:
+            self._write_many([(user_id, document) for user_id, (document, _) in batch])
+            written = batch
+        except Exception as e:
+            logging.error(f"批量写入DID文档失败，逐个重试: {e}")
+            written = []
+            for user_id, (document, mtime) in batch:
+                try:
+                    with self.user_lock(user_id):
+                        self._write(user_id, document)
+                    written.append((user_id, (document, mtime)))
+                except Exception as e:
+                    self._failed[user_id] = self._last_write_error = f"{user_id}: {e}"
+                    logging.error(f"写入DID文档失败，稍后重试 ({user_id}): {e}")
+        for user_id, _ in written:
+            self._failed.pop(user_id, None)
+        self._stats["writes"] += len(written)
+        self._stats["batches"] += 1
+        self._stats["write_failures"] += len(batch) - len(written)
+        return written
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        等待后台写入完成
+
+        Returns:
+            bool: 超时前是否已全部写入
+        """
+        deadline = time.monotonic() + timeout
+        with self._pending_cond:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    @abc.abstractmethod
+    def delete(self, user_id: str) -> bool:
+        """删除用户的DID文档（不删除私钥），返回是否存在"""
+
+    @abc.abstractmethod
+    def iter_documents(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """遍历全部 (用户ID, DID文档)"""
+
+    @abc.abstractmethod
+    def iter_records(self) -> Iterator[Tuple[str, bytes, float]]:
+        """遍历全部 (用户ID, 序列化的DID文档, 最后修改时间)"""
+
+    @abc.abstractmethod
+    def iter_modified_times(self) -> Iterator[Tuple[str, float]]:
+        """遍历全部 (用户ID, 最后修改时间)，不读取文档内容"""
+
+    def count(self) -> int:
+        """DID文档数量"""
+        return sum(1 for _ in self.iter_documents())
+
+    @abc.abstractmethod
+    def location(self, user_id: str) -> str:
+        """用户DID文档的存储位置，用于日志和接口返回"""
+
+    @abc.abstractmethod
+    def created_since(self, cursor: Optional[int]) -> Tuple[int, List[str]]:
+        """
+        返回游标之后（任一进程）新建DID文档的用户ID，不扫描存储
+
+        Args:
+            cursor: 上次返回的游标，None时只返回当前游标
+
+        Returns:
+            Tuple[int, List[str]]: (新游标, 新建的用户ID)
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend, "root": str(self.root), "shard_depth": self.shard_depth,
+            "fsync": self.fsync, "pending": len(self._pending),
+            "failed_pending": len(self._failed),
+            "last_write_error": self._last_write_error,
+            **self._stats
+        }
+
+
+class FileDIDStore(DIDStore):
+    """每个用户一个 did.json，用户目录按哈希前缀分片"""
+
+    backend = "file"
+
+    def _document_path(self, user_id: str) -> Path:
+        return shard_dir(self.root, user_id, self.shard_depth) / self.document_filename
+
+    def _candidate_paths(self, user_id: str) -> Tuple[Path, Path]:
+        return self._document_path(user_id), self.legacy_dir(user_id) / self.document_filename
+
+    def _read_record(self, user_id: str) -> Optional[Tuple[bytes, float]]:
+        # 直接打开，不先stat；分片路径不存在时再尝试平铺目录
+        for path in self._candidate_paths(user_id):
+            try:
+                with open(path, "rb") as f:
+                    return f.read(), os.fstat(f.fileno()).st_mtime
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _read_modified_at(self, user_id: str) -> Optional[float]:
+        for path in self._candidate_paths(user_id):
+            try:
+                return os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _write(self, user_id: str, document: Dict[str, Any]):
+        path = self.user_dir(user_id) / self.document_filename
+        created = not path.exists()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(path, json.dumps(document, indent=2).encode("utf-8"), self.fsync)
+        if created:
+            # O_APPEND 的单次短写入在多个进程间不会交错
+            fd = os.open(self.root / CREATED_LOG_FILENAME, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, f"{user_id}\n".encode("utf-8"))
+            finally:
+                os.close(fd)
+
+    def delete(self, user_id: str) -> bool:
+        deleted = False
+        for path in self._candidate_paths(user_id):
+            try:
+                path.unlink()
+                deleted = True
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def _iter_document_paths(self, directory: Optional[str] = None, depth: int = 0) -> Iterator[Tuple[str, str]]:
+        # 只列出分片目录，不列出用户目录的内容；文件是否存在由调用方打开或stat时判断
+        try:
+            entries = list(os.scandir(directory or self.root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if entry.name.startswith("user_"):
+                yield entry.name[len("user_"):], os.path.join(entry.path, self.document_filename)
+            elif depth < self.shard_depth:
+                yield from self._iter_document_paths(entry.path, depth + 1)
+
+    def iter_documents(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for user_id, raw, _ in self.iter_records():
+            try:
+                yield user_id, json.loads(raw)
+            except ValueError as e:
+                logging.error(f"读取DID文档失败 ({user_id}): {e}")
+
+    def iter_records(self) -> Iterator[Tuple[str, bytes, float]]:
+        for user_id, path in self._iter_document_paths():
+            try:
+                with open(path, "rb") as f:
+                    yield user_id, f.read(), os.fstat(f.fileno()).st_mtime
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.error(f"读取DID文档失败 ({path}): {e}")
+
+    def iter_modified_times(self) -> Iterator[Tuple[str, float]]:
+        for user_id, path in self._iter_document_paths():
+            try:
+                yield user_id, os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+
+    def location(self, user_id: str) -> str:
+        return str(self.user_dir(user_id) / self.document_filename)
+
+    def created_since(self, cursor: Optional[int]) -> Tuple[int, List[str]]:
+        # 游标是新建记录的字节偏移，没有新记录时只需一次stat
+        path = self.root / CREATED_LOG_FILENAME
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return 0, []
+        if cursor is None or size <= cursor:
+            return size, []
+        with open(path, "rb") as f:
+            f.seek(cursor)
+            data = f.read(size - cursor)
+        # 只消费完整的行，正在追加的行留到下一次
+        end = data.rfind(b"\n") + 1
+        return cursor + end, data[:end].decode("utf-8").split()
+
+
+class SQLiteDIDStore(DIDStore):
+    """基于SQLite WAL的DID文档存储，每个线程持有一个长连接"""
+
+    backend = "sqlite"
+
+    def __init__(self, root: Path, shard_depth: int, document_filename: str, db_path: str,
+                 fsync: Optional[str] = None):
+        super().__init__(root, shard_depth, document_filename, fsync)
+        self.db_path = resolve_db_path(db_path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL模式下NORMAL在进程崩溃时不丢数据，full策略下每次提交都同步到磁盘
+            conn.execute(f"PRAGMA synchronous={'FULL' if self.fsync == 'full' else 'NORMAL'}")
+            if not self._schema_ready:
+                with self._schema_lock:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _read_record(self, user_id: str) -> Optional[Tuple[bytes, float]]:
+        row = self._conn().execute(
+            "SELECT document, updated_at FROM did_documents WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _read_modified_at(self, user_id: str) -> Optional[float]:
+        row = self._conn().execute("SELECT updated_at FROM did_documents WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_by_did(self, did: str) -> Optional[Dict[str, Any]]:
+        if self._pending and user_id_from_did(did) in self._pending:
+            return super().get_by_did(did)
+        row = self._conn().execute("SELECT document FROM did_documents WHERE did = ?", (did,)).fetchone()
+        self._stats["reads"] += 1
+        if row is None:
+            self._stats["misses"] += 1
+            return None
+        return json.loads(row[0])
+
+    @staticmethod
+    def _row(user_id: str, document: Dict[str, Any]) -> Tuple[str, str, bytes, float]:
+        return user_id, document.get("id") or "", json.dumps(document, indent=2).encode("utf-8"), time.time()
+
+    def _write(self, user_id: str, document: Dict[str, Any]):
+        self._conn().execute(_UPSERT, self._row(user_id, document))
+
+    def _write_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        # 一批文档在一个事务中提交
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(_UPSERT, [self._row(user_id, document) for user_id, document in items])
+
+    def delete(self, user_id: str) -> bool:
+        return self._conn().execute("DELETE FROM did_documents WHERE user_id = ?", (user_id,)).rowcount > 0
+
+    def iter_documents(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for user_id, raw in self._conn().execute("SELECT user_id, document FROM did_documents ORDER BY user_id"):
+            yield user_id, json.loads(raw)
+
+    def iter_records(self) -> Iterator[Tuple[str, bytes, float]]:
+        yield from self._conn().execute("SELECT user_id, document, updated_at FROM did_documents")
+
+    def iter_modified_times(self) -> Iterator[Tuple[str, float]]:
+        yield from self._conn().execute("SELECT user_id, updated_at FROM did_documents")
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM did_documents").fetchone()[0]
+
+    def created_since(self, cursor: Optional[int]) -> Tuple[int, List[str]]:
+        # did_created 由触发器在插入新用户时写入
+        conn = self._conn()
+        if cursor is None:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM did_created").fetchone()[0], []
+        rows = conn.execute("SELECT seq, user_id FROM did_created WHERE seq > ? ORDER BY seq", (cursor,)).fetchall()
+        return (rows[-1][0] if rows else cursor), [user_id for _, user_id in rows]
+
+    def location(self, user_id: str) -> str:
+        return f"sqlite://{self.db_path}#{user_id}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "db_path": str(self.db_path)}
+
+
+_stores: Dict[Tuple, DIDStore] = {}
+_stores_lock = threading.Lock()
+
+
+def create_did_store(backend: str, root: Path, shard_depth: int, document_filename: str,
+                     db_path: Optional[str] = None) -> DIDStore:
+    """
+    创建指定后端的DID存储
+
+    Args:
+        backend: file 或 sqlite
+        root: 用户目录（私钥、文件后端的DID文档）根目录
+        shard_depth: 用户目录分片层数
+        document_filename: DID文档文件名
+        db_path: sqlite后端的数据库路径
+
+    Returns:
+        DIDStore: 存储实例
+    """
+    if backend == "file":
+        return FileDIDStore(root, shard_depth, document_filename)
+    if backend == "sqlite":
+        return SQLiteDIDStore(root, shard_depth, document_filename, db_path or settings.DID_STORE_DB_PATH)
+    raise ValueError(f"未知的DID存储后端: {backend}，可选 {', '.join(DID_STORE_BACKENDS)}")
+
+
+def get_did_store(app_settings: Optional[Settings] = None) -> DIDStore:
+    """
+    返回settings对应的DID存储，相同配置的实例共用一个存储对象
+
+    Args:
+        app_settings: 可选的实例settings，默认使用全局settings
+
+    Returns:
+        DIDStore: DID存储
+    """
+    app_settings = app_settings or settings
+    key = (
+        app_settings.DID_STORE_BACKEND, str(resolve_did_root(app_settings.DID_DOCUMENTS_PATH)),
+        app_settings.DID_STORE_SHARD_DEPTH, app_settings.DID_DOCUMENT_FILENAME, app_settings.DID_STORE_DB_PATH
+    )
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = create_did_store(
+                    app_settings.DID_STORE_BACKEND, Path(key[1]), app_settings.DID_STORE_SHARD_DEPTH,
+                    app_settings.DID_DOCUMENT_FILENAME, app_settings.DID_STORE_DB_PATH
+                )
+                atexit.register(store.flush, 2.0)
+    return store
+
+
+def _relocate_legacy_dir(store: DIDStore, user_id: str) -> bool:
+    """把平铺的 user_<id> 目录（私钥和DID文档）移动到分片目录，分片目录已存在时不移动"""
+    legacy = store.legacy_dir(user_id)
+    sharded = shard_dir(store.root, user_id, store.shard_depth)
+    if not store.shard_depth or not legacy.is_dir() or sharded.exists():
+        return False
+    sharded.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(legacy), str(sharded))
+    return True
+
+
+def migrate(source: DIDStore, target: DIDStore, relocate_keys: bool = True) -> Dict[str, int]:
+    """
+    把source中的全部DID文档复制到target，并可把平铺用户目录移动到分片目录
+
+    Args:
+        source: 源存储
+        target: 目标存储，可以与源共用同一根目录（例如平铺文件布局迁移为分片布局）
+        relocate_keys: 是否把 user_<id> 平铺目录（私钥等文件）移动到target的分片目录
+
+    Returns:
+        Dict[str, int]: 写入、内容相同而跳过、移动目录的数量
+    """
+    result = {"migrated": 0, "skipped": 0, "relocated": 0}
+    for user_id, document in list(source.iter_documents()):
+        if relocate_keys and _relocate_legacy_dir(target, user_id):
+            result["relocated"] += 1
+        if target.get(user_id) == document:
+            result["skipped"] += 1
+            continue
+        target.put(user_id, document)
+        result["migrated"] += 1
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DID document store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Copy DID documents between store backends")
+    migrate_parser.add_argument("--from", dest="source", choices=DID_STORE_BACKENDS, default="file")
+    migrate_parser.add_argument("--to", dest="target", choices=DID_STORE_BACKENDS, default=settings.DID_STORE_BACKEND)
+    migrate_parser.add_argument("--root", default=settings.DID_DOCUMENTS_PATH, help="DID_DOCUMENTS_PATH")
+    migrate_parser.add_argument("--db", default=settings.DID_STORE_DB_PATH, help="DID_STORE_DB_PATH")
+    migrate_parser.add_argument("--keep-layout", action="store_true",
+                                help="Do not move user_<id> directories into the sharded layout")
+    stats_parser = subparsers.add_parser("stats", help="Show the configured store and its document count")
+    stats_parser.add_argument("--backend", choices=DID_STORE_BACKENDS, default=settings.DID_STORE_BACKEND)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        store = create_did_store(args.backend, resolve_did_root(settings.DID_DOCUMENTS_PATH),
+                                 settings.DID_STORE_SHARD_DEPTH, settings.DID_DOCUMENT_FILENAME)
+        print(json.dumps({**store.stats(), "documents": store.count()}, indent=2, ensure_ascii=False))
+        return
+
+    root = resolve_did_root(args.root)
+    source = create_did_store(args.source, root, settings.DID_STORE_SHARD_DEPTH, settings.DID_DOCUMENT_FILENAME, args.db)
+    target = create_did_store(args.target, root, settings.DID_STORE_SHARD_DEPTH, settings.DID_DOCUMENT_FILENAME, args.db)
+    began = time.perf_counter()
+    result = migrate(source, target, relocate_keys=not args.keep_layout)
+    print(f"{args.source} -> {args.target}: {result}, {target.count()} documents in target, "
+          f"{time.perf_counter() - began:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
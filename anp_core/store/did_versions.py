@@ -0,0 +1,445 @@
+"""
+DID文档版本历史：在SQLite中保存快照和JSON Patch差量，支持 RFC 6902 PATCH 和按版本读取
+"""
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings
+from anp_core.store.did_store import DIDStore, get_did_store
+from anp_core.store.history_store import resolve_db_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS did_versions (
+    user_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, version)
+) WITHOUT ROWID;
+"""
+
+SNAPSHOT = "snapshot"
+PATCH = "patch"
+
+
+class JSONPatchError(ValueError):
+    """JSON Patch格式错误或无法应用（包括test操作不满足）"""
+
+
+class VersionConflict(Exception):
+    """期望版本与当前版本不一致"""
+
+    def __init__(self, expected: int, current: int):
+        super().__init__(f"期望版本 {expected}，当前版本 {current}")
+        self.expected = expected
+        self.current = current
+
+
+class NotDocumentOwner(PermissionError):
+    """写入方的DID与DID文档的id不一致"""
+
+    def __init__(self, owner: str, did: Optional[str]):
+        super().__init__(f"{owner} 不是DID文档 {did} 的所有者")
+        self.owner = owner
+        self.did = did
+
+
+# ---------------------------------------------------------------------- #
+# JSON Patch (RFC 6902)
+# ---------------------------------------------------------------------- #
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JSONPatchError(f"无效的JSON Pointer: {pointer}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JSONPatchError(f"无效的数组下标: {token}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JSONPatchError(f"数组下标越界: {token}")
+    return index
+
+
+def _resolve_parent(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict):
+            if token not in target:
+                raise JSONPatchError(f"路径不存在: /{'/'.join(map(_escape, tokens))}")
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_list_index(target, token, allow_end=False)]
+        else:
+            raise JSONPatchError(f"路径不存在: /{'/'.join(map(_escape, tokens))}")
+    return target, tokens[-1]
+
+
+def _get(document: Any, pointer: str) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return document
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JSONPatchError(f"路径不存在: {pointer}")
+        return parent[token]
+    if isinstance(parent, list):
+        return parent[_list_index(parent, token, allow_end=False)]
+    raise JSONPatchError(f"路径不存在: {pointer}")
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return value
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, token, allow_end=True), value)
+    else:
+        raise JSONPatchError(f"路径不存在: {pointer}")
+    return document
+
+
+def _remove(document: Any, pointer: str) -> Tuple[Any, Any]:
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        raise JSONPatchError("不能删除整个文档")
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JSONPatchError(f"路径不存在: {pointer}")
+        return document, parent.pop(token)
+    if isinstance(parent, list):
+        return document, parent.pop(_list_index(parent, token, allow_end=False))
+    raise JSONPatchError(f"路径不存在: {pointer}")
+
+
+def _replace(document: Any, pointer: str, value: Any) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return value
+    parent, token = _resolve_parent(document, tokens)
+    if isinstance(parent, list):
+        parent[_list_index(parent, token, allow_end=False)] = value
+    else:
+        parent[token] = value
+    return document
+
+
+def apply_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """
+    对文档应用JSON Patch，返回新文档，原文档不变
+
+    Args:
+        document: 原文档
+        operations: RFC 6902 操作列表
+
+    Returns:
+        Any: 应用后的文档
+
+    Raises:
+        JSONPatchError: 操作无效、路径不存在或test不满足
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError("JSON Patch必须是操作数组")
+    result = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or not isinstance(operation.get("path"), str):
+            raise JSONPatchError(f"无效的操作: {operation}")
+        op, path = operation.get("op"), operation["path"]
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JSONPatchError(f"{op} 操作缺少value")
+        if op in ("move", "copy") and not isinstance(operation.get("from"), str):
+            raise JSONPatchError(f"{op} 操作缺少from")
+
+        if op == "add":
+            result = _add(result, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            result, _ = _remove(result, path)
+        elif op == "replace":
+            _get(result, path)
+            result = _replace(result, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            source = operation["from"]
+            if path.startswith(source + "/"):
+                raise JSONPatchError(f"不能把 {source} 移动到其子路径")
+            result, value = _remove(result, source)
+            result = _add(result, path, value)
+        elif op == "copy":
+            result = _add(result, path, copy.deepcopy(_get(result, operation["from"])))
+        elif op == "test":
+            if _get(result, path) != operation["value"]:
+                raise JSONPatchError(f"test失败: {path}")
+        else:
+            raise JSONPatchError(f"不支持的操作: {op}")
+    return result
+
+
+def diff(source: Any, target: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    生成把source变为target的JSON Patch
+
+    对象逐键比较；等长数组逐项比较，长度不同的数组整体替换（DID文档中的数组都很短）。
+
+    Args:
+        source: 原文档
+        target: 目标文档
+        path: 当前JSON Pointer前缀
+
+    Returns:
+        List[Dict[str, Any]]: 操作列表，两者相同时为空
+    """
+    if source == target:
+        return []
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations = []
+        for key in source:
+            if key not in target:
+                operations.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in target.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in source:
+                operations.append({"op": "add", "path": child, "value": value})
+            else:
+                operations.extend(diff(source[key], value, child))
+        return operations
+    if isinstance(source, list) and isinstance(target, list) and len(source) == len(target):
+        operations = []
+        for index, (old, new) in enumerate(zip(source, target)):
+            operations.extend(diff(old, new, f"{path}/{index}"))
+        return operations
+    return [{"op": "replace", "path": path, "value": target}]
+
+
+# ---------------------------------------------------------------------- #
+# 版本历史
+# ---------------------------------------------------------------------- #
+class DIDVersionHistory:
+    """一个DID存储的版本历史，写入DID文档应通过本类进行以记录版本"""
+
+    def __init__(self, store: DIDStore, db_path: str, snapshot_interval: int):
+        self.store = store
+        self.db_path = resolve_db_path(db_path)
+        self.snapshot_interval = max(snapshot_interval, 1)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        # 当前版本号缓存，写入时更新；其他进程的写入由文档缓存按修改时间重新加载时刷新
+        self._current: Dict[str, int] = {}
+        self._stats = {"versions": 0, "snapshots": 0, "patches": 0, "replayed": 0, "conflicts": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with self._schema_lock:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def current_version(self, user_id: str, refresh: bool = False) -> int:
+        """
+        返回用户DID文档的当前版本号，没有历史时为0
+
+        Args:
+            user_id: 用户ID
+            refresh: 是否忽略进程内缓存重新查询
+        """
+        if not refresh and user_id in self._current:
+            return self._current[user_id]
+        row = self._conn().execute(
+            "SELECT MAX(version) FROM did_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        version = row[0] or 0
+        self._current[user_id] = version
+        return version
+
+    def _append(self, conn: sqlite3.Connection, user_id: str, version: int,
+                previous: Optional[Dict[str, Any]], document: Dict[str, Any]):
+        if previous is None or (version - 1) % self.snapshot_interval == 0:
+            kind, data = SNAPSHOT, document
+        else:
+            kind, data = PATCH, diff(previous, document)
+        conn.execute(
+            "INSERT INTO did_versions (user_id, version, kind, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, version, kind, json.dumps(data, separators=(",", ":")).encode("utf-8"), time.time())
+        )
+        self._stats["versions"] += 1
+        self._stats["snapshots" if kind == SNAPSHOT else "patches"] += 1
+
+    def _write(self, user_id: str, build: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+               expected_version: Optional[int], deferred: bool, owner: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+        """
+        在历史库的写事务中读取当前版本、检查并写入文档，多个进程的条件写入不会同时通过检查
+
+        Args:
+            build: 由当前文档（不存在时为None）生成新文档
+        """
+        conn = self._conn()
+        with self.store.user_lock(user_id), conn:
+            # BEGIN IMMEDIATE 取得历史库的写锁，跨进程串行化同一历史库的写入
+            conn.execute("BEGIN IMMEDIATE")
+            previous = self.store.get(user_id)
+            recorded = conn.execute(
+                "SELECT MAX(version) FROM did_versions WHERE user_id = ?", (user_id,)
+            ).fetchone()[0] or 0
+            current = 1 if recorded == 0 and previous is not None else recorded
+            self._current[user_id] = recorded
+            if owner is not None:
+                _check_owner(owner, previous)
+            document = build(previous)
+            if owner is not None:
+                _check_owner(owner, document)
+            if expected_version is not None and expected_version != current:
+                self._stats["conflicts"] += 1
+                raise VersionConflict(expected_version, current)
+            if previous == document:
+                return current, document
+            try:
+                if recorded == 0 and previous is not None:
+                    # 引入版本历史之前已存在的文档补记为版本1
+                    self._append(conn, user_id, 1, None, previous)
+                self._append(conn, user_id, current + 1, previous, document)
+            except sqlite3.IntegrityError:
+                # 绕过写锁的并发写入已占用该版本号
+                self._stats["conflicts"] += 1
+                raise VersionConflict(current if expected_version is None else expected_version, current + 1)
+            # 历史记录在文档之前写入；文档写入失败时事务回滚，不会留下没有文档的版本
+            if deferred:
+                self.store.put_deferred(user_id, document)
+            else:
+                self.store.put(user_id, document)
+        self._current[user_id] = current + 1
+        return current + 1, document
+
+    def put(self, user_id: str, document: Dict[str, Any], expected_version: Optional[int] = None,
+            deferred: bool = False, owner: Optional[str] = None) -> int:
+        """
+        写入完整DID文档并记录新版本，内容不变时不产生新版本
+
+        Args:
+            user_id: 用户ID
+            document: DID文档
+            expected_version: 期望的当前版本，不一致时抛出 VersionConflict
+            deferred: 文档交给存储的后台批量写入（版本历史仍同步记录）
+            owner: 写入方的DID，给出时原文档和新文档的id都必须与之相同，否则抛出 NotDocumentOwner
+
+        Returns:
+            int: 写入后的版本号
+        """
+        return self._write(user_id, lambda previous: document, expected_version, deferred, owner)[0]
+
+    def patch(self, user_id: str, operations: List[Dict[str, Any]],
+              expected_version: Optional[int] = None, owner: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        对当前DID文档应用JSON Patch并记录新版本
+
+        Args:
+            user_id: 用户ID
+            operations: RFC 6902 操作列表
+            expected_version: 期望的当前版本，不一致时抛出 VersionConflict
+            owner: 写入方的DID，见 put
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: 新版本号和修改后的文档，文档不存在时抛出 KeyError
+        """
+        def build(document: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if document is None:
+                raise KeyError(user_id)
+            patched = apply_patch(document, operations)
+            if not isinstance(patched, dict):
+                raise JSONPatchError("DID文档必须是JSON对象")
+            return patched
+
+        return self._write(user_id, build, expected_version, False, owner)
+
+    def get_version(self, user_id: str, version: int) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        读取历史版本：从不晚于该版本的最近快照开始回放差量
+
+        Args:
+            user_id: 用户ID
+            version: 版本号
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], float]]: 该版本的DID文档及其写入时间，不存在时返回None
+        """
+        conn = self._conn()
+        base = conn.execute(
+            "SELECT version, data, created_at FROM did_versions WHERE user_id = ? AND version <= ? AND kind = ? "
+            "ORDER BY version DESC LIMIT 1", (user_id, version, SNAPSHOT)
+        ).fetchone()
+        if base is None:
+            # 没有历史的文档只有版本1，即当前内容
+            if version == 1 and self.current_version(user_id, refresh=True) == 0:
+                record = self.store.get_record(user_id)
+                if record is not None:
+                    return json.loads(record[0]), record[1]
+            return None
+        document, created_at = json.loads(base[1]), base[2]
+        rows = conn.execute(
+            "SELECT data, created_at FROM did_versions WHERE user_id = ? AND version > ? AND version <= ? "
+            "ORDER BY version", (user_id, base[0], version)
+        ).fetchall()
+        if base[0] + len(rows) != version:
+            return None
+        for data, created_at in rows:
+            document = apply_patch(document, json.loads(data))
+            self._stats["replayed"] += 1
+        return document, created_at
+
+    def stats(self) -> Dict[str, Any]:
+        return {"db_path": str(self.db_path), "snapshot_interval": self.snapshot_interval, **self._stats}
+
+
+def _check_owner(owner: str, document: Optional[Dict[str, Any]]):
+    """文档存在且id不是owner时抛出 NotDocumentOwner"""
+    if document is not None and (not isinstance(document, dict) or document.get("id") != owner):
+        raise NotDocumentOwner(owner, document.get("id") if isinstance(document, dict) else None)
+
+
+_histories: Dict[int, DIDVersionHistory] = {}
+_histories_lock = threading.Lock()
+
+
+def get_did_versions(store: DIDStore) -> DIDVersionHistory:
+    """返回DID存储对应的版本历史，每个存储一个；全局存储使用 DID_VERSION_DB_PATH，其他存储使用其旁边按存储区分的文件"""
+    history = _histories.get(id(store))
+    if history is None:
+        with _histories_lock:
+            history = _histories.get(id(store))
+            if history is None:
+                db_path = settings.DID_VERSION_DB_PATH
+                if store is not get_did_store():
+                    # 实例settings指定的其他存储各用一个历史库，不同存储中相同的用户ID不会共用历史
+                    path = Path(db_path)
+                    digest = hashlib.sha1(f"{store.backend}:{store.root}".encode("utf-8")).hexdigest()[:8]
+                    db_path = str(path.with_name(f"{path.stem}_{digest}{path.suffix}"))
+                history = _histories[id(store)] = DIDVersionHistory(
+                    store, db_path, settings.DID_VERSION_SNAPSHOT_INTERVAL
+                )
+    return history
@@ -0,0 +1,307 @@
+"""
+ANP聊天历史存储模块：SQLite持久化，FTS5全文索引，后台线程批量写入
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+
+# 项目根目录，相对路径的数据库文件以此为基准
+PROJECT_ROOT = Path(__file__).parents[2]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    did TEXT,
+    peer TEXT,
+    user_message TEXT,
+    assistant_message TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chat_history_did_ts ON chat_history(did, ts);
+CREATE INDEX IF NOT EXISTS idx_chat_history_ts ON chat_history(ts);
+CREATE TRIGGER IF NOT EXISTS chat_history_ai AFTER INSERT ON chat_history BEGIN
+    INSERT INTO chat_history_fts(rowid, user_message, assistant_message)
+    VALUES (new.id, new.user_message, new.assistant_message);
+END;
+CREATE TRIGGER IF NOT EXISTS chat_history_ad AFTER DELETE ON chat_history BEGIN
+    INSERT INTO chat_history_fts(chat_history_fts, rowid, user_message, assistant_message)
+    VALUES ('delete', old.id, old.user_message, old.assistant_message);
+END;
+"""
+
+_FTS_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5("
+    "user_message, assistant_message, content='chat_history', content_rowid='id', tokenize='{tokenizer}')"
+)
+
+_COLUMNS = ("id", "ts", "source", "did", "peer", "user_message", "assistant_message", "status")
+
+
+def resolve_db_path(path: str) -> Path:
+    """将配置中的数据库路径转换为绝对路径（相对路径以项目根目录为基准）"""
+    db_path = Path(path)
+    if not db_path.is_absolute():
+        db_path = PROJECT_ROOT / db_path
+    return db_path
+
+
+class ChatHistoryStore:
+    """SQLite聊天历史存储，后台线程批量写入"""
+
+    def __init__(self, db_path: str, batch_size: int = 100, flush_interval: float = 0.5,
+                 max_queue: int = 10000, enabled: bool = True):
+        self.db_path = resolve_db_path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._trigram = False
+        self._local = threading.local()
+
+        self.written = 0
+        self.dropped = 0
+
+    # ------------------------------------------------------------------ #
+    # 连接与表结构
+    # ------------------------------------------------------------------ #
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = self._connect()
+            try:
+                # trigram分词器(SQLite>=3.34)支持中文子串检索，不可用时退回unicode61
+                try:
+                    conn.execute(_FTS_TABLE.format(tokenizer="trigram"))
+                except sqlite3.OperationalError:
+                    conn.execute(_FTS_TABLE.format(tokenizer="unicode61"))
+                row = conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE name = 'chat_history_fts'"
+                ).fetchone()
+                self._trigram = bool(row and "trigram" in row[0])
+                conn.executescript(_SCHEMA)
+                conn.commit()
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._ensure_schema()
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------ #
+    # 写入
+    # ------------------------------------------------------------------ #
+    def start(self):
+        """启动后台写入线程（重复调用无副作用）"""
+        if self._writer and self._writer.is_alive():
+            return
+        with self._start_lock:
+            if self._writer and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+            self._writer.start()
+
+    def record(self, source: str, did: Optional[str] = None, user_message: Optional[str] = None,
+               assistant_message: Optional[str] = None, status: Optional[str] = None,
+               peer: Optional[str] = None) -> bool:
+        """
+        记录一条聊天消息，只做非阻塞入队
+
+        Args:
+            source: 消息来源，server 或 client
+            did: 对端或本地DID
+            user_message: 请求消息
+            assistant_message: 回复消息
+            status: 消息状态
+            peer: 对端地址
+
+        Returns:
+            bool: 是否成功入队；队列已满时丢弃并返回False
+        """
+        if not self.enabled:
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((time.time(), source, did, peer, user_message, assistant_message, status))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"聊天历史队列已满，丢弃消息 (累计丢弃 {self.dropped})")
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        等待已入队的消息全部写入
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        if not self._writer or not self._writer.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self):
+        self._ensure_schema()
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size or waiters:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(conn, batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO chat_history (ts, source, did, peer, user_message, assistant_message, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    batch
+                )
+            self.written += len(batch)
+        except Exception as e:
+            logging.error(f"写入聊天历史失败，丢弃 {len(batch)} 条记录: {e}")
+            self.dropped += len(batch)
+
+    # ------------------------------------------------------------------ #
+    # 查询
+    # ------------------------------------------------------------------ #
+    def _match_expression(self, text: str) -> Optional[str]:
+        """构造FTS5 MATCH表达式，返回None表示需要退回LIKE匹配"""
+        terms = [t for t in text.split() if t]
+        if not terms:
+            return None
+        if self._trigram and any(len(t) < 3 for t in terms):
+            return None
+        return " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+    def query(self, did: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              text: Optional[str] = None, limit: int = 50, offset: int = 0,
+              participant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询聊天历史（阻塞调用，异步环境中请放到线程池执行）
+
+        Args:
+            did: 按DID过滤
+            since: 起始时间（epoch秒）
+            until: 结束时间（epoch秒）
+            text: 全文检索关键字，空格分隔表示同时包含
+            limit: 返回条数
+            offset: 偏移量
+            participant: 只返回该DID作为DID或对端参与的记录
+
+        Returns:
+            List[Dict[str, Any]]: 按时间倒序排列的记录
+        """
+        conn = self._reader()
+        clauses, params = [], []
+        if participant is not None:
+            clauses.append("(did = ? OR peer = ?)")
+            params.extend([participant, participant])
+        if did:
+            clauses.append("did = ?")
+            params.append(did)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(until)
+        if text and text.strip():
+            match = self._match_expression(text)
+            if match:
+                clauses.append("id IN (SELECT rowid FROM chat_history_fts WHERE chat_history_fts MATCH ?)")
+                params.append(match)
+            else:
+                for term in text.split():
+                    # 关键字中的 % 和 _ 按字面匹配
+                    pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    clauses.append("(user_message LIKE ? ESCAPE '\\' OR assistant_message LIKE ? ESCAPE '\\')")
+                    params.extend([pattern, pattern])
+
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM chat_history"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        records = []
+        for row in conn.execute(sql, params):
+            record = dict(row)
+            record["time"] = datetime.fromtimestamp(record["ts"], tz=timezone.utc).isoformat()
+            records.append(record)
+        return records
+
+    def stats(self) -> Dict[str, Any]:
+        """返回写入统计信息"""
+        return {
+            "db_path": str(self.db_path),
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+# 全局单例
+chat_history = ChatHistoryStore(
+    settings.HISTORY_DB_PATH,
+    batch_size=settings.HISTORY_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+    max_queue=settings.HISTORY_QUEUE_SIZE,
+    enabled=settings.HISTORY_ENABLED,
+)
+
+# 进程退出前尽量写完队列中的记录
+atexit.register(chat_history.flush, 2.0)
@@ -0,0 +1,244 @@
+"""
+跨进程共享状态模块：用SQLite WAL文件保存组件状态和最近的连接事件
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from anp_core.store.history_store import resolve_db_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS components (
+    name TEXT PRIMARY KEY,
+    running INTEGER NOT NULL,
+    host TEXT,
+    port INTEGER,
+    pid INTEGER,
+    started_at REAL,
+    updated_at REAL NOT NULL,
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    source TEXT,
+    pid INTEGER,
+    payload TEXT NOT NULL
+);
+"""
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    """检查进程是否存活"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在但属于其他用户
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class SharedStateStore:
+    """基于SQLite WAL的共享状态存储，每个线程持有一个长连接"""
+
+    def __init__(self, db_path: str, max_events: int = 200):
+        self.db_path = resolve_db_path(db_path)
+        self.max_events = max_events
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with self._schema_lock:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------ #
+    # 组件状态
+    # ------------------------------------------------------------------ #
+    def set_component(self, name: str, running: bool, port: Optional[int] = None,
+                      host: Optional[str] = None, pid: Optional[int] = None, **info: Any):
+        """
+        更新组件状态
+
+        Args:
+            name: 组件名称，如 server / connector
+            running: 是否运行中
+            port: 端口
+            host: 主机
+            pid: 进程ID，默认当前进程
+            **info: 额外信息，以JSON保存
+        """
+        now = time.time()
+        pid = pid or os.getpid()
+        try:
+            conn = self._conn()
+            previous = conn.execute("SELECT running, started_at FROM components WHERE name = ?", (name,)).fetchone()
+            started_at = now
+            if running and previous and previous["running"] and previous["started_at"]:
+                started_at = previous["started_at"]
+            conn.execute(
+                "INSERT OR REPLACE INTO components (name, running, host, port, pid, started_at, updated_at, info) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, int(running), host, port, pid, started_at if running else None, now,
+                 json.dumps(info, ensure_ascii=False) if info else None)
+            )
+        except Exception as e:
+            logging.error(f"更新共享状态失败 ({name}): {e}")
+
+    def get_component(self, name: str) -> Dict[str, Any]:
+        """
+        读取组件状态，记录的进程已退出时视为未运行
+
+        Returns:
+            Dict[str, Any]: 组件状态
+        """
+        try:
+            row = self._conn().execute("SELECT * FROM components WHERE name = ?", (name,)).fetchone()
+        except Exception as e:
+            logging.error(f"读取共享状态失败 ({name}): {e}")
+            row = None
+        if row is None:
+            return {"name": name, "running": False, "port": None, "host": None, "pid": None}
+        component = dict(row)
+        component["info"] = json.loads(component["info"]) if component["info"] else {}
+        component["running"] = bool(component["running"]) and pid_alive(component["pid"])
+        return component
+
+    def is_running(self, name: str) -> bool:
+        """组件是否在任意进程中运行"""
+        return self.get_component(name)["running"]
+
+    def release_components(self, pid: Optional[int] = None):
+        """将指定进程登记的所有组件标记为停止（进程退出时调用）"""
+        pid = pid or os.getpid()
+        try:
+            self._conn().execute(
+                "UPDATE components SET running = 0, started_at = NULL, updated_at = ? WHERE pid = ?",
+                (time.time(), pid)
+            )
+        except Exception as e:
+            logging.error(f"释放共享状态失败: {e}")
+
+    # ------------------------------------------------------------------ #
+    # 连接事件
+    # ------------------------------------------------------------------ #
+    def add_event(self, source: str, payload: Dict[str, Any]) -> Optional[int]:
+        """
+        追加一条连接事件，只保留最近 max_events 条
+
+        Returns:
+            Optional[int]: 事件ID
+        """
+        try:
+            conn = self._conn()
+            cursor = conn.execute(
+                "INSERT INTO events (ts, source, pid, payload) VALUES (?, ?, ?, ?)",
+                (time.time(), source, os.getpid(), json.dumps(payload, ensure_ascii=False, default=str))
+            )
+            event_id = cursor.lastrowid
+            conn.execute("DELETE FROM events WHERE id <= ?", (event_id - self.max_events,))
+            return event_id
+        except Exception as e:
+            logging.error(f"写入共享事件失败: {e}")
+            return None
+
+    def get_events(self, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        读取事件，按ID升序返回最近的 limit 条
+
+        Args:
+            after_id: 只返回ID大于该值的事件
+            limit: 最大条数
+        """
+        try:
+            rows = self._conn().execute(
+                "SELECT id, payload FROM events WHERE id > ? ORDER BY id DESC LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+        except Exception as e:
+            logging.error(f"读取共享事件失败: {e}")
+            return []
+        events = []
+        for row in reversed(rows):
+            event = json.loads(row["payload"])
+            event["event_id"] = row["id"]
+            events.append(event)
+        return events
+
+    def latest_event_id(self) -> int:
+        """最新事件ID，没有事件时返回0"""
+        try:
+            row = self._conn().execute("SELECT MAX(id) FROM events").fetchone()
+            return row[0] or 0
+        except Exception as e:
+            logging.error(f"读取共享事件失败: {e}")
+            return 0
+
+    def count_events(self) -> int:
+        """当前保留的事件数量"""
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        except Exception as e:
+            logging.error(f"读取共享事件失败: {e}")
+            return 0
+
+    def clear_events(self) -> int:
+        """清除所有事件，返回清除的数量"""
+        try:
+            return self._conn().execute("DELETE FROM events").rowcount
+        except Exception as e:
+            logging.error(f"清除共享事件失败: {e}")
+            return 0
+
+    async def wait_for_event(self, after_id: int, timeout: float, poll_interval: float = 0.2) -> bool:
+        """
+        等待出现ID大于 after_id 的事件（事件可能来自其他进程）
+
+        Returns:
+            bool: 超时前是否有新事件
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.latest_event_id() > after_id:
+                return True
+            await asyncio.sleep(poll_interval)
+        return self.latest_event_id() > after_id
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回服务器、客户端状态和事件数量的快照"""
+        return {
+            "server": self.get_component("server"),
+            "client": self.get_component("connector"),
+            "connection_events_count": self.count_events()
+        }
+
+
+# 全局单例
+shared_state = SharedStateStore(settings.STATE_DB_PATH, max_events=settings.STATE_MAX_EVENTS)
+
+# 进程退出时释放本进程登记的组件状态
+atexit.register(shared_state.release_components)
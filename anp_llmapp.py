@@ -1,6 +1,7 @@
 """DID WBA Example with both Client and Server capabilities."""
 import argparse
 import asyncio
+import concurrent.futures
 import json
 import logging
 import os
@@ -36,7 +37,10 @@ from anp_core.client.client import (
     client_chat_messages as core_client_chat_messages,
     client_new_message_event as core_client_new_message_event,
     connector_running as core_client_running,
+    get_default_identity,
 )
+from anp_core.client.fanout import fanout_stream, required_successes, unique_targets, FANOUT_MODES
+from anp_core.client.runtime import client_runtime
 from anp_core.server.server import ANP_resp_start, ANP_resp_stop, server_status
 from utils.log_base import set_log_color_level
 
@@ -331,26 +335,28 @@ def resp_stop():
     # 调用did_core中的stop_server函数
     return ANP_resp_stop()
 
-"""
+
 def start_anp_request(port=None, unique_id_arg=None, silent=False, from_chat=False, msg=None):
-    # 启动客户端线程
+    """在客户端运行时上发起DID认证请求（非阻塞）
     
-    # Args:
-    #     port: 可选的目标服务器端口号
-    #     unique_id_arg: 可选的唯一ID
-    #     silent: 是否静默模式（不显示日志）
-    #     from_chat: 是否从聊天线程调用
-    #     msg: 要发送的消息
-
+    Args:
+        port: 可选的目标服务器端口号
+        unique_id_arg: 可选的唯一ID
+        silent: 是否静默模式（不显示日志）
+        from_chat: 是否从聊天线程调用
+        msg: 要发送的消息
+        
+    Returns:
+        Future: 认证结果（访问令牌，失败时为None）
+    """
     global unique_id
     
     if unique_id_arg:
         unique_id = unique_id_arg
+    if port is not None:
+        settings.TARGET_SERVER_PORT = port
     
-    
-    return ANP_req_auth(unique_id=unique_id_arg, silent=silent, from_chat=from_chat, msg=msg)
-    # return core_start_client(port=port, unique_id=unique_id_arg, message=msg)
-"""
+    return client_runtime.submit(ANP_req_auth(unique_id=unique_id_arg, silent=silent, from_chat=from_chat, msg=msg))
 
 """
 def stop_client():
@@ -367,29 +373,54 @@ def chat_to_ANP(custom_msg, token=None, unique_id_arg=None):
         token: 认证令牌，如果为None则会启动客户端认证获取token
         unique_id_arg: 可选的唯一ID，用于客户端认证
     """
-    # 使用线程模式运行，避免事件循环问题
-    thread = threading.Thread(
-        target=_chat_to_ANP_thread,
-        args=(custom_msg, token, unique_id_arg),
-        daemon=True
-    )
-    thread.start()
+    # 提交到常驻的客户端运行时，不再为每条消息新建线程和事件循环
+    client_runtime.submit(_chat_to_ANP_impl(custom_msg, token, unique_id_arg))
     return True
 
-def _chat_to_ANP_thread(custom_msg, token=None, unique_id_arg=None):
-    """在线程中运行异步函数的同步包装器"""
-    # 创建新的事件循环
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+def broadcast_to_ANP(targets, custom_msg, mode="all", count=None, unique_id_arg=None, timeout=None):
+    """向多个目标并发发送同一条消息，结果按到达顺序打印（阻塞直到满足完成条件）
+    
+    Args:
+        targets: 目标列表，支持URL、host:port或端口号
+        custom_msg: 要发送的消息
+        mode: 完成模式 all / first / quorum
+        count: first模式的N或quorum模式的法定数量
+        unique_id_arg: 可选的唯一ID，默认使用当前客户端身份
+        timeout: 整个广播的超时时间（秒）
+    
+    Returns:
+        int: 成功应答数，超时时为超时前收到的成功应答数
+    """
+    identity = get_default_identity(unique_id_arg or unique_id)
+
+    succeeded = 0
+
+    async def run():
+        nonlocal succeeded
+        async for result in fanout_stream(targets, custom_msg, identity, mode=mode, count=count):
+            succeeded += result.ok
+            item = result.to_dict()
+            if result.ok:
+                print(f"[{item['elapsed_ms']} ms] {item['target']}: {item['answer']}")
+            else:
+                print(f"[{item['elapsed_ms']} ms] {item['target']} 失败: {item['error'] or item['status']}")
+        return succeeded
+
+    # 与 fanout_stream 相同的规范化和去重，8000、localhost:8000 和 http://localhost:8000 是同一个目标
+    total = len(unique_targets(targets))
+    needed = required_successes(mode, total, count)
+    print(f"向 {total} 个目标广播（{mode}，需要 {needed} 个成功应答）: {custom_msg}")
+    future = client_runtime.submit(run())
     try:
-        # 运行异步函数
-        loop.run_until_complete(_chat_to_ANP_impl(custom_msg, token, unique_id_arg))
-    except Exception as e:
-        logging.error(f"线程中运行_chat_to_ANP_impl时出错: {e}")
-        print(f"发送消息时出错: {e}")
-    finally:
-        # 关闭事件循环
-        loop.close()
+        future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # 取消仍在进行的请求
+        future.cancel()
+        print(f"广播超时（{timeout} 秒）: {succeeded} 个成功应答，需要 {needed} 个")
+        return succeeded
+    print(f"广播结束: {succeeded} 个成功应答")
+    return succeeded
+
 async def _chat_to_ANP_impl(custom_msg, token=None, unique_id_arg=None):
     """发送消息的实际实现（内部函数）
     """
@@ -399,13 +430,13 @@ async def _chat_to_ANP_impl(custom_msg, token=None, unique_id_arg=None):
         base_url = f"http://{target_host}:{target_port}"
         
         if not token:
-            print(f"无token，正在启动客户端认证获取token...\n并发送消息: {custom_msg}")
-            await ANP_req_auth(unique_id=unique_id_arg, msg=custom_msg)
-            token = os.environ.get('did-token', None)
-            
-        print(f"使用token...\n发送消息: {custom_msg}")
+            # 无需先单独认证：没有令牌时首个请求携带DID签名，令牌随响应头返回
+            print(f"无token，首个请求将携带DID签名完成认证...\n发送消息: {custom_msg}")
+        else:
+            print(f"使用token...\n发送消息: {custom_msg}")
         # 调用did_core中的send_message_to_chat函数
-        status, response = await ANP_req_chat(base_url=base_url, silent=True, from_chat=True, msg=custom_msg, token=token)
+        status, response = await ANP_req_chat(base_url=base_url, silent=True, from_chat=True, msg=custom_msg,
+                                              token=token, unique_id=unique_id_arg)
         
         # 通知聊天线程有新消息
         if status:
@@ -484,10 +515,8 @@ async def run_chat():
                         custom_msg = parts[1].strip()
                     print(f"检测到特殊命令 @anp-bot\n将发送消息: {custom_msg}")
                     chat_running = False
-                    # 获取token，如果环境变量中不存在则使用None
-                    token = os.environ.get('did-token', None)
-                    # 调用send_msg函数发送消息（非阻塞方式）
-                    chat_to_ANP(custom_msg, token, unique_id)
+                    # 令牌由令牌管理器按身份缓存和刷新，这里不再传入token
+                    chat_to_ANP(custom_msg, None, unique_id)
                     
                     print("\n客户端执行中，你可以先聊。")
                     chat_running = True
@@ -601,16 +630,12 @@ def start_chat():
         return
     
     # 检查服务器是否已在运行，如果没有则自动启动（静默模式）
-    if not server_thread or not server_thread.is_alive():
-        # 启动服务器线程（不打印日志信息）
+    if not server_status.is_running():
+        # 启动服务器（不打印日志信息），端口就绪后返回
         original_log_level = logging.getLogger().level
         logging.getLogger().setLevel(logging.ERROR)  # 只显示错误日志
         
-        server_thread = threading.Thread(target=resp_start, daemon=True)
-        server_thread.start()
-        
-        # 等待服务器启动
-        time.sleep(1)
+        resp_start()
         
     
     # 启动聊天线程
@@ -643,11 +668,13 @@ def stop_chat():
 
 def show_status():
     """显示当前服务器、客户端和聊天状态"""
-    server_status = "运行中" if server_thread and server_thread.is_alive() else "已停止"
+    resp_status = "运行中" if server_status.is_running() else "已停止"
     client_status = "运行中" if client_thread and client_thread.is_alive() else "已停止"
     chat_status = "运行中" if chat_thread and chat_thread.is_alive() else "已停止"
     
-    print(f"监听状态: {server_status}")
+    print(f"监听状态: {resp_status}")
+    if server_status.is_running() and server_status.startup_latency:
+        print(f"监听端口: {server_status.port}，启动耗时: {server_status.startup_latency * 1000:.1f} ms")
     print(f"请求状态: {client_status}")
     print(f"聊天状态: {chat_status}")
     if unique_id:
@@ -661,6 +688,7 @@ def show_help():
     print("  stop resp - 停止anp服务器")
     print("  start req [msg] [port] [unique_id] - 启动anp请求，可选指定目标服务器端口和唯一ID")
     print("  stop req - 停止anp请求")
+    print("  broadcast <目标1,目标2,...> <msg> [all|first[:N]|quorum[:N]] - 并发向多个agent发送消息，目标可为端口、host:port或URL")
     print("  start llm - 启动LLM聊天线程")
     print("  stop llm - 停止LLM聊天线程")
     print("  status - 显示服务器、客户端和聊天状态")
@@ -688,17 +716,14 @@ def anp_test():
         # 1. 启动服务器
         logger.info("===== 步骤1: 启动服务器 =====")
         server_result = resp_start()
+        # resp_start在端口可接受连接后才返回，无需额外等待
         logger.info(f"服务器启动结果: {server_result}")
-        logger.info("等待服务器完全启动...")
-        time.sleep(3)  # 等待服务器完全启动
         
         # 2. 发送消息
         logger.info("\n===== 步骤2: 发送消息 =====")
         test_message = "这是一条测试消息，请回复"  
         logger.info(f"发送消息: {test_message}")
-        # 获取token，如果环境变量中不存在则使用None
-        token = os.environ.get('did-token', None)
-        chat_result = chat_to_ANP(test_message, token)
+        chat_result = chat_to_ANP(test_message)
         logger.info(f"消息发送结果: {chat_result}")
         logger.info("等待消息处理...")
         time.sleep(5)  # 等待消息处理
@@ -731,6 +756,8 @@ def main():
     parser.add_argument("--unique-id", type=str, help="Unique ID for client example", default=None)
     parser.add_argument("--port", type=int, help=f"Server port (default: {settings.PORT})", default=settings.PORT)
     parser.add_argument("--target-port", type=int, help=f"Target server port for client (default: {settings.TARGET_SERVER_PORT})", default=None)
+    parser.add_argument("--resp-mode", choices=["thread", "process"], help=f"Responder run mode (default: {settings.RESPONDER_MODE})", default=None)
+    parser.add_argument("--workers", type=int, help=f"Responder worker processes sharing the port via SO_REUSEPORT (default: {settings.RESPONDER_WORKERS})", default=None)
     
     args =parser.parse_args()
     
@@ -741,6 +768,12 @@ def main():
     if args.port != settings.PORT:
         settings.PORT = args.port
 
+    if args.resp_mode:
+        settings.RESPONDER_MODE = args.resp_mode
+
+    if args.workers:
+        settings.RESPONDER_WORKERS = args.workers
+
     import os
     os.environ["PORT"] = f"{settings.PORT}"
     
@@ -812,6 +845,25 @@ def main():
                     client_thread.join()
                 print("客户端已退出，恢复命令行控制。")
                 continue  # 跳过本轮命令输入
+            elif command.startswith("broadcast"):
+                # broadcast <目标1,目标2,...> <msg> [all|first[:N]|quorum[:N]]
+                parts = command.split()
+                if len(parts) < 3:
+                    print("用法: broadcast <目标1,目标2,...> <msg> [all|first[:N]|quorum[:N]]")
+                    continue
+                mode, count = "all", None
+                mode_arg = parts[-1].split(":", 1)
+                if len(parts) > 3 and mode_arg[0] in FANOUT_MODES:
+                    mode = mode_arg[0]
+                    if len(mode_arg) > 1:
+                        if not mode_arg[1].isdigit() or int(mode_arg[1]) < 1:
+                            print(f"无效的数量: {mode_arg[1]}，N 必须是正整数")
+                            print("用法: broadcast <目标1,目标2,...> <msg> [all|first[:N]|quorum[:N]]")
+                            continue
+                        count = int(mode_arg[1])
+                    parts = parts[:-1]
+                targets = [target for target in parts[1].split(",") if target]
+                broadcast_to_ANP(targets, " ".join(parts[2:]), mode, count)
             elif command == "start llm":
                 start_chat()
                 # 阻塞主进程直到 chat_thread 结束，避免输入竞争
@@ -6,13 +6,17 @@ import json
 import os
 from typing import List
 
+import httpx
 from fastapi import status
 from loguru import logger
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
+from mcp.shared._httpx_utils import MCP_DEFAULT_SSE_READ_TIMEOUT, MCP_DEFAULT_TIMEOUT, create_mcp_http_client
 from mcp.types import TextResourceContents, TextContent
 
+from core.config import settings
+
 logger.add("logs/mcp_sse_client.log", rotation="1000 MB", retention="7 days", encoding="utf-8")
 
 
@@ -42,14 +46,29 @@ def get_text_content_data(text_contents: List[TextContent]):
     return content_data
 
 
+def uds_http_client_factory(path: str):
+    """返回经Unix域套接字连接MCP SSE服务器的httpx客户端工厂"""
+    def factory(headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=path),
+            headers=headers,
+            timeout=timeout or httpx.Timeout(MCP_DEFAULT_TIMEOUT, read=MCP_DEFAULT_SSE_READ_TIMEOUT),
+            auth=auth
+        )
+    return factory
+
+
 async def main():
     """主函数，连接到SSE服务器并执行操作"""
-    server_url = "http://localhost:8080/sse"
+    uds = settings.MCP_SSE_UDS
+    # 经Unix域套接字连接时URL中的主机只用于Host头
+    server_url = "http://localhost/sse" if uds else "http://localhost:8080/sse"
+    client_factory = uds_http_client_factory(uds) if uds else create_mcp_http_client
 
-    logger.info(f"1. Connecting to SSE server at {server_url}...")
+    logger.info(f"1. Connecting to SSE server at {server_url}{f' via {uds}' if uds else ''}...")
 
     # 通过SSE建立连接
-    async with sse_client(url=server_url) as streams:
+    async with sse_client(url=server_url, httpx_client_factory=client_factory) as streams:
         # 创建客户端会话
         async with ClientSession(*streams) as session:
             # 初始化会话
@@ -68,7 +87,7 @@ async def main():
 
             await asyncio.sleep(2)
 
-            # todo stdio 启动服务 的进程是临时的，全局变量的方式获取状态 可能无法实现；需要redis或者kafuka之类的中间件
+            # stdio 启动服务的进程是临时的，状态从共享状态存储(anp_core/store/state_store.py)读取
             logger.info("\n7. 检查服务器状态...")
             server_status = await session.read_resource("status://did-wba")
             logger.info(f"8. 服务器状态: {server_status.contents}")
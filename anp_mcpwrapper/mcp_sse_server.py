@@ -19,6 +19,8 @@ from mcp.server.fastmcp import FastMCP, Context
 from anp_core.server.server import (
     ANP_resp_start,
     ANP_resp_stop,
+    ANP_resp_start_async,
+    ANP_resp_stop_async,
     server_status,
     # server_running,  # 不再直接使用全局变量
 )
@@ -28,8 +30,10 @@ from anp_core.client.client import (
     ANP_connector_stop,
     connector_running,
     client_chat_messages,
-    client_new_message_event
+    client_new_message_event,
+    get_default_identity
 )
+from anp_core.client.fanout import fanout_stream, required_successes, unique_targets
 
 from mcp.server.fastmcp import FastMCP
 from mcp.server.sse import SseServerTransport
@@ -42,6 +46,10 @@ import uvicorn
 
 # Import server-side message handling
 from api.anp_nlp_router import anp_nlp_resp_messages, anp_nlp_resp_new_message_event as server_new_message_event
+from api.history_router import parse_time
+from anp_core.store.history_store import chat_history
+from anp_core.store.state_store import shared_state
+from core.config import settings
 
 # Store connection events for notification
 connection_events = []
@@ -113,6 +121,8 @@ async def connection_event_listener(app_context: AppContext):
                     # 获取最新消息
                     latest_message = client_chat_messages[-1]
                     latest_message['source'] = 'client'  # 添加来源标记
+                    # 写入共享状态，其他MCP进程也能读取
+                    shared_state.add_event('client', latest_message)
 
                     # 添加到连接事件
                     connection_events.append(latest_message)
@@ -136,6 +146,8 @@ async def connection_event_listener(app_context: AppContext):
                     # 获取最新消息
                     latest_message = anp_nlp_resp_messages[-1]
                     latest_message['source'] = 'server'  # 添加来源标记
+                    # 写入共享状态，其他MCP进程也能读取
+                    shared_state.add_event('server', latest_message)
 
                     # 添加到连接事件
                     connection_events.append(latest_message)
@@ -161,11 +173,12 @@ async def connection_event_listener(app_context: AppContext):
 
 
 @mcp.tool()
-async def start_did_server(ctx: Context, port: Optional[int] = None) -> Dict[str, Any]:
+async def start_did_server(ctx: Context, port: Optional[int] = None, mode: Optional[str] = None) -> Dict[str, Any]:
     """Start the DID WBA server.
     
     Args:
         port: Optional server port number (default: from settings)
+        mode: Optional run mode, "thread" or "process" (default: from settings)
         
     Returns:
         Dict with server status information
@@ -176,25 +189,30 @@ async def start_did_server(ctx: Context, port: Optional[int] = None) -> Dict[str
     if server_status.is_running():
         return {"status": "already_running", "message": "服务器已经在运行中"}
 
+    # 服务器可能由其他进程（如另一次stdio启动）运行，避免重复启动
+    shared_server = shared_state.get_component("server")
+    if shared_server["running"]:
+        return {
+            "status": "already_running",
+            "message": f"服务器已在进程 {shared_server['pid']} 的端口 {shared_server['port']} 运行中",
+            "port": shared_server["port"],
+            "pid": shared_server["pid"]
+        }
+
     try:
         logger.info(f"Starting DID WBA server on port {port if port else 'default'}")
         
-        # 直接调用start_server，它内部已经实现了子线程启动
-        ANP_resp_start(port=port)
-
-        max_retries = 10  # 增加重试次数
-        for _ in range(max_retries):
-            if server_status.is_running():
-                break
-            await asyncio.sleep(1)  # 增加等待间隔
-        else:
-            raise RuntimeError("Server did not start in time. Wait server_running event to check status.")
-
-        app_context.server_status = {"running": True, "port": port or server_status.port}
+        # 在子线程中启动服务器，端口可接受连接后才返回，绑定失败会立即返回False
+        if not await ANP_resp_start_async(port=port, mode=mode):
+            raise RuntimeError(f"服务器启动失败: {server_status.error or '等待就绪超时'}")
+
+        app_context.server_status = {"running": True, "port": server_status.port}
         return {
             "status": "success",
-            "message": f"服务器已在端口 {port if port else '默认端口'} 启动",
-            "is_running": True
+            "message": f"服务器已在端口 {server_status.port} 启动",
+            "is_running": True,
+            "mode": mode or settings.RESPONDER_MODE,
+            "startup_latency_ms": server_status.to_dict()["startup_latency_ms"]
         }
     except Exception as e:
         logger.error(f"Server start failed: {e}")
@@ -216,10 +234,17 @@ async def stop_did_server(ctx: Context) -> Dict[str, Any]:
 
     # Check if server is running
     if not server_status.is_running():
+        shared_server = shared_state.get_component("server")
+        if shared_server["running"]:
+            return {
+                "status": "not_owner",
+                "message": f"服务器由进程 {shared_server['pid']} 运行，无法从当前进程关闭",
+                "pid": shared_server["pid"]
+            }
         return {"status": "not_running", "message": "服务器未运行"}
 
     # Stop the server
-    ANP_resp_stop()
+    await ANP_resp_stop_async()
 
     # Update app context
     app_context.server_status = {"running": False, "port": None}
@@ -244,23 +269,19 @@ async def start_did_client(ctx: Context, port: Optional[int] = None, unique_id:
     Returns:
         Dict with client status information
     """
-    global connector_running, client_chat_messages, client_new_message_event
+    global client_chat_messages, client_new_message_event
 
     app_context = ctx.request_context.lifespan_context
 
     # Check if client is already running
-    if connector_running:
+    if shared_state.is_running("connector"):
         return {"status": "already_running", "message": "客户端已经在运行中"}
     
     # 在启动客户端前先清除事件和消息列表
     client_new_message_event.clear()
     
-    # Start the client - 在单独的线程中运行run_client
-    from anp_core.client.client import run_connector
-    import threading
-    client_thread = threading.Thread(target=run_connector, args=(unique_id, message))
-    client_thread.daemon = True
-    client_thread.start()
+    # Start the client - 提交到常驻的客户端运行时执行
+    ANP_connector_start(port=port, unique_id=unique_id, message=message)
 
     # Update app context
     app_context.client_status = {"running": True, "port": port, "unique_id": unique_id}
@@ -287,7 +308,7 @@ async def stop_did_client(ctx: Context) -> Dict[str, Any]:
     app_context = ctx.request_context.lifespan_context
 
     # Check if client is running
-    if not connector_running:
+    if not shared_state.is_running("connector"):
         return {"status": "not_running", "message": "客户端未运行"}
 
     # Stop the client
@@ -307,6 +328,9 @@ async def stop_did_client(ctx: Context) -> Dict[str, Any]:
 async def get_connection_events(ctx: Context, wait_for_new: bool = False, timeout: int = 300) -> Dict[str, Any]:
     """Get connection events from the DID WBA server.
     
+    Events are read from the shared state store, so events produced by
+    ANP processes other than this MCP process are included.
+    
     Args:
         wait_for_new: Whether to wait for new events
         timeout: Timeout in seconds for waiting for new events
@@ -314,29 +338,27 @@ async def get_connection_events(ctx: Context, wait_for_new: bool = False, timeou
     Returns:
         Dict with connection events
     """
-    global connection_events, new_connection_event
-
     try:
         if wait_for_new:
-            # Wait for new connection event with timeout
-            try:
-                await asyncio.wait_for(new_connection_event.wait(), timeout=timeout)
-                # Reset event for next notification
-                new_connection_event.clear()
-            except asyncio.TimeoutError:
+            # Wait for a new event from any process with timeout
+            last_event_id = shared_state.latest_event_id()
+            if not await shared_state.wait_for_event(last_event_id, timeout):
                 logger.warning("等待新连接事件超时")
                 return {
                     "status": "timeout",
                     "message": "等待新连接事件超时",
-                    "events": connection_events,
+                    "events": shared_state.get_events(),
                     "error": None
                 }
+            # Reset local event for next notification
+            new_connection_event.clear()
 
+        events = shared_state.get_events()
         return {
             "status": "success",
             "message": "获取连接事件成功",
-            "events_number": len(connection_events),
-            "events": connection_events,
+            "events_number": len(events),
+            "events": events,
             "error": None
         }
     except Exception as e:
@@ -350,13 +372,104 @@ async def get_connection_events(ctx: Context, wait_for_new: bool = False, timeou
         }
 
 
+@mcp.tool()
+async def query_chat_history(ctx: Context, did: Optional[str] = None, since: Optional[str] = None,
+                             until: Optional[str] = None, text: Optional[str] = None,
+                             limit: int = 50) -> Dict[str, Any]:
+    """Query persisted ANP chat history.
+    
+    Args:
+        did: Optional DID filter
+        since: Optional start time (ISO 8601 or epoch seconds)
+        until: Optional end time (ISO 8601 or epoch seconds)
+        text: Optional full-text search terms
+        limit: Maximum number of records to return
+
+    Returns:
+        Dict with matching history records, newest first
+    """
+    try:
+        records = await asyncio.to_thread(
+            chat_history.query,
+            did=did,
+            since=parse_time(since),
+            until=parse_time(until),
+            text=text,
+            limit=max(1, min(limit, 500))
+        )
+        return {
+            "status": "success",
+            "message": "查询聊天历史成功",
+            "records_number": len(records),
+            "records": records,
+            "error": None
+        }
+    except Exception as e:
+        logger.error(f"查询聊天历史时发生错误: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"查询聊天历史失败: {str(e)}",
+            "records_number": 0,
+            "records": [],
+            "error": str(e)
+        }
+
+
+@mcp.tool()
+async def broadcast_to_ANP(ctx: Context, targets: List[str], custom_msg: str, mode: str = "all",
+                           count: Optional[int] = None, unique_id_arg: Optional[str] = None,
+                           concurrency: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Send one message to many ANP agents concurrently.
+    
+    Args:
+        targets: Agent endpoints (URL, host:port or port number)
+        custom_msg: Message to send
+        mode: Completion mode: all, first (first N successes) or quorum
+        count: N for first, quorum size for quorum (default: majority)
+        unique_id_arg: Optional local identity, defaults to the current client identity
+        concurrency: Maximum concurrent requests (default: FANOUT_CONCURRENCY)
+        timeout: Per-target timeout in seconds (default: FANOUT_TIMEOUT)
+
+    Returns:
+        Dict with per-target results in arrival order; each result is also
+        streamed as a progress notification as soon as it arrives
+    """
+    try:
+        identity = get_default_identity(unique_id_arg)
+        total = len(unique_targets(targets))
+        needed = required_successes(mode, total, count)
+        results = []
+        async for result in fanout_stream(targets, custom_msg, identity, mode=mode, count=count,
+                                          concurrency=concurrency, timeout=timeout):
+            item = result.to_dict()
+            results.append(item)
+            await ctx.report_progress(len(results), total)
+            await ctx.info(f"{item['target']}: {item['answer'] if result.ok else item['error'] or item['status']}")
+        succeeded = sum(item["ok"] for item in results)
+        return {
+            "status": "success" if succeeded >= needed else "error",
+            "message": f"广播完成: {succeeded}/{len(results)} 个成功应答，需要 {needed} 个",
+            "mode": mode,
+            "results": results,
+            "error": None
+        }
+    except Exception as e:
+        logger.error(f"广播消息时出错: {e}")
+        return {
+            "status": "error",
+            "message": "广播消息失败",
+            "results": [],
+            "error": str(e)
+        }
+
+
 @mcp.tool()
 async def clear_connection_events(ctx: Context) -> Dict[str, Any]:
     """清除所有连接事件"""
     global connection_events
     
-    # 清除事件
-    event_count = len(connection_events)
+    # 清除事件（本进程和共享状态）
+    event_count = max(len(connection_events), shared_state.clear_events())
     connection_events.clear()
     
     return {
@@ -368,20 +481,21 @@ async def clear_connection_events(ctx: Context) -> Dict[str, Any]:
 
 @mcp.resource("status://did-wba")
 async def get_status() -> str:
-    """获取DID WBA服务器和客户端状态"""
-    global connection_events, server_status, connector_running
+    """获取DID WBA服务器和客户端状态（从共享状态读取，可反映其他进程中的服务）"""
+    snapshot = shared_state.snapshot()
+    server, client = snapshot["server"], snapshot["client"]
     
     # 创建状态信息
     status_info = {
         "server": {
-            "running": server_status.is_running(),
-            "status": {"running": server_status.is_running(), "port": server_status.port}
+            "running": server["running"],
+            "status": {"running": server["running"], "port": server["port"], "pid": server["pid"]}
         },
         "client": {
-            "running": connector_running,
-            "status": {"running": connector_running}
+            "running": client["running"],
+            "status": {"running": client["running"], "port": client["port"], "pid": client["pid"]}
         },
-        "connection_events_count": len(connection_events)
+        "connection_events_count": snapshot["connection_events_count"]
     }
     
     # 返回JSON字符串
@@ -422,6 +536,13 @@ def main():
     # 创建支持SSE的Starlette应用
     starlette_app = create_starlette_app(mcp_server, debug=True)
 
+    if settings.MCP_SSE_UDS:
+        # 本机MCP客户端经Unix域套接字连接，不占用TCP端口
+        logger.info(f"Starting MCP SSE server on unix socket {settings.MCP_SSE_UDS}...")
+        logger.info("SSE endpoint available at: http://localhost/sse (over the socket)")
+        uvicorn.run(starlette_app, uds=settings.MCP_SSE_UDS)
+        return
+
     port = 8080
     logger.info(f"Starting MCP SSE server on port {port}...")
     logger.info(f"SSE endpoint available at: http://localhost:{port}/sse")
@@ -93,7 +93,7 @@ async def run_client_session(streams):
 
         await asyncio.sleep(2)
 
-        # todo stdio 启动服务 的进程是临时的，全局变量的方式获取状态 可能无法实现；需要redis或者kafuka之类的中间件
+        # stdio 启动服务的进程是临时的，状态从共享状态存储(anp_core/store/state_store.py)读取
         logger.info("\n7. 检查服务器状态...")
         server_status = await session.read_resource("status://did-wba")
         logger.info(f"8. 服务器状态: {server_status.contents}")
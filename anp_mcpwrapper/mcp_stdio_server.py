@@ -30,13 +30,18 @@ from loguru import logger
 from mcp.server.fastmcp import FastMCP, Context
 
 # Import DID WBA server and client functions
-from anp_core.server.server import ANP_resp_start, ANP_resp_stop, server_status
-from anp_core.client.client import ANP_connector_start, ANP_connector_stop, connector_running, client_chat_messages, client_new_message_event, ANP_req_auth, ANP_req_chat
+from anp_core.server.server import ANP_resp_start, ANP_resp_stop, ANP_resp_start_async, ANP_resp_stop_async, server_status
+from anp_core.client.client import ANP_connector_start, ANP_connector_stop, connector_running, client_chat_messages, client_new_message_event, ANP_req_auth, ANP_req_chat, get_default_identity
+from anp_core.client.fanout import fanout_stream, required_successes, unique_targets
 
 # Import settings for server configuration
 from core.config import settings
 # Import server-side message handling
 from api.anp_nlp_router import anp_nlp_resp_messages, anp_nlp_resp_new_message_event as server_new_message_event
+from api.history_router import parse_time
+from anp_core.store.history_store import chat_history
+from anp_core.store.state_store import shared_state
+from anp_core.client.runtime import client_runtime
 
 # Store connection events for notification
 connection_events = []
@@ -104,6 +109,8 @@ async def connection_event_listener(app_context: AppContext):
                     # 获取最新消息
                     latest_message = client_chat_messages[-1]
                     latest_message['source'] = 'client'  # 添加来源标记
+                    # 写入共享状态，其他MCP进程也能读取
+                    shared_state.add_event('client', latest_message)
                     
                     # 添加到连接事件
                     connection_events.append(latest_message)
@@ -125,6 +132,8 @@ async def connection_event_listener(app_context: AppContext):
                     # 获取最新消息
                     latest_message = anp_nlp_resp_messages[-1]
                     latest_message['source'] = 'server'  # 添加来源标记
+                    # 写入共享状态，其他MCP进程也能读取
+                    shared_state.add_event('server', latest_message)
                     
                     # 添加到连接事件
                     connection_events.append(latest_message)
@@ -147,11 +156,12 @@ async def connection_event_listener(app_context: AppContext):
             await asyncio.sleep(1)  # 出错后等待一段时间再重试
 
 @mcp.tool()
-def start_did_server(ctx: Context, port: Optional[int] = None) -> Dict[str, Any]:
+async def start_did_server(ctx: Context, port: Optional[int] = None, mode: Optional[str] = None) -> Dict[str, Any]:
     """Start the DID WBA server.
     
     Args:
         port: Optional server port number (default: from settings)
+        mode: Optional run mode, "thread" or "process" (default: from settings)
         
     Returns:
         Dict with server status information
@@ -163,19 +173,29 @@ def start_did_server(ctx: Context, port: Optional[int] = None) -> Dict[str, Any]
     if server_status.is_running():
         return {"status": "already_running", "message": "服务器已经在运行中"}
 
+    # 服务器可能由其他进程（如另一次stdio启动）运行，避免重复启动
+    shared_server = shared_state.get_component("server")
+    if shared_server["running"]:
+        return {
+            "status": "already_running",
+            "message": f"服务器已在进程 {shared_server['pid']} 的端口 {shared_server['port']} 运行中",
+            "port": shared_server["port"],
+            "pid": shared_server["pid"]
+        }
+
     try:
         logger.info(f"Starting DID WBA server on port {port if port else 'default'}")
-        if not ANP_resp_start(port=port):  # 检查启动返回值
-            raise RuntimeError("服务器启动失败")
+        # 端口可接受连接后才返回，绑定失败会立即返回False
+        if not await ANP_resp_start_async(port=port, mode=mode):
+            raise RuntimeError(f"服务器启动失败: {server_status.error or '等待就绪超时'}")
 
-        # 服务器已经启动，不需要等待状态更新
-        # server_status对象会在start_server函数中自动更新状态
-
-        app_context.server_status = {"running": True, "port": port}
+        app_context.server_status = {"running": True, "port": server_status.port}
         return {
             "status": "success",
-            "message": f"服务器已在端口 {port if port else '默认端口'} 启动",
-            "is_running": True
+            "message": f"服务器已在端口 {server_status.port} 启动",
+            "is_running": True,
+            "mode": mode or settings.RESPONDER_MODE,
+            "startup_latency_ms": server_status.to_dict()["startup_latency_ms"]
         }
     except Exception as e:
         logger.error(f"Server start failed: {e}")
@@ -197,10 +217,17 @@ async def stop_did_server(ctx: Context) -> Dict[str, Any]:
     
     # Check if server is running
     if not server_status.is_running():
+        shared_server = shared_state.get_component("server")
+        if shared_server["running"]:
+            return {
+                "status": "not_owner",
+                "message": f"服务器由进程 {shared_server['pid']} 运行，无法从当前进程关闭",
+                "pid": shared_server["pid"]
+            }
         return {"status": "not_running", "message": "服务器未运行"}
     
     # Stop the server
-    ANP_resp_stop()
+    await ANP_resp_stop_async()
     
     # Update app context
     app_context.server_status = {"running": False, "port": None}
@@ -224,12 +251,10 @@ async def start_did_client(ctx: Context, port: Optional[int] = None, unique_id:
     Returns:
         Dict with client status information
     """
-    global connector_running
-
     app_context = ctx.request_context.lifespan_context
     
     # Check if client is already running
-    if connector_running:
+    if shared_state.is_running("connector"):
         return {"status": "already_running", "message": "客户端已经在运行中"}
     
     # Start the client
@@ -254,7 +279,7 @@ async def stop_did_client(ctx: Context) -> Dict[str, Any]:
     app_context = ctx.request_context.lifespan_context
     
     # Check if client is running
-    if not connector_running:
+    if not shared_state.is_running("connector"):
         return {"status": "not_running", "message": "客户端未运行"}
     
     # Stop the client
@@ -273,6 +298,9 @@ async def stop_did_client(ctx: Context) -> Dict[str, Any]:
 async def get_connection_events(ctx: Context, wait_for_new: bool = False, timeout: int = 300) -> Dict[str, Any]:
     """Get connection events from the DID WBA server.
     
+    Events are read from the shared state store, so events produced by
+    ANP processes other than this MCP process are included.
+    
     Args:
         wait_for_new: Whether to wait for new events
         timeout: Timeout in seconds for waiting for new events
@@ -280,29 +308,27 @@ async def get_connection_events(ctx: Context, wait_for_new: bool = False, timeou
     Returns:
         Dict with connection events
     """
-    global connection_events, new_connection_event
-
     try:
         if wait_for_new:
-            # Wait for new connection event with timeout
-            try:
-                await asyncio.wait_for(new_connection_event.wait(), timeout=timeout)
-                # Reset event for next notification
-                new_connection_event.clear()
-            except asyncio.TimeoutError:
+            # Wait for a new event from any process with timeout
+            last_event_id = shared_state.latest_event_id()
+            if not await shared_state.wait_for_event(last_event_id, timeout):
                 logging.warning("等待新连接事件超时")
                 return {
                     "status": "timeout",
                     "message": "等待新连接事件超时",
-                    "events": connection_events,
+                    "events": shared_state.get_events(),
                     "error": None
                 }
+            # Reset local event for next notification
+            new_connection_event.clear()
 
+        events = shared_state.get_events()
         return {
             "status": "success",
             "message": "获取连接事件成功",
-            "events_number": len(connection_events),
-            "events": connection_events,
+            "events_number": len(events),
+            "events": events,
             "error": None
         }
     except Exception as e:
@@ -316,24 +342,119 @@ async def get_connection_events(ctx: Context, wait_for_new: bool = False, timeou
         }
 
 
+@mcp.tool()
+async def query_chat_history(ctx: Context, did: Optional[str] = None, since: Optional[str] = None,
+                             until: Optional[str] = None, text: Optional[str] = None,
+                             limit: int = 50) -> Dict[str, Any]:
+    """Query persisted ANP chat history.
+    
+    Args:
+        did: Optional DID filter
+        since: Optional start time (ISO 8601 or epoch seconds)
+        until: Optional end time (ISO 8601 or epoch seconds)
+        text: Optional full-text search terms
+        limit: Maximum number of records to return
+
+    Returns:
+        Dict with matching history records, newest first
+    """
+    try:
+        records = await asyncio.to_thread(
+            chat_history.query,
+            did=did,
+            since=parse_time(since),
+            until=parse_time(until),
+            text=text,
+            limit=max(1, min(limit, 500))
+        )
+        return {
+            "status": "success",
+            "message": "查询聊天历史成功",
+            "records_number": len(records),
+            "records": records,
+            "error": None
+        }
+    except Exception as e:
+        logger.error(f"查询聊天历史时发生错误: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"查询聊天历史失败: {str(e)}",
+            "records_number": 0,
+            "records": [],
+            "error": str(e)
+        }
+
+
+@mcp.tool()
+async def broadcast_to_ANP(ctx: Context, targets: List[str], custom_msg: str, mode: str = "all",
+                           count: Optional[int] = None, unique_id_arg: Optional[str] = None,
+                           concurrency: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Send one message to many ANP agents concurrently.
+    
+    Args:
+        targets: Agent endpoints (URL, host:port or port number)
+        custom_msg: Message to send
+        mode: Completion mode: all, first (first N successes) or quorum
+        count: N for first, quorum size for quorum (default: majority)
+        unique_id_arg: Optional local identity, defaults to the current client identity
+        concurrency: Maximum concurrent requests (default: FANOUT_CONCURRENCY)
+        timeout: Per-target timeout in seconds (default: FANOUT_TIMEOUT)
+
+    Returns:
+        Dict with per-target results in arrival order; each result is also
+        streamed as a progress notification as soon as it arrives
+    """
+    try:
+        identity = get_default_identity(unique_id_arg)
+        total = len(unique_targets(targets))
+        needed = required_successes(mode, total, count)
+        results = []
+        async for result in fanout_stream(targets, custom_msg, identity, mode=mode, count=count,
+                                          concurrency=concurrency, timeout=timeout):
+            item = result.to_dict()
+            results.append(item)
+            await ctx.report_progress(len(results), total)
+            await ctx.info(f"{item['target']}: {item['answer'] if result.ok else item['error'] or item['status']}")
+        succeeded = sum(item["ok"] for item in results)
+        return {
+            "status": "success" if succeeded >= needed else "error",
+            "message": f"广播完成: {succeeded}/{len(results)} 个成功应答，需要 {needed} 个",
+            "mode": mode,
+            "results": results,
+            "error": None
+        }
+    except Exception as e:
+        logger.error(f"广播消息时出错: {e}")
+        return {
+            "status": "error",
+            "message": "广播消息失败",
+            "results": [],
+            "error": str(e)
+        }
+
+
 @mcp.resource("status://did-wba")
 async def get_status() -> Dict[str, Any]:
     """Get the current status of the DID WBA server and client.
     
+    Status is read from the shared state store, so it reflects servers and
+    clients running in any process, not only the current stdio process.
+    
     Returns:
         Dict with status information
     """
-    global server_status, connector_running, connection_events
+    snapshot = shared_state.snapshot()
+    server, client = snapshot["server"], snapshot["client"]
     return {
         "server": {
-            "running": server_status.is_running(),
-            "status": {"running": server_status.is_running()}
+            "running": server["running"],
+            "status": {"running": server["running"], "port": server["port"], "pid": server["pid"]}
         },
         "client": {
-            "running": connector_running,
-            "status": {"running": connector_running}
+            "running": client["running"],
+            "status": {"running": client["running"], "port": client["port"], "pid": client["pid"]}
         },
-        "connection_events_count": len(connection_events)
+        "connection_events_count": snapshot["connection_events_count"]
     }
 
 
@@ -436,8 +557,8 @@ async def chat_to_ANP(ctx: Context, custom_msg: str, token: Optional[str] = None
     app_context = ctx.request_context.lifespan_context
     
     try:
-        # 创建一个后台任务来处理消息发送
-        asyncio.create_task(_chat_to_ANP_impl(custom_msg, token, unique_id_arg))
+        # 提交到常驻的客户端运行时，复用其连接池和缓存
+        client_runtime.submit(_chat_to_ANP_impl(custom_msg, token, unique_id_arg))
         
         return {
             "status": "success",
@@ -456,20 +577,17 @@ async def _chat_to_ANP_impl(custom_msg: str, token: Optional[str] = None, unique
     """发送消息的实际实现（内部函数）
     """
     try:
+        target_host = settings.TARGET_SERVER_HOST
+        target_port = settings.TARGET_SERVER_PORT
+        base_url = f"http://{target_host}:{target_port}"
         if not token:
-            logger.info(f"无token，正在启动客户端认证获取token...并发送消息: {custom_msg}")
-            await ANP_req_auth(unique_id=unique_id_arg, msg=custom_msg)
-            target_host = settings.TARGET_SERVER_HOST
-            target_port = settings.TARGET_SERVER_PORT
-            base_url = f"http://{target_host}:{target_port}"
-            await ANP_req_chat(base_url=base_url, silent=True, from_chat=True, msg=custom_msg, token=token)
+            # 无需先单独认证：没有令牌时首个请求携带DID签名，令牌随响应头返回
+            logger.info(f"无token，首个请求将携带DID签名完成认证...发送消息: {custom_msg}")
         else:
             logger.info(f"使用token...发送消息: {custom_msg}")
-            target_host = settings.TARGET_SERVER_HOST
-            target_port = settings.TARGET_SERVER_PORT
-            base_url = f"http://{target_host}:{target_port}"
-            # 调用did_core中的send_message_to_chat函数
-            await ANP_req_chat(base_url=base_url, silent=True, from_chat=True, msg=custom_msg, token=token)
+        # 调用did_core中的send_message_to_chat函数，令牌过期或401时由令牌管理器重新认证
+        await ANP_req_chat(base_url=base_url, silent=True, from_chat=True, msg=custom_msg, token=token,
+                           unique_id=unique_id_arg)
     except Exception as e:
         logger.error(f"发送消息时出错: {e}")
         return {
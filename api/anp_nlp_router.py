@@ -6,7 +6,7 @@ import asyncio
 from fastapi import APIRouter, Request, HTTPException, Header
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from agent_connect.authentication import (
     verify_auth_header_signature,
     resolve_did_wba_document,
@@ -15,7 +15,7 @@ from agent_connect.authentication import (
     DIDWbaAuthHeader
 )
 
-from core.config import Settings
+from core.config import Settings, get_settings
 
 # 导入新创建的适配器模块中的函数
 from anp_core.agent.anp_llm_adapter import request_openrouter, anp_nlp_resp_messages, anp_nlp_resp_new_message_event, notify_chat_thread
@@ -26,6 +26,10 @@ class ChatRequest(BaseModel):
     message: str
 
 
+class BatchChatRequest(BaseModel):
+    messages: List[str]
+
+
 def get_and_validate_port(request: Request) -> str:
     """
     Get the domain from the request.
@@ -55,7 +59,8 @@ async def anp_nlp_service(
     if not chat_req.message:
         raise HTTPException(status_code=400, detail="Empty message")
         
-    did = request.headers.get("DID")
+    user = getattr(request.state, "user", None) or {}
+    did = request.headers.get("DID") or user.get("did")
     requestport = get_and_validate_port(request)
     
     # 调用封装的OpenRouter请求函数
@@ -67,6 +72,46 @@ async def anp_nlp_service(
     return JSONResponse(content=response_data)
 
 
+@router.post("/wba/anp-nlp/batch", summary="Batch version of /wba/anp-nlp")
+async def anp_nlp_batch_service(
+    request: Request,
+    batch_req: BatchChatRequest,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Answer several messages from the same peer in one HTTP request.
+
+    Messages are relayed to the LLM concurrently (at most NLP_BATCH_CONCURRENCY at a time)
+    and answered in request order. A failing message does not fail the batch; each result
+    carries its own status.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+    settings = get_settings(request)
+    if not batch_req.messages:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(batch_req.messages) > settings.NLP_BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large, at most {settings.NLP_BATCH_MAX_MESSAGES} messages"
+        )
+
+    user = getattr(request.state, "user", None) or {}
+    did = request.headers.get("DID") or user.get("did")
+    requestport = get_and_validate_port(request)
+    semaphore = asyncio.Semaphore(max(settings.NLP_BATCH_CONCURRENCY, 1))
+
+    async def answer(message: str) -> Dict[str, Any]:
+        if not message:
+            return {"status": 400, "answer": "Empty message"}
+        async with semaphore:
+            status_code, response_data = await request_openrouter(message, did, requestport)
+        return {"status": status_code, **response_data}
+
+    results = await asyncio.gather(*(answer(message) for message in batch_req.messages))
+    return JSONResponse(content={"results": results})
+
+
 async def notify_chat_thread(message_data: Dict[str, Any], did: str):
     """
     通知聊天线程有新消息
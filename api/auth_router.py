@@ -2,15 +2,42 @@
 Authentication API router.
 """
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from fastapi import APIRouter, Request, Header, HTTPException, Depends
+from pydantic import BaseModel
 
-from anp_core.auth.did_auth import get_and_validate_domain, handle_did_auth
+from core.config import get_settings
+from anp_core.auth.did_auth import (
+    get_and_validate_domain,
+    handle_did_auth,
+    handle_did_auth_batch,
+    resolve_did_documents
+)
 from anp_core.auth.token_auth import handle_bearer_auth
 
 router = APIRouter(tags=["authentication"])
 
 
+class BatchAuthRequest(BaseModel):
+    authorizations: List[str]
+
+
+class BatchResolveRequest(BaseModel):
+    dids: List[str]
+
+
+def check_batch_size(request: Request, items: List[str]):
+    """Reject empty and oversized batches."""
+    settings = get_settings(request)
+    if not items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(items) > settings.DID_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large, at most {settings.DID_BATCH_MAX_ITEMS} items"
+        )
+
+
 @router.post("/auth/did-wba", summary="Authenticate using DID WBA")
 async def did_wba_auth(
     request: Request,
@@ -29,11 +56,62 @@ async def did_wba_auth(
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing authorization header")
     
+    # The auth middleware has already verified this header and consumed its nonce;
+    # verifying it again would be rejected as a replay
+    user = getattr(request.state, "user", None)
+    if user and user.get("access_token"):
+        return user
+    
     # Get and validate domain
     domain = get_and_validate_domain(request)
     
     # Process DID WBA authentication
-    return await handle_did_auth(authorization, domain)
+    return await handle_did_auth(authorization, domain, get_settings(request))
+
+
+@router.post("/auth/did-wba/batch", summary="Authenticate several DID WBA headers")
+async def did_wba_auth_batch(request: Request, batch_req: BatchAuthRequest) -> Dict:
+    """
+    Verify several DID WBA authorization headers in one request, e.g. from a gateway.
+    
+    Shared DIDs are resolved once and distinct DIDs concurrently, so the batch costs about
+    as much as its slowest resolution. Each result carries its own status: 200 with the
+    access token, or the status and detail /auth/did-wba would have returned.
+    
+    Args:
+        request: FastAPI request object
+        batch_req: Authorization headers to verify
+        
+    Returns:
+        Dict: Per-header results in request order
+    """
+    check_batch_size(request, batch_req.authorizations)
+    domain = get_and_validate_domain(request)
+    return {"results": await handle_did_auth_batch(batch_req.authorizations, domain, get_settings(request))}
+
+
+@router.post("/auth/did/resolve", summary="Resolve several DID documents")
+async def resolve_dids(request: Request, batch_req: BatchResolveRequest) -> Dict:
+    """
+    Resolve several DID documents concurrently, each distinct DID once.
+    
+    Args:
+        request: FastAPI request object
+        batch_req: DIDs to resolve
+        
+    Returns:
+        Dict: Per-DID results in request order, with the document or a 404 status
+    """
+    check_batch_size(request, batch_req.dids)
+    documents = await resolve_did_documents(batch_req.dids, get_settings(request))
+    results = []
+    for did in batch_req.dids:
+        document = documents[did]
+        if document:
+            results.append({"did": did, "status": 200, "document": document})
+        else:
+            results.append({"did": did, "status": 404, "detail": "Failed to resolve DID document"})
+    return {"results": results}
 
 
 @router.get("/auth/verify", summary="Verify bearer token")
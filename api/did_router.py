@@ -1,79 +1,192 @@
 """
 DID document API router.
 """
-import os
-import json
+import asyncio
 import logging
-from typing import Dict, Optional
-from pathlib import Path
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Request, Response, HTTPException
 
-from core.config import settings
+from core.config import Settings, get_settings
+from anp_core.store.auth_state import auth_state
+from anp_core.store.did_store import get_did_store, user_id_from_did
+from anp_core.store.did_index import get_did_index, is_local_did
+from anp_core.store.did_document_cache import get_document_cache, version_from_etag
+from anp_core.store.did_versions import JSONPatchError, NotDocumentOwner, VersionConflict, get_did_versions
 
 router = APIRouter(tags=["did"])
 
 
 @router.get("/wba/user/{user_id}/did.json", summary="Get DID document")
-async def get_did_document(user_id: str) -> Dict:
+async def get_did_document(user_id: str, request: Request, version: Optional[int] = None) -> Response:
     """
     Retrieve a DID document by user ID.
     
+    The pre-serialized document is served with a strong ETag carrying its version,
+    Last-Modified and Cache-Control; conditional requests that still match get
+    304 Not Modified. ``?version=N`` returns an earlier version from the history.
+    
     Args:
         user_id: User identifier
+        request: FastAPI request object
+        version: Optional version number to read instead of the current document
         
     Returns:
-        Dict: DID document
+        Response: DID document, or an empty 304 response
     """
-    # 构建DID文档路径
-    current_dir = Path(__file__).parent.parent.absolute()
-    did_path = current_dir / settings.DID_DOCUMENTS_PATH / f"user_{user_id}" / settings.DID_DOCUMENT_FILENAME
-    
-    if not did_path.exists():
+    settings = get_settings(request)
+    store = get_did_store(settings)
+    # Unknown ids ruled out by the Bloom filter never reach the store
+    index = get_did_index(store)
+    if version is None and not index.might_exist(user_id):
         raise HTTPException(status_code=404, detail=f"DID document not found for user {user_id}")
-    
-    # 加载DID文档
     try:
-        with open(did_path, 'r', encoding='utf-8') as f:
-            did_document = json.load(f)
-        return did_document
+        cache = get_document_cache(store)
+        served = cache.get(user_id) if version is None else cache.get_version(user_id, version)
     except Exception as e:
         logging.error(f"Error loading DID document: {e}")
         raise HTTPException(status_code=500, detail="Error loading DID document")
+    if served is None:
+        if version is None:
+            index.record_false_positive()
+        detail = f"DID document not found for user {user_id}"
+        raise HTTPException(status_code=404, detail=detail if version is None else f"{detail} at version {version}")
+    
+    headers = {
+        "ETag": served.etag,
+        "Last-Modified": served.last_modified,
+        "DID-Version": str(served.version),
+        # Earlier versions never change
+        "Cache-Control": f"public, max-age={settings.DID_DOCUMENT_MAX_AGE}" if version is None
+        else "public, max-age=31536000, immutable"
+    }
+    if served.not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=served.body, media_type="application/json", headers=headers)
 
 
 @router.put("/wba/user/{user_id}/did.json", summary="Store DID document")
-async def store_did_document(user_id: str, did_document: Dict) -> Dict:
+async def store_did_document(user_id: str, did_document: Dict, request: Request, defer: bool = False) -> Dict:
     """
     Store a DID document for a user.
     
+    The write runs in a worker thread so slow disks do not stall the event loop.
+    With ``?defer=true`` the document is queued for the store's background batch
+    writer and is readable immediately, but not yet durable when the response is sent.
+    Every change is recorded as a new version; ``If-Match`` makes the write conditional.
+    Only the DID the caller authenticated as may write it: that DID must be this
+    host's DID for ``user_id``, and both the stored document and the new one must
+    have it as their ``id``.
+    
     Args:
         user_id: User identifier
         did_document: DID document to store
+        request: FastAPI request object
+        defer: Queue the write instead of waiting for it
         
     Returns:
         Dict: Operation result
     """
-    # 构建存储路径
-    current_dir = Path(__file__).parent.parent.absolute()
-    user_dir = current_dir / settings.DID_DOCUMENTS_PATH / f"user_{user_id}"
-    did_path = user_dir / settings.DID_DOCUMENT_FILENAME
-    
-    # 创建目录（如果不存在）
-    user_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 保存DID文档
+    settings = get_settings(request)
+    store = get_did_store(settings)
+    owner = _caller_did(request, user_id, settings)
+    expected_version = _expected_version(request)
     try:
-        with open(did_path, 'w', encoding='utf-8') as f:
-            json.dump(did_document, f, indent=2)
-        
-        return {
-            "status": "success",
-            "message": f"DID document stored for user {user_id}",
-            "path": str(did_path)
-        }
+        version = await asyncio.to_thread(
+            get_did_versions(store).put, user_id, did_document, expected_version, defer, owner
+        )
+    except NotDocumentOwner:
+        raise HTTPException(status_code=403, detail=f"Not allowed to write the DID document of user {user_id}")
+    except VersionConflict as e:
+        raise HTTPException(status_code=412, detail=f"DID document is at version {e.current}")
     except Exception as e:
         logging.error(f"Error storing DID document: {e}")
         raise HTTPException(status_code=500, detail="Error storing DID document")
+    _invalidate(store, user_id, did_document)
+    
+    return {
+        "status": "queued" if defer else "success",
+        "message": f"DID document stored for user {user_id}",
+        "version": version,
+        "path": store.location(user_id)
+    }
+
+
+@router.patch("/wba/user/{user_id}/did.json", summary="Patch DID document")
+async def patch_did_document(user_id: str, operations: List[Dict[str, Any]], request: Request) -> Dict:
+    """
+    Apply a JSON Patch (RFC 6902) to a user's DID document.
+    
+    Send ``If-Match`` with the ETag of the version the patch was written against
+    to reject it with 412 if the document changed in the meantime. As with PUT, only
+    the DID named by the document's ``id`` may patch it.
+    
+    Args:
+        user_id: User identifier
+        operations: JSON Patch operations
+        request: FastAPI request object
+        
+    Returns:
+        Dict: Operation result with the new version and document
+    """
+    settings = get_settings(request)
+    store = get_did_store(settings)
+    owner = _caller_did(request, user_id, settings)
+    expected_version = _expected_version(request)
+    try:
+        version, did_document = await asyncio.to_thread(
+            get_did_versions(store).patch, user_id, operations, expected_version, owner
+        )
+    except NotDocumentOwner:
+        raise HTTPException(status_code=403, detail=f"Not allowed to write the DID document of user {user_id}")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"DID document not found for user {user_id}")
+    except JSONPatchError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON Patch: {e}")
+    except VersionConflict as e:
+        raise HTTPException(status_code=412, detail=f"DID document is at version {e.current}")
+    except Exception as e:
+        logging.error(f"Error patching DID document: {e}")
+        raise HTTPException(status_code=500, detail="Error patching DID document")
+    _invalidate(store, user_id, did_document)
+    
+    return {
+        "status": "success",
+        "message": f"DID document patched for user {user_id}",
+        "version": version,
+        "document": did_document
+    }
+
+
+def _caller_did(request: Request, user_id: str, settings: Settings) -> str:
+    """DID the auth middleware authenticated the request as; it must be this host's DID for user_id"""
+    user = getattr(request.state, "user", None)
+    if not user or not user.get("did"):
+        raise HTTPException(status_code=401, detail="Authentication required to write DID documents")
+    did = user["did"]
+    # Otherwise any agent could claim an unused user id with a document naming its own DID
+    if user_id_from_did(did) != user_id or not is_local_did(did, settings):
+        raise HTTPException(status_code=403, detail=f"Not allowed to write the DID document of user {user_id}")
+    return did
+
+
+def _expected_version(request: Request) -> Optional[int]:
+    """Version named by an If-Match header, or None when the write is unconditional"""
+    if_match = request.headers.get("if-match")
+    if if_match is None or if_match.strip() == "*":
+        return None
+    version = version_from_etag(if_match)
+    if version is None:
+        raise HTTPException(status_code=412, detail="If-Match does not name a DID document version")
+    return version
+
+
+def _invalidate(store, user_id: str, did_document: Dict):
+    """Drop cached copies of a document that was just written"""
+    get_document_cache(store).invalidate(user_id)
+    get_did_index(store).refresh(user_id)
+    # Drop the cached copy shared by all responder workers
+    if did_document.get("id"):
+        auth_state.invalidate_did_document(did_document["id"])
 
 
 @router.get("/agents/example/ad.json", summary="Get agent description")
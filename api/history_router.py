@@ -0,0 +1,92 @@
+"""
+Chat history API router.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from fastapi import APIRouter, Request, Query, HTTPException
+
+from core.config import get_settings
+from anp_core.store.history_store import chat_history
+
+router = APIRouter(tags=["history"])
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a query time value into epoch seconds.
+
+    Args:
+        value: ISO 8601 timestamp or epoch seconds
+
+    Returns:
+        Optional[float]: Epoch seconds, or None if value is empty
+
+    Raises:
+        ValueError: When the value cannot be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+@router.get("/wba/history", summary="Query ANP chat history")
+def query_history(
+    request: Request,
+    did: Optional[str] = Query(None, description="Filter by DID"),
+    since: Optional[str] = Query(None, description="Start time, ISO 8601 or epoch seconds"),
+    until: Optional[str] = Query(None, description="End time, ISO 8601 or epoch seconds"),
+    q: Optional[str] = Query(None, description="Full-text search terms"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+) -> Dict:
+    """
+    Query persisted ANP chat history. This endpoint requires authentication.
+
+    Callers only see records in which their own DID took part, unless their DID
+    is listed in HISTORY_ADMIN_DIDS.
+
+    Args:
+        request: FastAPI request object
+        did: Optional DID filter
+        since: Optional start time
+        until: Optional end time
+        q: Optional full-text query
+        limit: Maximum number of records
+        offset: Number of records to skip
+
+    Returns:
+        Dict: Matching records, newest first
+    """
+    try:
+        since_ts = parse_time(since)
+        until_ts = parse_time(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time value: {e}")
+
+    user = getattr(request.state, "user", None) or {}
+    caller = user.get("did")
+    if not caller:
+        raise HTTPException(status_code=401, detail="Authentication required to query chat history")
+    admins = {d.strip() for d in get_settings(request).HISTORY_ADMIN_DIDS.split(",") if d.strip()}
+    participant = None if caller in admins else caller
+
+    try:
+        records = chat_history.query(
+            did=did, since=since_ts, until=until_ts, text=q, limit=limit, offset=offset,
+            participant=participant
+        )
+    except Exception as e:
+        logging.error(f"Error querying chat history: {e}")
+        raise HTTPException(status_code=500, detail="Error querying chat history")
+
+    return {
+        "count": len(records),
+        "records": records
+    }
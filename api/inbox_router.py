@@ -0,0 +1,156 @@
+"""
+Agent inbox router: server push over SSE with a long-poll fallback.
+
+Messages addressed to a DID are queued in its bounded inbox (anp_core.server.inbox) and
+delivered to the authenticated owner of that DID:
+
+- ``GET /wba/inbox`` streams events as Server-Sent Events. Reconnecting clients send the
+  standard ``Last-Event-ID`` header (or ``?last_event_id=``) and receive everything queued
+  after it.
+- ``GET /wba/inbox/poll`` is the long-poll fallback: it returns queued events immediately,
+  or waits up to ``timeout`` seconds for the next one.
+- ``POST /wba/inbox/{did}`` queues a message for another agent. The event is also pushed to
+  that agent's open WebSocket channels.
+"""
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Request, Query, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from core.config import get_settings
+from anp_core.server.inbox import InboxFull, InboxQuotaExceeded, inbox_hub
+from api.ws_router import push_to_did
+
+router = APIRouter(tags=["inbox"])
+
+
+class InboxMessage(BaseModel):
+    event: str = "message"
+    data: Dict[str, Any]
+
+
+def _require_did(request: Request) -> str:
+    user = getattr(request.state, "user", None)
+    if not user or not user.get("did"):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return user["did"]
+
+
+def _parse_event_id(value: Optional[str]) -> int:
+    try:
+        return max(int(value), 0) if value else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+
+def _open_inbox(did: str):
+    try:
+        inbox_hub.inbox(did)
+    except InboxFull:
+        raise HTTPException(status_code=503, detail="Too many inboxes, try again later")
+
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    payload = json.dumps({"data": event["data"], "ts": event["ts"]}, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+
+
+@router.post("/wba/inbox/{did:path}", summary="Send a message to an agent's inbox")
+async def post_to_inbox(request: Request, did: str, message: InboxMessage) -> Dict:
+    """
+    Queue a message for another agent.
+
+    Args:
+        request: FastAPI request object
+        did: Recipient DID
+        message: Event name and payload
+
+    Returns:
+        Dict: Event id and number of WebSocket channels it was pushed to
+    """
+    sender = _require_did(request)
+    data = {**message.data, "from": sender}
+    try:
+        event_id = inbox_hub.post(did, message.event, data, sender)
+    except InboxQuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=f"Too many unopened inboxes created by this sender (limit {e.limit})")
+    except InboxFull:
+        raise HTTPException(status_code=503, detail="Too many inboxes, try again later")
+    pushed = push_to_did(did, message.event, {"id": event_id, **data})
+    return {"status": "queued", "id": event_id, "pushed": pushed}
+
+
+@router.get("/wba/inbox", summary="Stream the caller's inbox as Server-Sent Events")
+async def stream_inbox(
+    request: Request,
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Stream inbox events for the authenticated DID, resuming after Last-Event-ID.
+    """
+    did = _require_did(request)
+    settings = get_settings(request)
+    cursor = _parse_event_id(last_event_id_header or last_event_id)
+    _open_inbox(did)
+
+    async def events():
+        nonlocal cursor
+        inbox_hub.listeners += 1
+        try:
+            # Tell EventSource clients how long to wait before reconnecting
+            yield f"retry: {int(settings.INBOX_RETRY_MS)}\n\n"
+            while True:
+                batch, gap = inbox_hub.read(did, cursor)
+                if gap:
+                    yield f"event: gap\ndata: {json.dumps({'after': cursor})}\n\n"
+                    cursor = inbox_hub.resume_id(did, cursor)
+                for event in batch:
+                    cursor = event["id"]
+                    yield _format_sse(event)
+                if batch:
+                    continue
+                if await request.is_disconnected():
+                    return
+                if not await inbox_hub.wait(did, cursor, settings.INBOX_KEEPALIVE):
+                    # Comment line keeps proxies and NAT mappings from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            inbox_hub.listeners -= 1
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/wba/inbox/poll", summary="Long-poll the caller's inbox")
+async def poll_inbox(
+    request: Request,
+    last_event_id: Optional[str] = Query(None),
+    timeout: float = Query(25.0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+) -> Dict:
+    """
+    Return inbox events after last_event_id, waiting up to timeout seconds if there are none.
+
+    Returns:
+        Dict: Events, the id to resume from, and whether older events were dropped
+    """
+    did = _require_did(request)
+    settings = get_settings(request)
+    cursor = _parse_event_id(last_event_id_header or last_event_id)
+    _open_inbox(did)
+    events, gap = inbox_hub.read(did, cursor, limit)
+    if not events and await inbox_hub.wait(did, cursor, min(timeout, settings.INBOX_POLL_TIMEOUT)):
+        events, gap = inbox_hub.read(did, cursor, limit)
+    return {
+        "events": events,
+        "last_event_id": events[-1]["id"] if events else inbox_hub.resume_id(did, cursor),
+        "gap": gap
+    }
@@ -0,0 +1,229 @@
+"""
+Multiplexed WebSocket channel router.
+
+A client authenticates once when the connection opens (DID WBA or bearer token, in the
+``Authorization`` handshake header or in a first ``auth`` frame) and then exchanges JSON
+frames over the same connection:
+
+- ``{"type": "request", "id": ..., "method": ..., "params": {...}}`` is answered with
+  ``{"type": "response", "id": ..., "status": ..., "result": {...}}``; requests run
+  concurrently and responses may arrive out of order, matched by ``id``.
+- ``{"type": "push", "event": ..., "data": {...}}`` is sent by the server at any time.
+- ``{"type": "ping"}`` / ``{"type": "pong"}`` are heartbeats. The server pings an idle
+  connection every WS_HEARTBEAT_INTERVAL seconds and closes it after WS_HEARTBEAT_TIMEOUT
+  seconds without any frame.
+
+Flow control is per connection: at most WS_MAX_INFLIGHT requests are processed at a time
+(the server stops reading until a slot frees up), and at most WS_SEND_QUEUE outgoing push
+frames are buffered; further pushes are dropped and counted.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+
+from core.config import get_settings
+from anp_core.auth.did_auth import handle_did_auth, get_and_validate_domain
+from anp_core.auth.token_auth import handle_bearer_auth
+from anp_core.agent.anp_llm_adapter import request_openrouter
+
+router = APIRouter(tags=["websocket"])
+
+
+class ChannelConnection:
+    """State of one authenticated WebSocket connection."""
+
+    def __init__(self, websocket: WebSocket, user: Dict[str, Any], settings):
+        self.websocket = websocket
+        self.user = user
+        self.did = user.get("did")
+        self.settings = settings
+        self.inflight = asyncio.Semaphore(max(settings.WS_MAX_INFLIGHT, 1))
+        self.push_queue: asyncio.Queue = asyncio.Queue(maxsize=max(settings.WS_SEND_QUEUE, 1))
+        self.send_lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+        self.stats = {"requests": 0, "pushes": 0, "pushes_dropped": 0}
+
+    async def send(self, frame: Dict[str, Any]):
+        async with self.send_lock:
+            await self.websocket.send_text(json.dumps(frame, ensure_ascii=False))
+
+    def push(self, event: str, data: Dict[str, Any]) -> bool:
+        """Queue a push frame; returns False when the connection's send queue is full."""
+        try:
+            self.push_queue.put_nowait({"type": "push", "event": event, "data": data})
+            self.stats["pushes"] += 1
+            return True
+        except asyncio.QueueFull:
+            self.stats["pushes_dropped"] += 1
+            return False
+
+
+# Active connections by DID, used to push messages to connected agents
+active_connections: Dict[str, Set[ChannelConnection]] = {}
+
+
+def push_to_did(did: str, event: str, data: Dict[str, Any]) -> int:
+    """
+    Push an event to every open channel of a DID.
+
+    Must be called from the responder event loop.
+
+    Args:
+        did: Target DID
+        event: Event name
+        data: Event payload
+
+    Returns:
+        int: Number of connections the event was queued on
+    """
+    return sum(connection.push(event, data) for connection in list(active_connections.get(did, ())))
+
+
+async def _method_test(connection: ChannelConnection, params: Dict[str, Any]):
+    return 200, {"status": "success", "message": "Successfully authenticated", "did": connection.did}
+
+
+async def _method_chat(connection: ChannelConnection, params: Dict[str, Any]):
+    message = params.get("message")
+    if not message:
+        return 400, {"detail": "Empty message"}
+    return await request_openrouter(message, connection.did, str(connection.settings.PORT))
+
+
+# Request methods available on the channel
+CHANNEL_METHODS: Dict[str, Callable[[ChannelConnection, Dict[str, Any]], Awaitable]] = {
+    "test": _method_test,
+    "chat": _method_chat,
+}
+
+
+async def authenticate_channel(websocket: WebSocket, authorization: Optional[str]) -> Dict[str, Any]:
+    """
+    Authenticate a channel with a DID WBA or bearer Authorization value.
+
+    Raises:
+        HTTPException: When authentication fails
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing authorization header")
+    if authorization.startswith("Bearer "):
+        return await handle_bearer_auth(authorization)
+    return await handle_did_auth(authorization, get_and_validate_domain(websocket))
+
+
+async def _handle_request(connection: ChannelConnection, frame: Dict[str, Any]):
+    request_id = frame.get("id")
+    try:
+        method = CHANNEL_METHODS.get(frame.get("method"))
+        if method is None:
+            status, result = 404, {"detail": f"Unknown method: {frame.get('method')}"}
+        else:
+            status, result = await method(connection, frame.get("params") or {})
+    except Exception as e:
+        logging.error(f"WebSocket request {request_id} failed: {e}")
+        status, result = 500, {"detail": str(e)}
+    finally:
+        connection.inflight.release()
+    try:
+        await connection.send({"type": "response", "id": request_id, "status": status, "result": result})
+    except Exception as e:
+        logging.debug(f"Dropping response {request_id} for closed channel: {e}")
+
+
+async def _push_loop(connection: ChannelConnection):
+    while True:
+        frame = await connection.push_queue.get()
+        await connection.send(frame)
+
+
+async def _heartbeat_loop(connection: ChannelConnection):
+    interval = connection.settings.WS_HEARTBEAT_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        idle = time.monotonic() - connection.last_seen
+        if idle > connection.settings.WS_HEARTBEAT_TIMEOUT:
+            logging.info(f"WebSocket channel for {connection.did} timed out after {idle:.0f}s")
+            await connection.websocket.close(code=1001)
+            return
+        if idle >= interval:
+            await connection.send({"type": "ping", "ts": time.time()})
+
+
+@router.websocket("/wba/ws")
+async def channel_endpoint(websocket: WebSocket):
+    """
+    Multiplexed request/response and push channel (see module docstring for the frame format).
+    """
+    settings = get_settings(websocket)
+    await websocket.accept()
+    try:
+        authorization = websocket.headers.get("authorization")
+        if not authorization:
+            # Clients that cannot set handshake headers send {"type": "auth", "authorization": ...} first
+            first = json.loads(await asyncio.wait_for(websocket.receive_text(), settings.WS_HEARTBEAT_TIMEOUT))
+            authorization = first.get("authorization") if first.get("type") == "auth" else None
+        user = await authenticate_channel(websocket, authorization)
+    except HTTPException as exc:
+        await websocket.send_text(json.dumps({"type": "error", "status": exc.status_code, "detail": exc.detail}))
+        await websocket.close(code=4401)
+        return
+    except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+        await websocket.close(code=4400)
+        return
+
+    connection = ChannelConnection(websocket, user, settings)
+    active_connections.setdefault(connection.did, set()).add(connection)
+    await connection.send({
+        "type": "welcome",
+        "did": connection.did,
+        "access_token": user.get("access_token"),
+        "max_inflight": settings.WS_MAX_INFLIGHT,
+        "heartbeat_interval": settings.WS_HEARTBEAT_INTERVAL
+    })
+    background = [
+        asyncio.create_task(_push_loop(connection)),
+        asyncio.create_task(_heartbeat_loop(connection)),
+    ]
+    requests: Set[asyncio.Task] = set()
+    try:
+        while True:
+            # Flow control: do not read the next frame until an in-flight slot is free
+            await connection.inflight.acquire()
+            try:
+                text = await websocket.receive_text()
+            except BaseException:
+                connection.inflight.release()
+                raise
+            connection.last_seen = time.monotonic()
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                connection.inflight.release()
+                await connection.send({"type": "error", "status": 400, "detail": "Invalid JSON frame"})
+                continue
+            frame_type = frame.get("type")
+            if frame_type == "request":
+                connection.stats["requests"] += 1
+                task = asyncio.create_task(_handle_request(connection, frame))
+                requests.add(task)
+                task.add_done_callback(requests.discard)
+                continue
+            connection.inflight.release()
+            if frame_type == "ping":
+                await connection.send({"type": "pong", "ts": frame.get("ts")})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        connections = active_connections.get(connection.did)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                active_connections.pop(connection.did, None)
+        for task in background + list(requests):
+            task.cancel()
+        await asyncio.gather(*background, *requests, return_exceptions=True)
+        logging.info(f"WebSocket channel for {connection.did} closed: {connection.stats}")
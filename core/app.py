@@ -2,29 +2,37 @@
 FastAPI application initialization.
 """
 import logging
+from typing import Optional
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from core.config import settings
-from api import auth_router, did_router, ad_router, anp_nlp_router
+from core.config import settings, Settings
+from api import auth_router, did_router, ad_router, anp_nlp_router, history_router, ws_router, inbox_router
 from anp_core.auth.auth_middleware import auth_middleware
+from anp_core.store.did_index import get_did_index
 
 
-def create_app() -> FastAPI:
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
     """
     Create and configure the FastAPI application.
     
+    Args:
+        app_settings: Optional settings for this app (default: global settings)
+    
     Returns:
         FastAPI: Configured application instance
     """
+    app_settings = app_settings or settings
+    
     # Create FastAPI app
     app = FastAPI(
         title="DID WBA Example",
         description="DID WBA Authentication Example with Client and Server capabilities",
         version="0.1.0",
-        docs_url="/docs" if settings.DEBUG else None,
-        redoc_url="/redoc" if settings.DEBUG else None,
+        docs_url="/docs" if app_settings.DEBUG else None,
+        redoc_url="/redoc" if app_settings.DEBUG else None,
     )
+    app.state.settings = app_settings
     
     # Configure logging
     logging.basicConfig(
@@ -41,6 +49,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Authorization"],
     )
     
     # Add authentication middleware
@@ -48,10 +57,19 @@ def create_app() -> FastAPI:
     async def auth_middleware_wrapper(request, call_next):
         return await auth_middleware(request, call_next)
     
+    # Warm the in-memory index the DID resolver reads local documents from
+    @app.on_event("startup")
+    async def start_did_index():
+        if app_settings.DID_INDEX_ENABLED:
+            get_did_index().start()
+    
     # Include routers
     app.include_router(auth_router.router)
     app.include_router(did_router.router)
     app.include_router(ad_router.router)
     app.include_router(anp_nlp_router.router)
+    app.include_router(history_router.router)
+    app.include_router(ws_router.router)
+    app.include_router(inbox_router.router)
     
     return app
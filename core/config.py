@@ -32,12 +32,135 @@ class Settings(BaseSettings):
     # DID settings
     DID_DOCUMENTS_PATH: str = os.getenv("DID_DOCUMENTS_PATH", "did_keys")
     DID_DOCUMENT_FILENAME: str = "did.json"
+    # DID document store backend: "file" (sharded user directories) or "sqlite" (indexed by user id and DID)
+    DID_STORE_BACKEND: str = os.getenv("DID_STORE_BACKEND", "file")
+    DID_STORE_DB_PATH: str = os.getenv("DID_STORE_DB_PATH", "data/anp_did_store.db")
+    # Levels of two-hex-character hash prefixes above each user directory; 0 keeps the flat did_keys/user_<id> layout
+    DID_STORE_SHARD_DEPTH: int = int(os.getenv("DID_STORE_SHARD_DEPTH", "2"))
+    # Durability of DID writes: "none" (atomic rename only), "file" (fsync the file) or "full" (also fsync the directory)
+    DID_STORE_FSYNC: str = os.getenv("DID_STORE_FSYNC", "none")
+    # Deferred writes: milliseconds to coalesce before a batch is written, and the maximum batch size
+    DID_STORE_WRITE_BEHIND_MS: int = int(os.getenv("DID_STORE_WRITE_BEHIND_MS", "50"))
+    DID_STORE_WRITE_BEHIND_BATCH: int = int(os.getenv("DID_STORE_WRITE_BEHIND_BATCH", "500"))
+    # Longest back-off (seconds) between retries of deferred writes that failed; they stay queued until written
+    DID_STORE_WRITE_RETRY_MAX: float = float(os.getenv("DID_STORE_WRITE_RETRY_MAX", "5.0"))
+    # Served did.json responses: cached users, seconds between modification checks, and Cache-Control max-age
+    DID_DOCUMENT_CACHE_SIZE: int = int(os.getenv("DID_DOCUMENT_CACHE_SIZE", "10000"))
+    DID_DOCUMENT_CACHE_REVALIDATE: float = float(os.getenv("DID_DOCUMENT_CACHE_REVALIDATE", "1.0"))
+    DID_DOCUMENT_MAX_AGE: int = int(os.getenv("DID_DOCUMENT_MAX_AGE", "60"))
+    # In-memory index of local DID documents used by the resolver: loaded at startup unless there are more
+    # than DID_INDEX_EAGER_LIMIT documents (then filled on lookup), refreshed by polling modification times
+    DID_INDEX_ENABLED: bool = os.getenv("DID_INDEX_ENABLED", "true").lower() == "true"
+    DID_INDEX_POLL_INTERVAL: float = float(os.getenv("DID_INDEX_POLL_INTERVAL", "5.0"))
+    DID_INDEX_EAGER_LIMIT: int = int(os.getenv("DID_INDEX_EAGER_LIMIT", "100000"))
+    # Bloom filter of local user ids in front of the index: ids it rules out get "not found" without a store
+    # read (and local DIDs skip the HTTP fallback). Sized for HEADROOM x the current count at FPR.
+    # Ids created by other processes are merged from the store's creation log every SYNC_INTERVAL seconds.
+    DID_BLOOM_ENABLED: bool = os.getenv("DID_BLOOM_ENABLED", "true").lower() == "true"
+    DID_BLOOM_FPR: float = float(os.getenv("DID_BLOOM_FPR", "0.01"))
+    DID_BLOOM_HEADROOM: float = float(os.getenv("DID_BLOOM_HEADROOM", "2.0"))
+    DID_BLOOM_MIN_CAPACITY: int = int(os.getenv("DID_BLOOM_MIN_CAPACITY", "1024"))
+    DID_BLOOM_REBUILD_INTERVAL: float = float(os.getenv("DID_BLOOM_REBUILD_INTERVAL", "300"))
+    DID_BLOOM_SYNC_INTERVAL: float = float(os.getenv("DID_BLOOM_SYNC_INTERVAL", "0.5"))
+    # Remote DID resolution: per-attempt timeout and overall deadline (seconds), per-host circuit breaker
+    # (consecutive failures to open, seconds before a probe), and a hedged second request once an attempt
+    # runs past the host's latency percentile (DID_RESOLVER_HEDGE_DELAY until 20 samples exist)
+    DID_RESOLVER_ATTEMPT_TIMEOUT: float = float(os.getenv("DID_RESOLVER_ATTEMPT_TIMEOUT", "2.0"))
+    DID_RESOLVER_DEADLINE: float = float(os.getenv("DID_RESOLVER_DEADLINE", "5.0"))
+    DID_RESOLVER_ATTEMPTS: int = int(os.getenv("DID_RESOLVER_ATTEMPTS", "2"))
+    DID_RESOLVER_BREAKER_FAILURES: int = int(os.getenv("DID_RESOLVER_BREAKER_FAILURES", "5"))
+    DID_RESOLVER_BREAKER_RESET: float = float(os.getenv("DID_RESOLVER_BREAKER_RESET", "30.0"))
+    DID_RESOLVER_HEDGE: bool = os.getenv("DID_RESOLVER_HEDGE", "true").lower() == "true"
+    DID_RESOLVER_HEDGE_PERCENTILE: float = float(os.getenv("DID_RESOLVER_HEDGE_PERCENTILE", "95"))
+    DID_RESOLVER_HEDGE_DELAY: float = float(os.getenv("DID_RESOLVER_HEDGE_DELAY", "0.5"))
+    DID_RESOLVER_VERIFY_TLS: bool = os.getenv("DID_RESOLVER_VERIFY_TLS", "true").lower() == "true"
+    # Hosts whose DID documents are fetched over plain HTTP (local development)
+    DID_RESOLVER_HTTP_HOSTS: str = os.getenv("DID_RESOLVER_HTTP_HOSTS", "localhost,127.0.0.1")
+    # Resolved DID documents with parsed verification keys kept per process; with
+    # DID_AUTH_REQUIRE_AUTHENTICATION only keys listed under "authentication" may sign DID WBA headers
+    DID_RESOLVED_CACHE_SIZE: int = int(os.getenv("DID_RESOLVED_CACHE_SIZE", "10000"))
+    DID_AUTH_REQUIRE_AUTHENTICATION: bool = os.getenv("DID_AUTH_REQUIRE_AUTHENTICATION", "false").lower() == "true"
+    # Batch endpoints (/auth/did-wba/batch, /auth/did/resolve): maximum items per request and concurrent resolutions
+    DID_BATCH_MAX_ITEMS: int = int(os.getenv("DID_BATCH_MAX_ITEMS", "100"))
+    DID_BATCH_CONCURRENCY: int = int(os.getenv("DID_BATCH_CONCURRENCY", "32"))
+    # DID document version history: JSON Patch deltas with a full snapshot every N versions
+    DID_VERSION_DB_PATH: str = os.getenv("DID_VERSION_DB_PATH", "data/anp_did_versions.db")
+    DID_VERSION_SNAPSHOT_INTERVAL: int = int(os.getenv("DID_VERSION_SNAPSHOT_INTERVAL", "10"))
     PRIVATE_KEY_FILENAME: str = "key-1_private.pem"
     
     # Target server settings (for client requests)
     TARGET_SERVER_HOST: str = os.getenv("TARGET_SERVER_HOST", "localhost")
     TARGET_SERVER_PORT: int = int(os.getenv("TARGET_SERVER_PORT", "8000"))
-    
+    # Seconds before a client access token expires at which it is refreshed in the background
+    TOKEN_REFRESH_MARGIN: float = float(os.getenv("TOKEN_REFRESH_MARGIN", "60"))
+    # Send the first DID-signed request straight to the target endpoint and take the token from the response header
+    CLIENT_ONE_ROUND_TRIP_AUTH: bool = os.getenv("CLIENT_ONE_ROUND_TRIP_AUTH", "true").lower() == "true"
+    # Dispatch requests to a responder running in this process straight into its ASGI app instead of over TCP
+    LOCAL_ASGI_TRANSPORT: bool = os.getenv("LOCAL_ASGI_TRANSPORT", "true").lower() == "true"
+    # Route requests for host:port over Unix domain sockets: "host:port=/path.sock,..."; loopback responders
+    # that registered a socket in the shared state are discovered automatically
+    UDS_HOST_MAP: str = os.getenv("UDS_HOST_MAP", "")
+    CLIENT_USE_UDS: bool = os.getenv("CLIENT_USE_UDS", "true").lower() == "true"
+    # Fan-out/broadcast: maximum concurrent targets and per-target timeout in seconds
+    FANOUT_CONCURRENCY: int = int(os.getenv("FANOUT_CONCURRENCY", "16"))
+    FANOUT_TIMEOUT: float = float(os.getenv("FANOUT_TIMEOUT", "30"))
+    # Client micro-batching of chat messages to the same peer; a window of 0 disables batching
+    CHAT_BATCH_WINDOW_MS: float = float(os.getenv("CHAT_BATCH_WINDOW_MS", "0"))
+    CHAT_BATCH_MAX_SIZE: int = int(os.getenv("CHAT_BATCH_MAX_SIZE", "16"))
+    # Limits of the /wba/anp-nlp/batch endpoint
+    NLP_BATCH_MAX_MESSAGES: int = int(os.getenv("NLP_BATCH_MAX_MESSAGES", "32"))
+    NLP_BATCH_CONCURRENCY: int = int(os.getenv("NLP_BATCH_CONCURRENCY", "4"))
+
+    # Multiplexed WebSocket channel (/wba/ws): per-connection flow control and heartbeats
+    WS_MAX_INFLIGHT: int = int(os.getenv("WS_MAX_INFLIGHT", "32"))
+    WS_SEND_QUEUE: int = int(os.getenv("WS_SEND_QUEUE", "256"))
+    WS_HEARTBEAT_INTERVAL: float = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+    WS_HEARTBEAT_TIMEOUT: float = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "60"))
+    # Per-DID inbox (/wba/inbox): queue bound, number of inboxes kept (least recently used ones with no
+    # listener and nothing unread are evicted), inboxes one sender may create that their owners have not
+    # opened yet, SSE keepalive/retry and maximum long-poll wait
+    INBOX_MAX_MESSAGES: int = int(os.getenv("INBOX_MAX_MESSAGES", "1000"))
+    INBOX_MAX_INBOXES: int = int(os.getenv("INBOX_MAX_INBOXES", "10000"))
+    INBOX_MAX_PER_SENDER: int = int(os.getenv("INBOX_MAX_PER_SENDER", "100"))
+    INBOX_KEEPALIVE: float = float(os.getenv("INBOX_KEEPALIVE", "15"))
+    INBOX_RETRY_MS: int = int(os.getenv("INBOX_RETRY_MS", "3000"))
+    INBOX_POLL_TIMEOUT: float = float(os.getenv("INBOX_POLL_TIMEOUT", "30"))
+    # Client transport for chat messages: "http" (one request per message) or "ws" (shared channel)
+    CHAT_TRANSPORT: str = os.getenv("CHAT_TRANSPORT", "http")
+
+    # Responder run mode: "thread" runs uvicorn in a daemon thread, "process" in a supervised child process
+    RESPONDER_MODE: str = os.getenv("RESPONDER_MODE", "thread")
+    RESPONDER_MAX_RESTARTS: int = int(os.getenv("RESPONDER_MAX_RESTARTS", "5"))
+    # Number of responder worker processes; more than 1 binds every worker to the same port with SO_REUSEPORT
+    RESPONDER_WORKERS: int = int(os.getenv("RESPONDER_WORKERS", "1"))
+    RESPONDER_REUSE_PORT: bool = os.getenv("RESPONDER_REUSE_PORT", "false").lower() == "true"
+    # Also listen on this Unix domain socket path; RESPONDER_TCP=false serves the socket only
+    # (PORT is then only the logical port used in DIDs and URLs). Not supported with several workers.
+    RESPONDER_UDS: str = os.getenv("RESPONDER_UDS", "")
+    RESPONDER_TCP: bool = os.getenv("RESPONDER_TCP", "true").lower() == "true"
+    # Unix domain socket for the MCP SSE server instead of TCP port 8080
+    MCP_SSE_UDS: str = os.getenv("MCP_SSE_UDS", "")
+
+    # Auth state shared by all responder workers (nonces, DID document cache)
+    AUTH_STATE_DB_PATH: str = os.getenv("AUTH_STATE_DB_PATH", "data/anp_auth.db")
+    DID_CACHE_TTL: int = int(os.getenv("DID_CACHE_TTL", "300"))
+    # Expired entries are kept this long so they can be revalidated with If-None-Match instead of refetched
+    DID_CACHE_STALE_TTL: int = int(os.getenv("DID_CACHE_STALE_TTL", "86400"))
+    NONCE_REPLAY_CHECK: bool = os.getenv("NONCE_REPLAY_CHECK", "true").lower() == "true"
+
+    # Chat history settings
+    HISTORY_ENABLED: bool = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+    HISTORY_DB_PATH: str = os.getenv("HISTORY_DB_PATH", "data/anp_history.db")
+    HISTORY_BATCH_SIZE: int = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+    HISTORY_FLUSH_INTERVAL: float = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+    HISTORY_QUEUE_SIZE: int = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+    # Comma-separated DIDs allowed to query every DID's history; other callers only see their own records
+    HISTORY_ADMIN_DIDS: str = os.getenv("HISTORY_ADMIN_DIDS", "")
+
+    # Shared state settings (visible to every MCP/ANP process on the host)
+    STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "data/anp_state.db")
+    STATE_MAX_EVENTS: int = int(os.getenv("STATE_MAX_EVENTS", "200"))
+
     # WBA settings
     @property
     def WBA_SERVER_DOMAINS(self) -> List[str]:
@@ -56,3 +179,22 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+
+
+def get_settings(request=None) -> Settings:
+    """
+    Get the settings that apply to a request.
+
+    Responder instances hosted in one process carry their own settings object
+    in the request state (or on the app state); everything else uses the
+    global settings.
+
+    Args:
+        request: Optional FastAPI/Starlette request
+
+    Returns:
+        Settings: Per-instance settings if present, otherwise the global settings
+    """
+    if request is None:
+        return settings
+    return getattr(request.state, "settings", None) or getattr(request.app.state, "settings", None) or settings
@@ -0,0 +1,18 @@
+"""
+基准测试示例，生成的身份和数据库都写到临时目录
+"""
+import os
+import tempfile
+
+# 在导入 core.config 之前设置，子进程（多进程应答端）通过环境变量继承同一目录
+# 已显式设置的环境变量优先
+_SANDBOX = tempfile.mkdtemp(prefix="anp_examples_")
+for _name, _path in (
+    ("DID_DOCUMENTS_PATH", "did_keys"),
+    ("DID_STORE_DB_PATH", "anp_did_store.db"),
+    ("DID_VERSION_DB_PATH", "anp_did_versions.db"),
+    ("AUTH_STATE_DB_PATH", "anp_auth.db"),
+    ("HISTORY_DB_PATH", "anp_history.db"),
+    ("STATE_DB_PATH", "anp_state.db"),
+):
+    os.environ.setdefault(_name, os.path.join(_SANDBOX, _path))
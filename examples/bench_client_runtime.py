@@ -0,0 +1,83 @@
+"""
+客户端运行时开销测试
+
+对比两种发送方式的单条消息耗时（本地响应端，携带JWT的GET /wba/test）：
+  - per-message: 旧方式，每条消息新建线程和事件循环，aiohttp会话随之新建和关闭
+  - runtime:     常驻客户端运行时，submit到同一个事件循环，复用连接池
+
+用法:
+    python -m examples.bench_client_runtime --messages 300
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import threading
+import time
+
+from core.config import settings
+from anp_core.auth.did_auth import send_request_with_token
+from anp_core.auth.token_auth import create_access_token
+from anp_core.client.runtime import client_runtime
+from anp_core.server.server import ANP_resp_start, ANP_resp_stop
+
+
+def _per_message(url, token):
+    """旧方式：新线程 + 新事件循环"""
+    result = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            result["status"] = loop.run_until_complete(send_request_with_token(url, token))[0]
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join()
+    return result.get("status")
+
+
+def _runtime(url, token):
+    return client_runtime.run(send_request_with_token(url, token))[0]
+
+
+def _measure(send, url, token, messages):
+    latencies = []
+    failures = 0
+    for _ in range(messages):
+        began = time.perf_counter()
+        failures += send(url, token) != 200
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    return statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-message client overhead")
+    parser.add_argument("--port", type=int, default=9875)
+    parser.add_argument("--messages", type=int, default=300)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if not ANP_resp_start(port=args.port, mode="thread"):
+        raise RuntimeError("响应端启动失败")
+    try:
+        url = f"http://{settings.HOST}:{args.port}/wba/test"
+        token = create_access_token({"sub": "did:wba:localhost%3A9875:wba:user:bench"})
+        # 预热
+        _per_message(url, token)
+        _runtime(url, token)
+        for name, send in (("per-message", _per_message), ("runtime", _runtime)):
+            mean_ms, p99_ms, failures = _measure(send, url, token, args.messages)
+            print(f"{name:>12}: mean {mean_ms:6.2f} ms  p99 {p99_ms:6.2f} ms  failures {failures}")
+        print(f"runtime stats: {client_runtime.stats()}")
+    finally:
+        ANP_resp_stop()
+        client_runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+首个应答延迟测试
+
+对比没有令牌时拿到第一个业务应答所需的时间（本地响应端，业务请求为 GET /wba/test，避免依赖LLM）：
+  - three-rtt:     旧流程，DID签名请求 /wba/test 握手 -> 用令牌再请求 /wba/test 验证 -> 发送业务请求
+  - one-round-trip: 令牌管理器直接以DID签名发送业务请求，令牌从 Authorization 响应头取得并缓存
+
+用法:
+    python -m examples.bench_handshake --iterations 200
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from core.config import settings
+from anp_core.auth.did_auth import send_authenticated_request, send_request_with_token
+from anp_core.client.identity_registry import identity_registry
+from anp_core.client.runtime import client_runtime
+from anp_core.client.token_manager import TokenManager
+from anp_core.server.server import ANP_resp_start, ANP_resp_stop
+
+
+async def _three_rtt(unique_id, url):
+    identity = await identity_registry.get(unique_id)
+    status, _, token = await send_authenticated_request(url, identity.auth_header, force_new=True)
+    if status != 200 or not token:
+        return status
+    status, _ = await send_request_with_token(url, token, did=identity.did)
+    if status != 200:
+        return status
+    status, _ = await send_request_with_token(url, token, did=identity.did)
+    return status
+
+
+async def _one_round_trip(manager, unique_id, url):
+    manager.invalidate(unique_id)
+    status, _ = await manager.request(unique_id, url)
+    return status
+
+
+async def _measure(send, iterations):
+    latencies = []
+    failures = 0
+    for _ in range(iterations):
+        began = time.perf_counter()
+        failures += await send() != 200
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    return statistics.mean(latencies) * 1000, latencies[len(latencies) // 2] * 1000, failures
+
+
+async def _run(args, url):
+    manager = TokenManager(one_round_trip=True)
+    await identity_registry.get(args.unique_id)
+    flows = (
+        ("three-rtt", lambda: _three_rtt(args.unique_id, url)),
+        ("one-round-trip", lambda: _one_round_trip(manager, args.unique_id, url)),
+    )
+    for name, send in flows:
+        await send()  # 预热
+        mean_ms, p50_ms, failures = await _measure(send, args.iterations)
+        print(f"{name:>14}: mean {mean_ms:6.2f} ms  p50 {p50_ms:6.2f} ms  failures {failures}")
+    print(f"token manager stats: { {k: v for k, v in manager.stats().items() if k != 'tokens'} }")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latency to the first answer without a cached token")
+    parser.add_argument("--port", type=int, default=9876)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--unique-id", default="bench-handshake")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # 基准身份的DID指向本次启动的响应端端口，响应端不修改全局settings
+    settings.PORT = args.port
+
+    if not ANP_resp_start(port=args.port, mode="thread"):
+        raise RuntimeError("响应端启动失败")
+    try:
+        client_runtime.run(_run(args, f"http://{settings.HOST}:{args.port}/wba/test"))
+    finally:
+        ANP_resp_stop()
+        client_runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+身份加载与签名开销测试
+
+对比每次生成DID WBA认证头的两种方式（不发网络请求，只测本地开销）：
+  - per-auth: 旧方式，每次调用 generate_or_load_did 并用文件路径新建 DIDWbaAuthHeader，签名时读取私钥PEM
+  - registry: 身份注册表中常驻的DID文档、私钥对象和认证头助手
+
+用法:
+    python -m examples.bench_identity_registry --iterations 500
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from pathlib import Path
+
+from core.config import settings
+from anp_core.auth.did_auth import generate_or_load_did, DIDWbaAuthHeader
+from anp_core.client.identity_registry import identity_registry
+
+URL = "http://localhost:9870/wba/test"
+
+
+async def _per_auth(unique_id):
+    _, _, user_dir = await generate_or_load_did(unique_id)
+    auth_client = DIDWbaAuthHeader(
+        did_document_path=str(Path(user_dir) / settings.DID_DOCUMENT_FILENAME),
+        private_key_path=str(Path(user_dir) / settings.PRIVATE_KEY_FILENAME)
+    )
+    return auth_client.get_auth_header(URL)
+
+
+async def _registry(unique_id):
+    identity = await identity_registry.get(unique_id)
+    return identity.auth_header.get_auth_header(URL, force_new=True)
+
+
+async def _measure(make_header, unique_id, iterations):
+    latencies = []
+    for _ in range(iterations):
+        began = time.perf_counter()
+        await make_header(unique_id)
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    return statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+async def main(args):
+    # 预热：确保身份文件已存在
+    await generate_or_load_did(args.unique_id)
+    for name, make_header in (("per-auth", _per_auth), ("registry", _registry)):
+        mean_ms, p99_ms = await _measure(make_header, args.unique_id, args.iterations)
+        print(f"{name:>9}: mean {mean_ms:6.3f} ms  p99 {p99_ms:6.3f} ms")
+
+    # 并发首次加载同一个新身份只会加载一次
+    fresh_id = f"{args.unique_id}-{int(time.time())}"
+    await asyncio.gather(*[identity_registry.get(fresh_id) for _ in range(20)])
+    print(f"registry stats: {identity_registry.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark identity loading and auth header signing")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--unique-id", default="bench-identity")
+    logging.disable(logging.INFO)
+    asyncio.run(main(parser.parse_args()))
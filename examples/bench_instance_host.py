@@ -0,0 +1,60 @@
+"""
+多实例宿主开销测试
+
+在一个事件循环中添加N个响应端实例（--ports 个端口，其余实例按Host头虚拟主机分发），
+统计每个实例的内存增量、线程数，并向每个实例发送一次请求确认可用。
+
+用法:
+    python -m examples.bench_instance_host --instances 200 --ports 4
+"""
+import argparse
+import logging
+import threading
+import time
+import tracemalloc
+
+import httpx
+
+from anp_core.server.instance_host import responder_host
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-instance cost of the multi-instance responder host")
+    parser.add_argument("--instances", type=int, default=200)
+    parser.add_argument("--ports", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=9890)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # 先启动宿主循环，使基线包含线程和事件循环本身
+    ports = [args.base_port + i for i in range(args.ports)]
+    responder_host.add_instance("base", ports[0])
+    threads_before = threading.active_count()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    began = time.perf_counter()
+    for i in range(args.instances):
+        responder_host.add_instance(f"agent{i}", ports[i % len(ports)], server_name=f"agent{i}.local")
+    elapsed = time.perf_counter() - began
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    failures = 0
+    with httpx.Client() as client:
+        for i in range(args.instances):
+            port = ports[i % len(ports)]
+            response = client.get(f"http://localhost:{port}/", headers={"Host": f"agent{i}.local"})
+            failures += response.status_code != 200
+
+    print(f"instances={args.instances} ports={args.ports}")
+    print(f"threads: {threads_before} -> {threading.active_count()}")
+    print(f"memory per instance: {allocated / args.instances / 1024:.1f} KiB (includes newly opened ports)")
+    print(f"add latency: {elapsed / args.instances * 1000:.2f} ms/instance")
+    print(f"request failures: {failures}")
+    responder_host.stop()
+
+
+if __name__ == "__main__":
+    main()
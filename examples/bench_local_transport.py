@@ -0,0 +1,81 @@
+"""
+本机TCP与进程内ASGI分派的每请求开销对比
+
+响应端以线程模式运行在本进程中，同一身份向它发送N条已认证的轻量请求（GET /wba/test）：
+  - tcp:   经本机TCP的HTTP请求（LOCAL_ASGI_TRANSPORT=false 时的行为）
+  - local: 识别为本进程响应端，直接分派给FastAPI应用
+两种方式都携带Bearer令牌，服务端每次都经过认证中间件校验；另外各测一次DID签名握手。
+
+用法:
+    python -m examples.bench_local_transport --requests 1000 --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from core.config import settings
+from anp_core.client.local_transport import local_transport
+from anp_core.client.runtime import client_runtime
+from anp_core.client.token_manager import token_manager
+from anp_core.server.server import ANP_resp_start, ANP_resp_stop
+
+
+async def _run_flow(url, identity, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            status, _ = await token_manager.request(identity, url)
+            failures += status != 200
+
+    began = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - began
+    return elapsed / requests * 1000, requests / elapsed, failures
+
+
+async def _handshake_ms(url, identity, rounds):
+    began = time.perf_counter()
+    for _ in range(rounds):
+        token_manager.invalidate(identity)
+        await token_manager.request(identity, url)
+    return (time.perf_counter() - began) / rounds * 1000
+
+
+async def _run(args, url):
+    for name, enabled in (("tcp", False), ("local", True)):
+        local_transport.enabled = enabled
+        handshake = await _handshake_ms(url, args.unique_id, 20)
+        print(f"{name:>5} handshake: {handshake:6.3f} ms")
+        for concurrency in (1, args.concurrency):
+            await _run_flow(url, args.unique_id, 20, concurrency)  # 预热
+            per_req_ms, rate, failures = await _run_flow(url, args.unique_id, args.requests, concurrency)
+            print(f"{name:>5} c={concurrency:<3}: {per_req_ms:6.3f} ms/req  {rate:8.1f} req/s  failures {failures}")
+    print(f"local transport stats: {local_transport.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loopback TCP with in-process ASGI dispatch")
+    parser.add_argument("--port", type=int, default=9878)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--unique-id", default="bench-local")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # 基准身份的DID指向本次启动的响应端端口，响应端不修改全局settings
+    settings.PORT = args.port
+
+    if not ANP_resp_start(port=args.port, mode="thread"):
+        raise RuntimeError("响应端启动失败")
+    try:
+        client_runtime.run(_run(args, f"http://{settings.HOST}:{args.port}/wba/test"))
+    finally:
+        ANP_resp_stop()
+        client_runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
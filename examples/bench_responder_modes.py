@@ -0,0 +1,98 @@
+"""
+响应端运行模式基准测试
+
+对比 thread / process 两种模式下 /wba/test 的吞吐和延迟。
+--load-threads 在父进程中启动纯CPU线程，模拟MCP传输、聊天循环和加解密对GIL的占用。
+
+用法:
+    python -m examples.bench_responder_modes --requests 2000 --concurrency 32 --load-threads 2
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import threading
+import time
+
+import httpx
+
+from core.config import settings
+from anp_core.auth.token_auth import create_access_token
+from anp_core.server.server import ANP_resp_start, ANP_resp_stop
+
+
+def _cpu_load(stop_event: threading.Event):
+    """持续占用GIL的纯Python计算"""
+    while not stop_event.is_set():
+        sum(i * i for i in range(10000))
+
+
+async def _run_requests(url: str, token: str, total: int, concurrency: int):
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async def one():
+            async with semaphore:
+                began = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                latencies.append(time.perf_counter() - began)
+                response.raise_for_status()
+
+        # 预热连接池
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        latencies.clear()
+
+        began = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - began
+    return elapsed, latencies
+
+
+def bench(mode: str, port: int, total: int, concurrency: int, load_threads: int):
+    if not ANP_resp_start(port=port, mode=mode):
+        raise RuntimeError(f"{mode} 模式启动失败")
+
+    stop_event = threading.Event()
+    workers = [threading.Thread(target=_cpu_load, args=(stop_event,), daemon=True) for _ in range(load_threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        token = create_access_token({"sub": "did:wba:localhost%3A9527:wba:user:bench"})
+        url = f"http://{settings.HOST}:{port}/wba/test"
+        elapsed, latencies = asyncio.run(_run_requests(url, token, total, concurrency))
+    finally:
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+        ANP_resp_stop()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark responder thread vs process mode")
+    parser.add_argument("--port", type=int, default=9871)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--load-threads", type=int, default=0)
+    parser.add_argument("--modes", default="thread,process")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(f"requests={args.requests} concurrency={args.concurrency} load_threads={args.load_threads}")
+    for mode in args.modes.split(","):
+        result = bench(mode, args.port, args.requests, args.concurrency, args.load_threads)
+        print(f"{result['mode']:>8}: {result['rps']:8.1f} req/s  p50 {result['p50_ms']:6.1f} ms  p99 {result['p99_ms']:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+多worker响应端扩展性基准测试
+
+分别以 1..N 个worker（SO_REUSEPORT共享端口）启动响应端，测量两条鉴权路径的吞吐：
+  - did:  每个请求携带新签名的DID WBA请求头（时间戳+签名校验+nonce防重放+签发JWT）
+  - bearer: 每个请求携带已签发的JWT
+请求头在计时前生成，压测客户端分布在 --clients 个进程中，避免客户端成为瓶颈。
+
+用法:
+    python -m examples.bench_responder_workers --max-workers 4 --requests 2000 --clients 2
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import statistics
+import time
+
+import httpx
+
+from core.config import settings
+
+
+def _client_main(url, headers_list, concurrency, start_at, queue):
+    """压测客户端进程：到达start_at后按并发发送请求，返回延迟列表"""
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    async def run():
+        latencies = []
+        failures = 0
+        semaphore = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+            async def one(headers):
+                nonlocal failures
+                async with semaphore:
+                    began = time.perf_counter()
+                    response = await client.get(url, headers=headers)
+                    latencies.append(time.perf_counter() - began)
+                    if response.status_code != 200:
+                        failures += 1
+
+            await asyncio.sleep(max(0.0, start_at - time.time()))
+            began = time.perf_counter()
+            await asyncio.gather(*(one(headers) for headers in headers_list))
+            return time.perf_counter() - began, latencies, failures
+
+    queue.put(asyncio.run(run()))
+
+
+def _run_clients(url, headers_list, clients, concurrency):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    start_at = time.time() + 2.0
+    chunks = [headers_list[i::clients] for i in range(clients)]
+    procs = [ctx.Process(target=_client_main, args=(url, chunk, concurrency, start_at, queue)) for chunk in chunks]
+    for proc in procs:
+        proc.start()
+    results = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    elapsed = max(result[0] for result in results)
+    latencies = sorted(lat for result in results for lat in result[1])
+    failures = sum(result[2] for result in results)
+    return {
+        "rps": len(headers_list) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "failures": failures
+    }
+
+
+def _usable_cpus() -> int:
+    """本进程可用的CPU数（受CPU亲和性限制时小于cpu_count）"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark responder scaling across worker processes")
+    parser.add_argument("--port", type=int, default=9873)
+    parser.add_argument("--max-workers", type=int, default=_usable_cpus())
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrency per client process")
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--unique-id", default="bench_workers")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    from agent_connect.authentication import DIDWbaAuthHeader
+    from anp_core.auth.did_auth import generate_or_load_did
+    from anp_core.auth.token_auth import create_access_token
+    from anp_core.server.server import ANP_resp_start, ANP_resp_stop
+
+    settings.PORT = args.port
+    did_document, _, did_dir = asyncio.run(generate_or_load_did(args.unique_id))
+    auth_client = DIDWbaAuthHeader(
+        did_document_path=f"{did_dir}/{settings.DID_DOCUMENT_FILENAME}",
+        private_key_path=f"{did_dir}/{settings.PRIVATE_KEY_FILENAME}"
+    )
+    url = f"http://{settings.HOST}:{args.port}/wba/test"
+    token = create_access_token({"sub": did_document["id"]})
+
+    cpus = _usable_cpus()
+    print(f"cpus={cpus} requests={args.requests} clients={args.clients} concurrency={args.concurrency}")
+    if args.max_workers + args.clients > cpus:
+        # worker和压测客户端争用CPU时，吞吐随worker数的变化不代表多核扩展
+        print(f"warning: {args.max_workers} workers + {args.clients} clients > {cpus} cpus, "
+              f"results above workers={max(cpus - args.clients, 1)} do not measure multi-core scaling")
+    for workers in range(1, args.max_workers + 1):
+        if not ANP_resp_start(port=args.port, workers=workers, mode="process"):
+            raise RuntimeError(f"{workers} worker启动失败")
+        try:
+            # 每个请求使用新的nonce，否则会被防重放检查拒绝
+            did_headers = [auth_client.get_auth_header(url, force_new=True) for _ in range(args.requests)]
+            bearer_headers = [{"Authorization": f"Bearer {token}"}] * args.requests
+            for path, headers_list in (("did", did_headers), ("bearer", bearer_headers)):
+                result = _run_clients(url, headers_list, args.clients, args.concurrency)
+                print(f"workers={workers} {path:>6}: {result['rps']:8.1f} req/s  "
+                      f"p50 {result['p50_ms']:6.1f} ms  p99 {result['p99_ms']:6.1f} ms  failures {result['failures']}")
+        finally:
+            ANP_resp_stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+WebSocket通道与逐请求HTTP的每消息开销对比
+
+本地响应端上，同一身份对同一目标发送N条已认证的轻量请求：
+  - http: 每条消息一个HTTP请求，携带Bearer令牌，服务端每次重新校验JWT（GET /wba/test）
+  - ws:   一个已认证的 /wba/ws 连接，按关联id多路复用（方法 test）
+
+用法:
+    python -m examples.bench_ws_channel --messages 1000 --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from core.config import settings
+from anp_core.client.client import get_agent_channel
+from anp_core.client.runtime import client_runtime
+from anp_core.client.token_manager import token_manager
+from anp_core.server.server import ANP_resp_start, ANP_resp_stop
+
+
+async def _run_flow(send, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            status, _ = await send()
+            failures += status != 200
+
+    began = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(messages)))
+    elapsed = time.perf_counter() - began
+    return elapsed / messages * 1000, messages / elapsed, failures
+
+
+async def _run(args, base_url):
+    channel = await get_agent_channel(args.unique_id, base_url)
+    flows = (
+        ("http", lambda: token_manager.request(args.unique_id, f"{base_url}/wba/test")),
+        ("ws", lambda: channel.request("test")),
+    )
+    for concurrency in (1, args.concurrency):
+        for name, send in flows:
+            await _run_flow(send, 20, concurrency)  # 预热
+            per_msg_ms, rate, failures = await _run_flow(send, args.messages, concurrency)
+            print(f"{name:>4} c={concurrency:<3}: {per_msg_ms:6.3f} ms/msg  {rate:8.1f} msg/s  failures {failures}")
+    print(f"channel stats: {channel.stats()}")
+    await channel.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-message overhead of HTTP and the WebSocket channel")
+    parser.add_argument("--port", type=int, default=9877)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--unique-id", default="bench-ws")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # 基准身份的DID指向本次启动的响应端端口，响应端不修改全局settings
+    settings.PORT = args.port
+
+    if not ANP_resp_start(port=args.port, mode="thread"):
+        raise RuntimeError("响应端启动失败")
+    try:
+        client_runtime.run(_run(args, f"http://{settings.HOST}:{args.port}"))
+    finally:
+        ANP_resp_stop()
+        client_runtime.stop()
+
+
+if __name__ == "__main__":
+    main()